@@ -120,15 +120,12 @@ class K2Chatbot {
         // Show typing indicator
         this.showTypingIndicator();
 
-        // Simulate API call delay
-        await this.simulateTyping();
-
-        // Hide typing indicator
-        this.hideTypingIndicator();
-
-        // Generate bot response
-        const botResponse = this.generateBotResponse(text);
-        this.addMessage(botResponse, 'bot');
+        // Stream the answer from the backend (phases update the indicator, tokens render live)
+        this.isTyping = true;
+        this.handleInputChange();
+        await this.streamFromAPI(text);
+        this.isTyping = false;
+        this.handleInputChange();
 
         // Focus back to input
         this.messageInput.focus();
@@ -267,6 +264,98 @@ class K2Chatbot {
         alert('Settings panel coming soon! This will allow you to customize your chat experience.');
     }
 
+    // Stream a message to /api/chat as server-sent events
+    async streamFromAPI(message) {
+        let messageDiv = null;
+        let historyEntry = null;
+        let answer = '';
+
+        const showAnswer = (text) => {
+            this.hideTypingIndicator();
+            if (!messageDiv) {
+                messageDiv = this.addMessage(text, 'bot');
+                historyEntry = this.messageHistory[this.messageHistory.length - 1];
+            } else {
+                this.updateMessage(messageDiv, text);
+                historyEntry.text = text;
+            }
+        };
+
+        try {
+            const response = await fetch('/api/chat', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream'
+                },
+                body: JSON.stringify({
+                    message: message,
+                    stream: true,
+                    continuation_token: this.continuationToken || null
+                })
+            });
+
+            if (response.status === 429) {
+                const retryAfter = response.headers.get('Retry-After') || 'a few';
+                showAnswer(`The assistant is busy right now. Please try again in ${retryAfter} seconds.`);
+                return;
+            }
+            if (!response.ok || !response.body) {
+                throw new Error('Network response was not ok');
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+
+                    let eventName = 'message';
+                    let data = '';
+                    rawEvent.split('\n').forEach(line => {
+                        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                        if (line.startsWith('data:')) data += line.slice(5).trim();
+                    });
+                    const payload = data ? JSON.parse(data) : {};
+
+                    if (eventName === 'phase' && this.typingIndicator) {
+                        this.typingIndicator.title = payload.message || '';
+                    } else if (eventName === 'token') {
+                        answer += payload.text;
+                        showAnswer(answer);
+                    } else if (eventName === 'result') {
+                        // Clarification questions are answered by the next message
+                        this.continuationToken = payload.status === 'needs_clarification' ? payload.continuation_token : null;
+                        if (!answer || payload.status === 'needs_clarification') {
+                            showAnswer(payload.response || 'Sorry, I couldn\'t process that request.');
+                        }
+                    } else if (eventName === 'error') {
+                        showAnswer(`Sorry, something went wrong: ${payload.message}`);
+                    }
+                }
+            }
+        } catch (error) {
+            console.error('Error streaming message from API:', error);
+            showAnswer('I\'m sorry, I\'m having trouble connecting right now. Please try again later.');
+        }
+    }
+
+    updateMessage(messageDiv, text) {
+        const bubble = messageDiv.querySelector('.message-bubble');
+        const time = bubble.querySelector('.message-time');
+        bubble.innerHTML = this.formatMessage(text);
+        if (time) bubble.appendChild(time);
+        this.scrollToBottom();
+    }
+
     // Method to integrate with your backend API
     async sendToAPI(message) {
         try {
@@ -569,6 +658,8 @@ class K2Chatbot {
         if (sender === 'bot') {
             this.addSparkleEffect(messageDiv);
         }
+
+        return messageDiv;
     }
 
     addSparkleEffect(element) {
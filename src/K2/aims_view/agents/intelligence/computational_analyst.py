@@ -50,7 +50,7 @@ class ComputationalAnalyst:
             You understand business context and provide meaningful interpretations of calculations.""",
             verbose=True,
             allow_delegation=False,
-            llm=self.llm_factory.create_gemini_llm(),
+            llm=self.llm_factory.create_resilient_llm(),
             max_iter=3
         )
     
@@ -24,7 +24,7 @@ class ExecutionSpecialist:
             queries execute safely within security constraints.""",
             verbose=True,
             allow_delegation=False,
-            llm=self.llm_factory.create_gemini_llm(),
+            llm=self.llm_factory.create_resilient_llm(),
             max_iter=2
         )
     
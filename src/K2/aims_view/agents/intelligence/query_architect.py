@@ -11,10 +11,11 @@ class QueryArchitect:
     
     def __init__(self, llm_factory: LLMFactory):
         self.llm_factory = llm_factory
-        self.agent = self._create_agent()
+        self._tier_agents = {}
+        self.agent = self.get_agent("flash")
     
-    def _create_agent(self) -> Agent:
-        """Create query architecture specialist"""
+    def _create_agent(self, tier: str = "flash") -> Agent:
+        """Create query architecture specialist bound to the given model tier"""
         return Agent(
             role="SQL Query Architect",
             goal="Design optimal Oracle SQL queries using complete AIMS database field knowledge and business rules",
@@ -57,10 +58,12 @@ class QueryArchitect:
             - Renewals: DOC_TYPE = 4 AND REN_POL_NO, REN_POL_YEAR not null""",
             verbose=True,
             allow_delegation=False,
-            llm=self.llm_factory.create_gemini_pro_llm(),
+            llm=self.llm_factory.create_tier_llm(tier),
             max_iter=4
         )
     
-    def get_agent(self) -> Agent:
-        """Get the query architect agent"""
-        return self.agent
+    def get_agent(self, tier: str = "flash") -> Agent:
+        """Get the query architect agent for a model tier (Flash by default)"""
+        if tier not in self._tier_agents:
+            self._tier_agents[tier] = self._create_agent(tier)
+        return self._tier_agents[tier]
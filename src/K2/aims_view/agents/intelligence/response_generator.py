@@ -2,6 +2,8 @@
 Response Generator Agent for final response generation
 """
 
+from typing import Iterator
+
 from crewai import Agent
 from src.K2.aims_view.ai.llm_factory import LLMFactory
 
@@ -56,3 +58,22 @@ class ResponseGenerator:
     def get_agent(self) -> Agent:
         """Get the response generator agent"""
         return self.agent
+    
+    @property
+    def model_name(self) -> str:
+        """Model used for streamed responses"""
+        return self.llm_factory.get_completion_settings("gemini_model")["model"]
+    
+    def stream_response(self, task_description: str) -> Iterator[str]:
+        """Stream response tokens for a task directly from the model"""
+        import litellm
+        
+        messages = [
+            {"role": "system", "content": f"You are {self.agent.role}. {self.agent.goal}\n\n{self.agent.backstory}"},
+            {"role": "user", "content": task_description}
+        ]
+        
+        for chunk in litellm.completion(messages=messages, stream=True, **self.llm_factory.get_completion_settings("gemini_model")):
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if token:
+                yield token
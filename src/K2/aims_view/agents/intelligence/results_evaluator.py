@@ -42,7 +42,7 @@ class ResultsEvaluator:
             EFFICIENCY FOCUS: Favor COMPLETE over CONTINUE when results adequately address the question.""",
             verbose=True,
             allow_delegation=False,
-            llm=self.llm_factory.create_gemini_llm(),
+            llm=self.llm_factory.create_resilient_llm(),
             max_iter=2
         )
     
@@ -46,7 +46,7 @@ class SchemaAnalyst:
             - Identify potential performance bottlenecks and optimization opportunities""",
             verbose=True,
             allow_delegation=False,
-            llm=self.llm_factory.create_gemini_llm(),
+            llm=self.llm_factory.create_resilient_llm(),
             max_iter=2
         )
     
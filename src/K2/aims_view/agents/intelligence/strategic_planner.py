@@ -48,7 +48,7 @@ class StrategicPlanner:
             business logic for maximum accuracy.""",
             verbose=True,
             allow_delegation=False,
-            llm=self.llm_factory.create_gemini_llm(),
+            llm=self.llm_factory.create_resilient_llm(),
             max_iter=3
         )
     
@@ -2,34 +2,62 @@
 Main Intelligence Manager - Orchestrates all AI agents for intelligent problem solving
 """
 
-from crewai import Task, Crew, Process
+from dotenv import load_dotenv
+from src.K2.aims_view.ai.crewai_loader import load_crewai
 from src.K2.aims_view.ai.llm_factory import LLMFactory
-from src.K2.aims_view.agents.intelligence.strategic_planner import StrategicPlanner
-from src.K2.aims_view.agents.intelligence.query_architect import QueryArchitect
-from src.K2.aims_view.agents.intelligence.execution_specialist import ExecutionSpecialist
-from src.K2.aims_view.agents.intelligence.computational_analyst import ComputationalAnalyst
-from src.K2.aims_view.agents.intelligence.results_evaluator import ResultsEvaluator
-from src.K2.aims_view.agents.intelligence.response_generator import ResponseGenerator
-from src.K2.aims_view.agents.intelligence.schema_analyst import SchemaAnalyst
-from src.K2.aims_view.agents.specialized.name_detector import NameDetector
-from src.K2.aims_view.agents.specialized.customer_validator import CustomerValidator
-from src.K2.aims_view.agents.specialized.name_matcher import NameMatcher
+from src.K2.aims_view.ai.llm_scheduler import get_llm_scheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from src.K2.aims_view.core.latency_budget import LatencyBudgetPolicy
+from src.K2.aims_view.core.request_context import RequestContext, get_request_context, request_scope
+from src.K2.aims_view.core.refinement import RefinementStore
+from src.K2.aims_view.core.clarification import (
+    ClarificationStore, PendingClarification, CANCEL_ANSWERS,
+    CUSTOMER_IDENTIFIER, CUSTOMER_CHOICE, BROKER_CHOICE, USER_CHOICE
+)
+from src.K2.aims_view.core.step_result import StepResult
 from src.K2.aims_view.core.domain_knowledge import load_aims_domain_knowledge, format_domain_knowledge_for_planning
 from src.K2.aims_view.utils.context_builder import get_comprehensive_aims_knowledge_summary, build_previous_results_context
 from src.K2.aims_view.utils.query_utils import clean_query, build_execution_context, format_results_summary, format_data_sources_summary
-from src.K2.aims_view.database.database import SecureOracleDBUtils
+from src.K2.aims_view.utils.scalar_renderer import render_scalar_answer
+from src.K2.aims_view.utils.memory_store import get_memory_store, DEFAULT_SESSION_ID
+from src.K2.aims_view.utils.memory_entities import format_entities
+from src.K2.aims_view.utils.result_export import ORACLE, get_result_registry, result_source
+from src.K2.aims_view.utils.result_spill import create_spill_manager
+from src.K2.aims_view.database.errors import QueryCancelledError, QueryTimeoutError
+from src.K2.aims_view.database.approximate import APPROXIMATE, DEFAULT, EXACT
+from src.K2.aims_view.database.query_guard import QueryPlanRejected
+import importlib
 import json
 from datetime import datetime
 import os
+import threading
+import time
+
+# API keys and database credentials may come from a .env file
+load_dotenv()
+
+# Agents are built on first use so startup does not import crewai or create LLM clients
+AGENT_CLASSES = {
+    "strategy_planner": ("src.K2.aims_view.agents.intelligence.strategic_planner", "StrategicPlanner"),
+    "schema_analyst": ("src.K2.aims_view.agents.intelligence.schema_analyst", "SchemaAnalyst"),
+    "query_architect": ("src.K2.aims_view.agents.intelligence.query_architect", "QueryArchitect"),
+    "execution_specialist": ("src.K2.aims_view.agents.intelligence.execution_specialist", "ExecutionSpecialist"),
+    "computational_analyst": ("src.K2.aims_view.agents.intelligence.computational_analyst", "ComputationalAnalyst"),
+    "results_evaluator": ("src.K2.aims_view.agents.intelligence.results_evaluator", "ResultsEvaluator"),
+    "response_generator": ("src.K2.aims_view.agents.intelligence.response_generator", "ResponseGenerator"),
+    "name_detector": ("src.K2.aims_view.agents.specialized.name_detector", "NameDetector"),
+    "customer_validator": ("src.K2.aims_view.agents.specialized.customer_validator", "CustomerValidator"),
+    "name_matcher": ("src.K2.aims_view.agents.specialized.name_matcher", "NameMatcher"),
+}
 
 
 class IntelligentSQLManager:
-    """Master Intelligence Manager for Autonomous SQL Query Generation and Problem Solving"""
+    """Master Intelligence Manager for Autonomous SQL Query Generation and Problem Solving
     
-    def __init__(self, config: dict = None):
-        # Initialize database connection
-        self.db_utils = SecureOracleDBUtils()
-        
+    Agents, LLMs and stores are shared; everything a question mutates lives in
+    a RequestContext, so one manager can answer questions from many threads.
+    """
+    
+    def __init__(self, config: dict = None, session_id: str = DEFAULT_SESSION_ID):
         # Load configuration if not provided
         if config is None:
             import json
@@ -38,49 +66,246 @@ class IntelligentSQLManager:
             with open(config_path, "r") as f:
                 config = json.load(f)
         
-        # Initialize LLM factory
+        self.config = config
+        
+        # The database utilities (Oracle driver, pandas) and the agents are created on first use
+        self._db_utils = None
+        self._lazy_lock = threading.RLock()
+        
+        # Initialize LLM factory and the process-wide LLM scheduler
         self.llm_factory = LLMFactory(config)
+        self.llm_scheduler = get_llm_scheduler(config)
         
         # Load AIMS database domain knowledge
         self.domain_knowledge = load_aims_domain_knowledge()
         
-        # Create specialized agent instances
-        self.strategy_planner = StrategicPlanner(self.llm_factory)
-        self.schema_analyst = SchemaAnalyst(self.llm_factory)
-        self.query_architect = QueryArchitect(self.llm_factory)
-        self.execution_specialist = ExecutionSpecialist(self.llm_factory)
-        self.computational_analyst = ComputationalAnalyst(self.llm_factory)
-        self.results_evaluator = ResultsEvaluator(self.llm_factory)
-        self.response_generator = ResponseGenerator(self.llm_factory)
-        
-        # Name detection and customer handling agents
-        self.name_detector = NameDetector(self.llm_factory)
-        self.customer_validator = CustomerValidator(self.llm_factory)
-        self.name_matcher = NameMatcher(self.llm_factory)
+        # Single-row results can be answered without a response generation call
+        self.scalar_answers = config.get("intelligence_manager", {}).get("scalar_answers", {})
         
         # System state and memory
         self.schema_data = {"columns": []}  # Initialize with empty schema
-        self.execution_history = []
-        self.accumulated_results = {}
-        self.current_strategy = None
         self.confidence_threshold = 0.85
         
-        from pathlib import Path
-        # Memory system for conversation context
-        self.memory_file = Path(__file__).parent.parent / "memory" / "conversation_memory.json"
-        self.memory_size = 5
-        self.memory = self._load_memory()
+        # Memory system for conversation context (append-only, per session)
+        self.memory_store = get_memory_store(config)
+        self.default_session_id = session_id
+        
+        # Used when a method runs outside solve_intelligently (e.g. generate_narrative)
+        self._default_context = RequestContext(session_id)
+        
+        # Name identification questions wait here for resume() instead of blocking on input()
+        clarification_config = config.get("intelligence_manager", {}).get("clarification", {})
+        self.clarifications = ClarificationStore(clarification_config.get("ttl_seconds", 900))
+        self.max_clarification_attempts = clarification_config.get("max_attempts", 3)
+        
+        # Executed step queries stay re-readable for paging and export downloads
+        self.result_registry = get_result_registry(config)
+        
+        # Oversized step results move to memory-mapped files for the rest of the request
+        self.result_spiller = create_spill_manager(config)
+        
+        # End-to-end deadline per question; running requests can be cancelled by id
+        self.request_timeout = config.get("intelligence_manager", {}).get("request_timeout_seconds", 120)
+        self._active_requests = {}
+        self._active_lock = threading.Lock()
+        
+        # Soft per-question SLA split across phases; retries and re-plans must fit in what is left
+        self.latency_policy = LatencyBudgetPolicy.from_config(config)
+        
+        # Approximate answers can be re-run exactly in the background and polled by request id
+        self.refinements = RefinementStore()
+    
+    @property
+    def db_utils(self):
+        """SecureOracleDBUtils, created (and the Oracle driver imported) on first use"""
+        if self._db_utils is None:
+            with self._lazy_lock:
+                if self._db_utils is None:
+                    from src.K2.aims_view.database.database import SecureOracleDBUtils
+                    self._db_utils = SecureOracleDBUtils(config=self.config.get("database", {}))
+        return self._db_utils
+    
+    def __getattr__(self, name: str):
+        """Create an agent (see AGENT_CLASSES) the first time it is used"""
+        if name not in AGENT_CLASSES:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        with self._lazy_lock:
+            if name not in self.__dict__:
+                module_name, class_name = AGENT_CLASSES[name]
+                load_crewai()
+                agent_class = getattr(importlib.import_module(module_name), class_name)
+                self.__dict__[name] = agent_class(self.llm_factory)
+        return self.__dict__[name]
     
-    def solve_intelligently(self, user_question: str, max_cycles: int = 5) -> dict:
-        """Master Intelligence Method - Orchestrates complete problem solving with smart retry logic"""
+    def warm_up(self):
+        """Import crewai, the agents and the database module on a background thread
+
+        Nothing is created, so the first question still builds what it uses,
+        but without waiting for the imports.
+        """
+        def run():
+            try:
+                load_crewai()
+                importlib.import_module("src.K2.aims_view.database.database")
+                for module_name, _ in AGENT_CLASSES.values():
+                    importlib.import_module(module_name)
+            except Exception as e:
+                print(f"⚠️  Background warm-up failed (imports will be retried on first use): {e}")
+        threading.Thread(target=run, name="k2-warm-up", daemon=True).start()
+    
+    @property
+    def request_context(self) -> RequestContext:
+        """Context of the question being answered in this thread or task"""
+        return get_request_context() or self._default_context
+    
+    @property
+    def session_id(self) -> str:
+        return self.request_context.session_id
+    
+    @property
+    def execution_history(self) -> list:
+        return self.request_context.execution_history
+    
+    @property
+    def accumulated_results(self) -> dict:
+        return self.request_context.accumulated_results
+    
+    @property
+    def current_strategy(self):
+        return self.request_context.current_strategy
+    
+    @property
+    def token_callback(self):
+        return self.request_context.token_callback
+    
+    def solve_intelligently(self, user_question: str, max_cycles: int = 5, on_token=None, session_id: str = None,
+                            on_event=None, request_id: str = None, timeout: float = None, approximate: bool = False) -> dict:
+        """Master Intelligence Method - Orchestrates complete problem solving with smart retry logic
+        
+        on_token, when given, is called with each response token as it streams.
+        on_event, when given, is called with (event, data) as pipeline phases progress.
+        session_id selects the conversation memory (defaults to the manager's session).
+        request_id lets another thread cancel() the request; timeout overrides request_timeout_seconds.
+        approximate lets eligible aggregate queries read a sample and return estimates with margins.
+        """
+        context = RequestContext(
+            session_id or self.default_session_id, token_callback=on_token, request_id=request_id,
+            event_callback=on_event, timeout=timeout or self.request_timeout, budget=self.latency_policy.new_budget(),
+            approximate=approximate
+        )
+        return self._run_request(context, lambda: self._solve_in_context(user_question, max_cycles))
+    
+    def cancel(self, request_id: str, session_id: str = None) -> bool:
+        """Cancel a running request, interrupting its database call; False if it is not running
+        
+        With session_id, only a request of that session is cancelled.
+        """
+        with self._active_lock:
+            context = self._active_requests.get(request_id)
+        if context is None or (session_id and context.session_id != session_id):
+            return False
+        print(f"🛑 Cancelling request {request_id}")
+        context.cancel()
+        return True
+    
+    def _run_request(self, context: RequestContext, solve) -> dict:
+        """Run solve() inside the request's scope, registered for cancellation"""
+        with self._active_lock:
+            self._active_requests[context.request_id] = context
+        try:
+            with request_scope(context):
+                result = solve()
+        finally:
+            with self._active_lock:
+                self._active_requests.pop(context.request_id, None)
+        result.setdefault('session_id', context.session_id)
+        result.setdefault('request_id', context.request_id)
+        if context.budget.bounded:
+            result.setdefault('latency_budget', context.budget.summary())
+        self._start_refinement(context, result)
+        return result
+    
+    def _start_refinement(self, context: RequestContext, result: dict):
+        """Re-run an approximate answer's estimated steps exactly in the background"""
+        steps = result.get('execution_summary', {}).get('results', {})
+        estimated = {
+            step_key: step.query for step_key, step in steps.items()
+            if isinstance(step, StepResult) and step.approximation
+        }
+        if not estimated:
+            return
+        result['approximate'] = True
+        if not (context.approximate and self.db_utils.approximate.refine_in_background):
+            return
+        print(f"🔬 Refining {len(estimated)} approximate step(s) exactly in the background")
+        self.refinements.start(
+            context.request_id, estimated, lambda sql: self.db_utils._safe_execute_query(sql, accuracy=EXACT),
+            session_id=context.session_id
+        )
+        result['refinement'] = 'pending'
+    
+    def get_refinement(self, request_id: str, session_id: str = None):
+        """Exact results of a refined approximate answer as a dict, or None if there is none (for that session)"""
+        refinement = self.refinements.get(request_id, session_id)
+        return refinement.to_dict() if refinement else None
+    
+    def _query_timeout(self, retry: bool = False) -> float:
+        """Call timeout for the next query: the database default capped by the request deadline
+        
+        The latency budget only shortens retries; a step's first query always gets the
+        configured database timeout (or whatever is left of the request deadline).
+        """
+        remaining = self.request_context.remaining()
+        if remaining is not None and remaining <= 0:
+            raise QueryTimeoutError("The request ran out of time before the query could run.")
+        budget_limit = self.request_context.budget.query_timeout() if retry else None
+        limits = [limit for limit in (self.db_utils.query_timeout, remaining, budget_limit) if limit]
+        return min(limits) if limits else None
+    
+    def resume(self, continuation_token: str, answer: str, on_token=None, on_event=None, request_id: str = None,
+               timeout: float = None, approximate: bool = False, session_id: str = None) -> dict:
+        """Continue a solve that returned needs_clarification, using the user's answer
+        
+        Phase 0 name detection is not repeated; the answer is applied to the
+        saved state and the solve continues from strategic planning. With
+        session_id, only a clarification of that session is resumed.
+        """
+        pending = self.clarifications.pop(continuation_token, session_id)
+        if pending is None:
+            return {
+                'status': 'error',
+                'message': 'This clarification has expired or was already answered - please ask the question again',
+                'cycles_used': 0
+            }
+        
+        context = RequestContext(
+            pending.session_id, token_callback=on_token, request_id=request_id,
+            event_callback=on_event, timeout=timeout or self.request_timeout, budget=self.latency_policy.new_budget(),
+            approximate=approximate
+        )
+        
+        def solve():
+            clean_answer = (answer or "").strip()
+            if clean_answer.lower() in CANCEL_ANSWERS:
+                name_handling_result = {'status': 'cancelled', 'proceed': False}
+            elif not clean_answer:
+                name_handling_result = self._retry_clarification(pending, "Please provide valid identification")
+            else:
+                name_handling_result = self._apply_clarification_answer(pending, clean_answer)
+            return self._solve_in_context(pending.user_question, pending.max_cycles, name_handling_result)
+        
+        return self._run_request(context, solve)
+    
+    def _solve_in_context(self, user_question: str, max_cycles: int, name_handling_result: dict = None) -> dict:
+        """Solve one question using the active request context
+        
+        name_handling_result is given when resuming after a clarification.
+        """
         
         print(f"🚀 MASTER INTELLIGENCE MANAGER ACTIVATED")
         print(f"🎯 Question: {user_question}")
         print("="*80)
         
-        self.execution_history = []
-        self.accumulated_results = {}
-        
         try:
             # Initialize enhanced_question with original question
             enhanced_question = user_question
@@ -92,8 +317,12 @@ class IntelligentSQLManager:
                 print("💭 MEMORY: Found relevant context from previous conversations")
                 enhanced_question = memory_context + enhanced_question
             
-            # PHASE 0: Name Detection and Customer Identification
-            name_handling_result = self.detect_and_handle_names(user_question)
+            # PHASE 0: Name Detection and Customer Identification (already done when resuming)
+            if name_handling_result is None:
+                name_handling_result = self.detect_and_handle_names(user_question)
+            
+            if name_handling_result.get('status') == 'needs_clarification':
+                return self._request_clarification(name_handling_result, user_question, max_cycles)
             
             if not name_handling_result.get('proceed', True):
                 # Name detection found issues that prevent proceeding
@@ -112,7 +341,7 @@ class IntelligentSQLManager:
                 else:
                     return {
                         'status': 'error',
-                        'message': f"Name handling failed: {name_handling_result.get('status')}",
+                        'message': name_handling_result.get('message') or f"Name handling failed: {name_handling_result.get('status')}",
                         'cycles_used': 0
                     }
             
@@ -211,6 +440,15 @@ class IntelligentSQLManager:
                 
                 cycle = 1
                 while cycle < max_cycles:
+                    if self.request_context.expired():
+                        print(f"⏱️  Request deadline reached - skipping remaining fallback cycles")
+                        break
+                    if not self.request_context.budget.allows_cycle():
+                        self.request_context.budget.skip(f"fallback cycle {cycle + 1}")
+                        print(f"⏱️  Latency budget: no time for another re-plan - answering with what we have")
+                        return self._format_partial_response(
+                            enhanced_question, cycle, summary='Partial solution - latency budget exhausted'
+                        )
                     cycle += 1
                     print(f"\n🔄 FALLBACK CYCLE {cycle}/{max_cycles}")
                     print("-" * 60)
@@ -246,6 +484,8 @@ class IntelligentSQLManager:
                             )
                             return final_response
                         
+                    except QueryCancelledError:
+                        raise
                     except Exception as e:
                         print(f"❌ Error in fallback cycle {cycle}: {str(e)}")
                         if cycle == max_cycles:
@@ -271,6 +511,13 @@ class IntelligentSQLManager:
             }
             return self._generate_final_response(mock_evaluation, mock_execution, enhanced_question, 1)
             
+        except QueryCancelledError:
+            print(f"🛑 Request {self.request_context.request_id} was cancelled")
+            return {
+                'status': 'cancelled',
+                'message': 'The request was cancelled',
+                'cycles_used': 0
+            }
         except Exception as e:
             print(f"❌ Critical error in solve_intelligently: {str(e)}")
             # Generate final error response
@@ -284,140 +531,51 @@ class IntelligentSQLManager:
             question_to_use = enhanced_question if 'enhanced_question' in locals() else user_question
             return self._generate_final_response(mock_evaluation, mock_execution, question_to_use, 1)
     
-    # ======= MEMORY SYSTEM METHODS =======
+    def _kickoff_crew(self, agent, task, priority: str = PRIORITY_BACKGROUND) -> str:
+        """Run a single-agent crew through the LLM scheduler and return its output"""
+        crewai = load_crewai()
+        crew = crewai.Crew(agents=[agent], tasks=[task], process=crewai.Process.sequential, memory=False)
+        model = getattr(agent.llm, 'model', None) or 'default'
+        # Rough prompt size for the token-per-minute bucket (~4 characters per token)
+        estimated_tokens = len(task.description) // 4
+        result = self.llm_scheduler.run(
+            model, crew.kickoff, priority=priority, estimated_tokens=estimated_tokens
+        )
+        return str(result)
     
-    def _load_memory(self) -> dict:
-        """Load conversation memory from JSON file"""
-        try:
-            if self.memory_file.exists():
-                with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    memory = json.load(f)
-                    return memory
-            else:
-                # Create initial memory structure
-                return {
-                    "memory_size": self.memory_size,
-                    "current_session_id": f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-                    "conversations": [],
-                    "last_updated": datetime.now().isoformat()
-                }
-        except Exception as e:
-            print(f"⚠️ Error loading memory: {str(e)}")
-            return {
-                "memory_size": self.memory_size,
-                "current_session_id": f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-                "conversations": [],
-                "last_updated": datetime.now().isoformat()
-            }
+    def get_llm_scheduler_metrics(self) -> dict:
+        """Get LLM queue depth, wait times and rate-limit retry counts"""
+        return self.llm_scheduler.get_metrics()
+    
+    # ======= MEMORY SYSTEM METHODS =======
     
     def _save_memory(self, question: str, answer: str, metadata: dict = None):
-        """Save Q&A pair to memory"""
+        """Append Q&A pair to this session's memory"""
         try:
-            # Create memory directory if it doesn't exist
-            self.memory_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            conversation_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "session_id": self.memory.get("current_session_id", f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"),
-                "question": question,
-                "answer": answer,
-                "metadata": metadata or {}
-            }
-            
-            # Add to conversations list
-            self.memory["conversations"].append(conversation_entry)
-            
-            # Keep only last N conversations
-            if len(self.memory["conversations"]) > self.memory_size:
-                self.memory["conversations"] = self.memory["conversations"][-self.memory_size:]
-            
-            self.memory["last_updated"] = datetime.now().isoformat()
-            
-            # Save to file
-            with open(self.memory_file, 'w', encoding='utf-8') as f:
-                json.dump(self.memory, f, indent=2, ensure_ascii=False)
-                
+            self.memory_store.append(self.session_id, question, answer, metadata)
         except Exception as e:
             print(f"⚠️ Error saving memory: {str(e)}")
     
     def _get_memory_context(self, current_question: str) -> str:
         """Extract relevant context from memory for current question"""
-        if not self.memory.get("conversations"):
-            return ""
+        # Entities were indexed when each turn was saved - this is a set lookup
+        related = self.memory_store.find_related(self.session_id, current_question, limit=3)
         
         context_parts = []
-        
-        # Check if current question relates to previous conversations
-        for conv in reversed(self.memory["conversations"][-3:]):  # Check last 3 conversations
-            prev_question = conv.get("question", "")
-            prev_answer = conv.get("answer", "")
-            
-            # Simple context detection - check for common elements
-            if self._is_related_question(current_question, prev_question):
-                # Extract key information from previous conversation
-                extracted_info = self._extract_key_info(prev_question, prev_answer)
-                if extracted_info:
-                    context_parts.append(f"Previous context: {extracted_info}")
+        for conv in related:
+            extracted_info = format_entities(conv.get("entities", []))
+            if extracted_info:
+                context_parts.append(f"Previous context: {extracted_info}")
         
         if context_parts:
             return "MEMORY CONTEXT FROM RECENT CONVERSATIONS:\n" + "\n".join(context_parts) + "\n\n"
         
         return ""
     
-    def _is_related_question(self, current: str, previous: str) -> bool:
-        """Check if current question relates to previous one"""
-        # Simple keyword-based matching for customer IDs, names, etc.
-        import re
-        
-        # Extract potential customer IDs (11 digit numbers)
-        current_ids = re.findall(r'\b\d{11}\b', current)
-        previous_ids = re.findall(r'\b\d{11}\b', previous)
-        
-        # Check for common customer IDs
-        if current_ids and previous_ids and any(id in previous_ids for id in current_ids):
-            return True
-        
-        # Extract potential customer names (words starting with capital letters)
-        current_names = re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b', current)
-        previous_names = re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b', previous)
-        
-        # Check for common names
-        if current_names and previous_names and any(name in previous_names for name in current_names):
-            return True
-        
-        # Check for common keywords indicating continuation
-        continuation_keywords = ['same', 'this', 'that', 'also', 'additionally', 'more', 'further']
-        if any(keyword in current.lower() for keyword in continuation_keywords):
-            return True
-        
-        return False
-    
-    def _extract_key_info(self, question: str, answer: str) -> str:
-        """Extract key information from previous Q&A"""
-        import re
-        
-        key_info = []
-        
-        # Extract customer IDs
-        customer_ids = re.findall(r'\b\d{11}\b', question + " " + answer)
-        if customer_ids:
-            key_info.append(f"Customer ID(s): {', '.join(set(customer_ids))}")
-        
-        # Extract customer names from context
-        names = re.findall(r'customer[^,\.]*?([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)', question + " " + answer, re.IGNORECASE)
-        if names:
-            key_info.append(f"Customer name(s): {', '.join(set(names))}")
-        
-        # Extract key numbers/counts from answer
-        numbers = re.findall(r'(\d+)\s+(?:policies|claims|transactions|customers)', answer, re.IGNORECASE)
-        if numbers:
-            key_info.append(f"Previous results: {', '.join(numbers)} items found")
-        
-        return " | ".join(key_info) if key_info else ""
-    
     def detect_and_handle_names(self, user_question: str) -> dict:
         """Detect names in user questions and handle customer/company identification"""
         print("🔍 PHASE 0: Name Detection and Customer Identification")
+        self.request_context.emit('phase', phase='name_detection', message='Detecting names in the question')
         print("-" * 60)
         
         # Step 1: Detect if the question contains names and classify them
@@ -450,7 +608,7 @@ class IntelligentSQLManager:
     def _detect_names_in_question(self, user_question: str) -> dict:
         """Use AI agent to detect and classify names in the question"""
         
-        detection_task = Task(
+        detection_task = load_crewai().Task(
             description=f"""Analyze this user question to detect and classify any names mentioned:
 
 USER QUESTION: "{user_question}"
@@ -474,8 +632,7 @@ Return your analysis in JSON format:
             agent=self.name_detector.get_agent()
         )
         
-        crew = Crew(agents=[self.name_detector.get_agent()], tasks=[detection_task], process=Process.sequential, memory=False)
-        result = str(crew.kickoff())
+        result = self._kickoff_crew(self.name_detector.get_agent(), detection_task)
         
         try:
             import json as js
@@ -518,30 +675,103 @@ Return your analysis in JSON format:
         customer_name = name_result['name']
         print(f"👤 Processing customer: {customer_name}")
         
-        # Ask user for customer ID or phone number
-        print(f"\n💡 To find customer '{customer_name}', I need additional information:")
-        print("1️⃣  Customer ID (11 digits - numbers or characters)")
-        print("2️⃣  Phone number (8-11 digits)")
-        print("3️⃣  Company ID (if this is a company customer)")
-        
-        while True:
-            user_input = input("🔍 Please provide Customer ID, Phone number, or Company ID: ").strip()
-            
-            if not user_input:
-                print("❌ Please provide valid identification")
-                continue
-            
+        # Ask user for customer ID or phone number (answered through resume())
+        print(f"\n💡 To find customer '{customer_name}', I need additional information")
+        return self._clarification_needed(
+            CUSTOMER_IDENTIFIER,
+            customer_name,
+            f"To find customer '{customer_name}', please provide their Customer ID (11 digits), "
+            f"Phone number (8-11 digits), or Company ID."
+        )
+    
+    def _clarification_needed(self, kind: str, name: str, prompt: str, candidates: list = None,
+                              search_type: str = None, attempts: int = 0, message: str = None) -> dict:
+        """Name handling result asking the user for one more answer"""
+        return {
+            'status': 'needs_clarification',
+            'proceed': False,
+            'message': message or prompt,
+            'clarification': {
+                'kind': kind,
+                'name': name,
+                'prompt': prompt,
+                'candidates': candidates or [],
+                'search_type': search_type,
+                'attempts': attempts
+            }
+        }
+    
+    def _request_clarification(self, name_handling_result: dict, user_question: str, max_cycles: int) -> dict:
+        """Save the solve state and return a needs_clarification continuation token"""
+        pending = PendingClarification(
+            user_question=user_question,
+            session_id=self.session_id,
+            max_cycles=max_cycles,
+            **name_handling_result['clarification']
+        )
+        self.clarifications.save(pending)
+        print(f"❓ Clarification needed ({pending.kind}) - waiting for the user's answer")
+        return pending.to_response(name_handling_result.get('message'))
+    
+    def _retry_clarification(self, pending: PendingClarification, message: str) -> dict:
+        """Ask the same clarification again, giving up after max attempts"""
+        print(f"❌ {message}")
+        if pending.attempts + 1 >= self.max_clarification_attempts:
+            return {'status': 'invalid', 'message': message, 'proceed': False}
+        return self._clarification_needed(
+            pending.kind, pending.name, pending.prompt, pending.candidates,
+            pending.search_type, pending.attempts + 1, f"{message}. {pending.prompt}"
+        )
+    
+    def _apply_clarification_answer(self, pending: PendingClarification, answer: str) -> dict:
+        """Turn the user's clarification answer into a name handling result"""
+        if pending.kind == CUSTOMER_IDENTIFIER:
             # Validate and process the input
-            validation_result = self._validate_customer_input(user_input, customer_name)
-            
+            validation_result = self._validate_customer_input(answer, pending.name)
             if validation_result['status'] == 'valid':
                 return validation_result
             elif validation_result['status'] == 'multiple_matches':
                 # Handle multiple customers with same phone
-                return self._handle_multiple_customer_matches(validation_result, customer_name, user_question)
-            else:
-                print(f"❌ {validation_result['message']}")
-                continue
+                return self._handle_multiple_customer_matches(validation_result, pending.name, pending.user_question)
+            return self._retry_clarification(pending, validation_result['message'])
+        
+        candidates = pending.candidates
+        if answer.isdigit():
+            choice_num = int(answer)
+            if not 1 <= choice_num <= len(candidates):
+                return self._retry_clarification(pending, f"Please enter a number between 1 and {len(candidates)}")
+            selected = candidates[choice_num - 1]
+        elif pending.kind == CUSTOMER_CHOICE:
+            # User entered text, try intelligent name matching
+            match_result = self._intelligent_name_matching(answer, candidates, pending.name)
+            if match_result['status'] != 'match_found':
+                return self._retry_clarification(pending, match_result['message'])
+            selected = match_result['customer']
+        else:
+            selected = self._match_option_text(answer, candidates)
+            if selected is None:
+                return self._retry_clarification(pending, f"'{answer}' doesn't match any of the provided options")
+        
+        if pending.kind == CUSTOMER_CHOICE:
+            print(f"✅ Selected: {selected.get('DOC_CUST_NAME')}")
+            return {'status': 'valid', 'customer_data': [selected], 'search_type': pending.search_type, 'proceed': True}
+        
+        print(f"✅ Selected: {selected}")
+        if pending.kind == BROKER_CHOICE:
+            return {'status': 'valid', 'broker_name': selected, 'search_type': 'AGENT_NAME', 'proceed': True}
+        return {'status': 'valid', 'user_name': selected, 'search_type': 'USER_NAME', 'proceed': True}
+    
+    @staticmethod
+    def _match_option_text(answer: str, options: list):
+        """Match typed text to one of the offered names (exact first, then partial)"""
+        answer_lower = answer.lower()
+        for option in options:
+            if option.lower() == answer_lower:
+                return option
+        for option in options:
+            if answer_lower in option.lower() or option.lower() in answer_lower:
+                return option
+        return None
     
     def _handle_agent_identification(self, name_result: dict, user_question: str) -> dict:
         """Handle agent/broker identification process"""
@@ -672,6 +902,7 @@ Return your analysis in JSON format:
     def _execute_strategic_planning(self, user_question: str, cycle: int) -> dict:
         """PHASE 1: Strategic Planning and Decision Making"""
         print("📋 PHASE 1: Strategic Planning")
+        self.request_context.emit('phase', phase='planning', message='Planning the query strategy', cycle=cycle)
         
         # Build context from previous cycles
         context = build_execution_context(self.execution_history, self.accumulated_results, cycle)
@@ -682,7 +913,7 @@ Return your analysis in JSON format:
         # Check for memory context
         memory_context = self._get_memory_context(user_question)
         
-        planning_task = Task(
+        planning_task = load_crewai().Task(
             description=f"""As the Strategic Query Planner, analyze this question using comprehensive AIMS database knowledge:
 
 QUESTION: {user_question}
@@ -722,8 +953,8 @@ Respond with JSON format:
             agent=self.strategy_planner.get_agent()
         )
         
-        crew = Crew(agents=[self.strategy_planner.get_agent()], tasks=[planning_task], process=Process.sequential, memory=False)
-        result = str(crew.kickoff())
+        with self.request_context.budget.phase('planning'):
+            result = self._kickoff_crew(self.strategy_planner.get_agent(), planning_task)
         
         try:
             import json as js
@@ -744,10 +975,11 @@ Respond with JSON format:
     def _execute_query_phase(self, strategy_result: dict, user_question: str) -> dict:
         """PHASE 2: Query Architecture & Execution with Multi-step Processing and Smart Retry Logic"""
         print("🔧 PHASE 2: Query Architecture & Execution")
+        self.request_context.emit('phase', phase='query_execution', message='Generating and executing SQL')
         
         executed_queries = []
         results = {}
-        intermediate_data = {}
+        intermediate_data = results
         action = strategy_result.get('action', 'QUERY_DIRECT')
         
         steps = strategy_result.get('steps', [])
@@ -759,8 +991,12 @@ Respond with JSON format:
             if not step_str.lower().startswith('compute') and not step_str.lower().startswith('calculate'):
                 query_steps.append(step_str)
         
+        budget = self.request_context.budget
+        budget_exhausted = False
+        
         for i, step in enumerate(query_steps):
             print(f"   Step {i+1}: {step}")
+            self.request_context.emit('step', step=i + 1, total_steps=len(query_steps), description=step)
             
             # Build context from previous results for data flow
             previous_results_context = build_previous_results_context(intermediate_data)
@@ -774,6 +1010,30 @@ Respond with JSON format:
                 if retry_attempt > 0:
                     print(f"   🔄 Retry attempt {retry_attempt + 1}/{max_query_retries} for Step {i+1}")
                 
+                # Route to Flash by default, escalate to Pro on complexity or after a failure
+                model_tier = self.llm_factory.select_query_tier(step, len(query_steps), retry_attempt)
+                
+                # The question's first query always runs; later attempts must fit the latency budget
+                budget_tier = budget.attempt_tier(model_tier, required=(i == 0 and retry_attempt == 0))
+                if budget_tier is None:
+                    skipped = f"step {i+1} attempt {retry_attempt + 1}"
+                    budget.skip(skipped)
+                    print(f"   ⏱️  Latency budget: skipping {skipped} ({budget.remaining():.1f}s left)")
+                    self.request_context.emit('budget_skip', step=i + 1, attempt=retry_attempt + 1)
+                    if last_error is not None:
+                        step_key = f"step_{i+1}"
+                        results[step_key] = StepResult.failed(
+                            step_key, sql_query, last_error,
+                            step_description=step,
+                            retry_attempts=retry_attempt
+                        )
+                    budget_exhausted = True
+                    break
+                if budget_tier != model_tier:
+                    print(f"   ⏱️  Latency budget: downgrading {model_tier} -> {budget_tier}")
+                    model_tier = budget_tier
+                print(f"   🧭 Query architect tier: {model_tier}")
+                
                 # Design the query with domain knowledge and previous results
                 domain_context = format_domain_knowledge_for_planning(self.domain_knowledge, user_question)
                 
@@ -782,7 +1042,7 @@ Respond with JSON format:
                 if retry_attempt > 0 and last_error:
                     retry_context = f"\nPREVIOUS ATTEMPT FAILED: {last_error}\nPlease generate an alternative query to avoid this error.\n"
                 
-                query_task = Task(
+                query_task = load_crewai().Task(
                     description=f"""As the SQL Query Architect, design an optimal query using comprehensive AIMS database knowledge:
 
 USER QUESTION: {user_question}
@@ -808,56 +1068,121 @@ Design a precise Oracle SQL query that:
 
 Generate ONLY the SQL query without trailing semicolon, no explanations.""",
                     expected_output="Complete Oracle SQL query",
-                    agent=self.query_architect.get_agent()
+                    agent=self.query_architect.get_agent(model_tier)
                 )
                 
-                crew = Crew(agents=[self.query_architect.get_agent()], tasks=[query_task], process=Process.sequential, memory=False)
-                sql_query = str(crew.kickoff()).strip()
+                generation_start = time.time()
+                with budget.phase('sql_generation', model_tier):
+                    sql_query = self._kickoff_crew(self.query_architect.get_agent(model_tier), query_task).strip()
+                generation_latency = time.time() - generation_start
                 
                 # Clean and execute the query
                 sql_query = clean_query(sql_query)
                 
                 try:
                     print(f"   🎯 Executing: {sql_query[:100]}...")
-                    query_results = self.db_utils._safe_execute_query(sql_query)
+                    with budget.phase('execution'):
+                        query_results = self.db_utils._safe_execute_query(
+                            sql_query, timeout=self._query_timeout(retry=retry_attempt > 0), cancel_scope=self.request_context,
+                            accuracy=APPROXIMATE if self.request_context.approximate else DEFAULT
+                        )
+                    self.llm_factory.record_tier_result(model_tier, generation_latency, True)
                     executed_queries.append(sql_query)
                     
                     # Store results for next steps to use
                     step_key = f"step_{i+1}"
-                    step_result = {
-                        'query': sql_query,
-                        'results': query_results.to_dict('records') if hasattr(query_results, 'to_dict') else query_results,
-                        'row_count': len(query_results),
-                        'step_description': step,
-                        'retry_attempts': retry_attempt + 1
-                    }
+                    # The result handle owns the spill file, so downloads can read it after the request ends
+                    spilled = self.result_spiller.spill(query_results, step_key)
+                    if spilled is not None:
+                        print(f"   💾 Step {i+1} spilled to disk: {spilled.row_count} rows ({spilled.nbytes / 1048576:.1f} MB)")
+                        step_rows = spilled
+                    else:
+                        step_rows = query_results.to_dict('records') if hasattr(query_results, 'to_dict') else query_results
+                    # Re-running the SQL on Oracle would not reproduce cube, replica or sampled answers
+                    source = result_source(query_results)
+                    handle = self.result_registry.register(
+                        sql_query, list(getattr(query_results, 'columns', [])), len(query_results), self.session_id, step_key,
+                        spill=spilled, source=source,
+                        snapshot=query_results if source != ORACLE and spilled is None else None,
+                        row_limit=getattr(query_results, 'attrs', {}).get('row_limit')
+                    )
+                    step_result = StepResult.from_dataframe(
+                        step_key, sql_query, query_results, step_rows,
+                        step_description=step,
+                        retry_attempts=retry_attempt + 1,
+                        result_handle=handle.handle_id
+                    )
+                    # intermediate_data is the same dict as results, so each step is stored once
                     results[step_key] = step_result
-                    intermediate_data[step_key] = step_result
                     
                     print(f"   ✅ Step {i+1} completed: {len(query_results)} rows (attempt {retry_attempt + 1})")
+                    if step_result.row_limit:
+                        print(f"   ⚠️  Step {i+1} was limited to {step_result.row_limit} rows by the cost gate")
+                    if step_result.approximation:
+                        print(f"   📐 Step {i+1} contains estimates: {step_result.approximation}")
+                    self.request_context.emit('step_completed', step=i + 1, row_count=len(query_results))
                     step_successful = True
                     break  # Success - exit retry loop
                     
+                except QueryCancelledError:
+                    raise
+                
+                except QueryTimeoutError as e:
+                    # Timed out on the server - ask for a cheaper query rather than repeating this one
+                    self.llm_factory.record_tier_result(model_tier, generation_latency, False)
+                    last_error = (f"QUERY TIMED OUT: {e} Write a cheaper query - narrower WHERE filters, "
+                                  f"aggregation in SQL, no unnecessary joins or DISTINCT over large row sets.")
+                    print(f"   ⏱️  Step {i+1} attempt {retry_attempt + 1} timed out: {e}")
+                    self.request_context.emit('step_timeout', step=i + 1, reason=str(e))
+                    
+                    if retry_attempt == max_query_retries - 1 or self.request_context.expired():
+                        step_key = f"step_{i+1}"
+                        results[step_key] = StepResult.failed(
+                            step_key, sql_query, last_error,
+                            step_description=step,
+                            retry_attempts=retry_attempt + 1
+                        )
+                        print(f"   ❌ Step {i+1} failed after {retry_attempt + 1} attempts")
+                        break
+                    
+                except QueryPlanRejected as e:
+                    # Rejected before execution - the plan estimate tells the architect what to fix
+                    self.llm_factory.record_tier_result(model_tier, generation_latency, False)
+                    last_error = f"QUERY PLAN REJECTED BEFORE EXECUTION: {e}"
+                    print(f"   🛑 Step {i+1} attempt {retry_attempt + 1} stopped by cost gate: {e}")
+                    self.request_context.emit('step_rejected', step=i + 1, reason=str(e))
+                    
+                    if retry_attempt == max_query_retries - 1:
+                        step_key = f"step_{i+1}"
+                        results[step_key] = StepResult.failed(
+                            step_key, sql_query, last_error,
+                            step_description=step,
+                            retry_attempts=retry_attempt + 1
+                        )
+                        print(f"   ❌ Step {i+1} failed after {max_query_retries} attempts")
+                    
                 except Exception as e:
+                    self.llm_factory.record_tier_result(model_tier, generation_latency, False)
                     last_error = str(e)
                     print(f"   ❌ Step {i+1} attempt {retry_attempt + 1} failed: {last_error}")
                     
                     if retry_attempt == max_query_retries - 1:
                         # Final attempt failed - store error result
-                        step_result = {
-                            'query': sql_query,
-                            'error': last_error,
-                            'row_count': 0,
-                            'step_description': step,
-                            'retry_attempts': retry_attempt + 1
-                        }
-                        results[f"step_{i+1}"] = step_result
-                        intermediate_data[f"step_{i+1}"] = step_result
+                        step_key = f"step_{i+1}"
+                        results[step_key] = StepResult.failed(
+                            step_key, sql_query, last_error,
+                            step_description=step,
+                            retry_attempts=retry_attempt + 1
+                        )
                         print(f"   ❌ Step {i+1} failed after {max_query_retries} attempts")
             
             # If any step fails completely, we might want to continue with partial results
             if not step_successful:
                 print(f"   ⚠️  Step {i+1} could not be executed successfully after {max_query_retries} attempts")
+            
+            if budget_exhausted:
+                print(f"   ⏱️  Latency budget exhausted - skipping remaining query steps")
+                break
         
         # Execute computational analysis if needed
         if action == 'QUERY_COMPUTE':
@@ -879,7 +1204,6 @@ Generate ONLY the SQL query without trailing semicolon, no explanations.""",
                 
                 comp_key = f"computation_{i+1}"
                 results[comp_key] = comp_result
-                intermediate_data[comp_key] = comp_result
                 
                 print(f"   ✅ Computational Step {i+1} completed")
         
@@ -897,7 +1221,7 @@ Generate ONLY the SQL query without trailing semicolon, no explanations.""",
         # Format data sources for the computational analyst
         data_summary = format_data_sources_summary(intermediate_data)
         
-        computation_task = Task(
+        computation_task = load_crewai().Task(
             description=f"""As the Computational Analyst, perform complex calculations using the provided data:
 
 USER QUESTION: {user_question}
@@ -919,8 +1243,7 @@ Return your analysis in JSON format with:
             agent=self.computational_analyst.get_agent()
         )
         
-        crew = Crew(agents=[self.computational_analyst.get_agent()], tasks=[computation_task], process=Process.sequential, memory=False)
-        result = str(crew.kickoff())
+        result = self._kickoff_crew(self.computational_analyst.get_agent(), computation_task)
         
         try:
             import json as js
@@ -937,13 +1260,13 @@ Return your analysis in JSON format with:
         
         return comp_result
     
-    def _generate_final_response(self, evaluation_result: dict, execution_result: dict, user_question: str, cycle: int) -> dict:
-        """Generate final user-friendly response using the response generator agent"""
+    def _build_response_task(self, evaluation_result: dict, execution_result: dict, user_question: str) -> "Task":
+        """Build the response generation task from the execution results"""
         
         # Format execution results for response generation
         results_summary = format_results_summary(execution_result)
         
-        response_task = Task(
+        return load_crewai().Task(
             description=f"""As the Final Response Generator, create a comprehensive, user-friendly response:
 
 USER QUESTION: {user_question}
@@ -964,23 +1287,38 @@ Generate a professional, informative response that fully addresses the user's qu
             expected_output="Comprehensive, user-friendly final response",
             agent=self.response_generator.get_agent()
         )
+    
+    def stream_final_response(self, evaluation_result: dict, execution_result: dict, user_question: str, cycle: int):
+        """Stream the final response token by token
         
-        crew = Crew(agents=[self.response_generator.get_agent()], tasks=[response_task], process=Process.sequential, memory=False)
-        
-        print("\n📋 GENERATING COMPREHENSIVE RESPONSE:")
-        print("="*70)
-        print("🔄 Streaming response generation in progress...")
-        print("📡 Real-time AI response streaming enabled...")
-        print("⏳ Please wait while the response is generated live...")
-        print()
+        Yields text tokens as the model produces them. The assembled text is
+        saved to memory once the stream ends, and the final response dict is
+        the generator's return value (``StopIteration.value``).
+        """
+        response_task = self._build_response_task(evaluation_result, execution_result, user_question)
         
-        # Execute with streaming enabled
-        result = crew.kickoff()
-        final_response_text = str(result)
+        tokens = []
+        try:
+            for token in self.llm_scheduler.stream(
+                self.response_generator.model_name,
+                lambda: self.response_generator.stream_response(response_task.description),
+                priority=PRIORITY_INTERACTIVE,
+                estimated_tokens=len(response_task.description) // 4
+            ):
+                tokens.append(token)
+                yield token
+        except Exception as e:
+            if tokens:
+                raise
+            # Streaming unavailable - fall back to a blocking crew run, emitted as one chunk
+            print(f"⚠️ Token streaming unavailable ({str(e)}), generating response without streaming")
+            full_text = self._kickoff_crew(
+                self.response_generator.get_agent(), response_task, priority=PRIORITY_INTERACTIVE
+            )
+            tokens.append(full_text)
+            yield full_text
         
-        print()
-        print("="*70)
-        print("✅ Response generation completed!")
+        final_response_text = "".join(tokens)
         
         # Save to memory
         metadata = {
@@ -1002,6 +1340,86 @@ Generate a professional, informative response that fully addresses the user's qu
             'evaluation_summary': evaluation_result
         }
     
+    def _render_scalar_response(self, evaluation_result: dict, execution_result: dict, user_question: str, cycle: int) -> dict:
+        """Answer single-row scalar results locally, or return None to use the LLM"""
+        if not self.scalar_answers.get("enabled", True) or evaluation_result.get('status') != 'COMPLETE':
+            return None
+        
+        start_time = time.time()
+        response_text = render_scalar_answer(
+            execution_result, self.domain_knowledge, self.scalar_answers.get("currency", "QAR")
+        )
+        if response_text is None:
+            return None
+        
+        print(f"⚡ SCALAR RESULT: Rendered answer locally in {(time.time() - start_time) * 1000:.1f}ms")
+        if self.token_callback:
+            self.token_callback(response_text)
+        
+        metadata = {
+            'confidence': evaluation_result.get('confidence', 0.95),
+            'cycles_used': cycle,
+            'status': 'success',
+            'query_type': execution_result.get('action', 'QUERY'),
+            'queries_executed': len(execution_result.get('executed_queries', [])),
+            'renderer': 'scalar'
+        }
+        self._save_memory(user_question, response_text, metadata)
+        
+        return {
+            'status': 'success',
+            'question': user_question,
+            'response': response_text,
+            'renderer': 'scalar',
+            'narrative_available': True,
+            'cycles_used': cycle,
+            'confidence': evaluation_result.get('confidence', 0.95),
+            'execution_summary': execution_result,
+            'evaluation_summary': evaluation_result
+        }
+    
+    def generate_narrative(self, final_response: dict, on_token=None) -> dict:
+        """Generate the full LLM narrative for a response that was rendered locally"""
+        context = RequestContext(final_response.get('session_id', self.default_session_id), token_callback=on_token)
+        with request_scope(context):
+            return self._generate_final_response(
+                final_response['evaluation_summary'],
+                final_response['execution_summary'],
+                final_response['question'],
+                final_response.get('cycles_used', 1),
+                allow_scalar=False
+            )
+    
+    def _generate_final_response(self, evaluation_result: dict, execution_result: dict, user_question: str, cycle: int, allow_scalar: bool = True) -> dict:
+        """Generate final user-friendly response, forwarding streamed tokens to the caller"""
+        
+        print("\n📋 GENERATING COMPREHENSIVE RESPONSE:")
+        self.request_context.emit('phase', phase='response', message='Writing the answer')
+        print("="*70)
+        
+        # Scalar results skip the LLM unless the narrative is always wanted
+        if allow_scalar and not self.scalar_answers.get("llm_narrative", False):
+            scalar_response = self._render_scalar_response(evaluation_result, execution_result, user_question, cycle)
+            if scalar_response is not None:
+                return scalar_response
+        
+        stream = self.stream_final_response(evaluation_result, execution_result, user_question, cycle)
+        with self.request_context.budget.phase('response'):
+            while True:
+                try:
+                    token = next(stream)
+                except StopIteration as stop:
+                    final_response = stop.value
+                    break
+                if self.token_callback:
+                    self.token_callback(token)
+        
+        print()
+        print("="*70)
+        print("✅ Response generation completed!")
+        
+        return final_response
+    
     def _handle_user_clarification(self, clarification_request: dict, user_question: str) -> dict:
         """Handle user clarification requests intelligently"""
         print(f"\n🤔 Intelligent Clarification Needed")
@@ -1014,9 +1432,10 @@ Generate a professional, informative response that fully addresses the user's qu
             'question': user_question
         }
     
-    def _format_partial_response(self, user_question: str, max_cycles: int) -> dict:
-        """Format partial response when max cycles reached"""
-        print(f"\n⚠️  Reached maximum cycles ({max_cycles})")
+    def _format_partial_response(self, user_question: str, max_cycles: int,
+                                 summary: str = 'Partial solution - reached maximum cycles') -> dict:
+        """Format partial response when max cycles reached or the latency budget ran out"""
+        print(f"\n⚠️  Stopped after {max_cycles} cycles: {summary}")
         print(f"📋 Generating best available response...")
         
         # Create a mock execution result from accumulated results
@@ -1030,7 +1449,7 @@ Generate a professional, informative response that fully addresses the user's qu
         mock_evaluation = {
             'status': 'PARTIAL',
             'confidence': 0.7,
-            'summary': 'Partial solution - reached maximum cycles'
+            'summary': summary
         }
         
         # Generate final response even for partial results
@@ -1059,7 +1478,7 @@ Generate a professional, informative response that fully addresses the user's qu
     def _extract_branch_context(self, user_question: str) -> list:
         """Extract branch names mentioned in the user question using AI"""
         try:
-            branch_extraction_task = Task(
+            branch_extraction_task = load_crewai().Task(
                 description=f"""Extract branch names mentioned in this user question:
 
 USER QUESTION: "{user_question}"
@@ -1094,8 +1513,7 @@ Examples:
                 agent=self.name_detector.get_agent()  # Reuse existing agent
             )
             
-            crew = Crew(agents=[self.name_detector.get_agent()], tasks=[branch_extraction_task], process=Process.sequential, memory=False)
-            result = str(crew.kickoff()).strip()
+            result = self._kickoff_crew(self.name_detector.get_agent(), branch_extraction_task).strip()
             
             try:
                 import json as js
@@ -1150,7 +1568,7 @@ Examples:
     def _validate_customer_input(self, user_input: str, customer_name: str) -> dict:
         """Validate customer ID or phone number input"""
         
-        validation_task = Task(
+        validation_task = load_crewai().Task(
             description=f"""Validate this customer input and determine the search strategy:
 
 USER INPUT: "{user_input}"
@@ -1172,8 +1590,7 @@ Return JSON format:
             agent=self.customer_validator.get_agent()
         )
         
-        crew = Crew(agents=[self.customer_validator.get_agent()], tasks=[validation_task], process=Process.sequential, memory=False)
-        result = str(crew.kickoff())
+        result = self._kickoff_crew(self.customer_validator.get_agent(), validation_task)
         
         try:
             import json as js
@@ -1264,7 +1681,9 @@ Return JSON format:
             else:
                 return {'status': 'error', 'message': 'Unknown search type'}
             
-            results = self.db_utils._safe_execute_query(query)
+            results = self.db_utils._safe_execute_query(
+                query, timeout=self._query_timeout(), cancel_scope=self.request_context
+            )
             
             if len(results) == 0:
                 return {'status': 'not_found'}
@@ -1280,65 +1699,25 @@ Return JSON format:
         """Handle cases where multiple customers match the phone number"""
         customers = validation_result['customers']
         
-        print(f"\n📋 Found {len(customers)} customers with the provided information:")
-        print("🔍 Please select the correct customer:")
-        
-        for i, customer in enumerate(customers, 1):
-            cust_name = customer.get('DOC_CUST_NAME', 'Unknown')
-            cust_id = customer.get('CUST_ID_NO', 'N/A')
-            comp_id = customer.get('COMP_EID_NO', 'N/A')
-            
-            if cust_id and cust_id != 'N/A':
-                print(f"{i}. {cust_name} (Individual - ID: {cust_id})")
-            elif comp_id and comp_id != 'N/A':
-                print(f"{i}. {cust_name} (Company - ID: {comp_id})")
-            else:
-                print(f"{i}. {cust_name}")
-        
-        while True:
-            try:
-                choice = input(f"\n🎯 Select customer (1-{len(customers)}) or type the customer name: ").strip()
-                
-                # Check if user entered a number
-                try:
-                    choice_num = int(choice)
-                    if 1 <= choice_num <= len(customers):
-                        selected_customer = customers[choice_num - 1]
-                        print(f"✅ Selected: {selected_customer['DOC_CUST_NAME']}")
-                        return {
-                            'status': 'valid',
-                            'customer_data': [selected_customer],
-                            'search_type': validation_result['search_type'],
-                            'proceed': True
-                        }
-                    else:
-                        print(f"❌ Please enter a number between 1 and {len(customers)}")
-                        continue
-                except ValueError:
-                    # User entered text, try intelligent name matching
-                    match_result = self._intelligent_name_matching(choice, customers, customer_name)
-                    if match_result['status'] == 'match_found':
-                        return {
-                            'status': 'valid',
-                            'customer_data': [match_result['customer']],
-                            'search_type': validation_result['search_type'],
-                            'proceed': True
-                        }
-                    else:
-                        print(f"❌ {match_result['message']}")
-                        continue
-                        
-            except KeyboardInterrupt:
-                return {'status': 'cancelled', 'proceed': False}
+        print(f"\n📋 Found {len(customers)} customers with the provided information")
+        return self._clarification_needed(
+            CUSTOMER_CHOICE,
+            customer_name,
+            f"Found {len(customers)} customers with the provided information. "
+            f"Select customer (1-{len(customers)}) or type the customer name.",
+            candidates=customers,
+            search_type=validation_result['search_type']
+        )
     
     def _evaluate_and_decide(self, execution_result: dict, user_question: str, cycle: int) -> dict:
         """PHASE 3: Results Evaluation & Decision Making"""
         print("🤔 PHASE 3: Results Evaluation & Decision Making")
+        self.request_context.emit('phase', phase='evaluation', message='Evaluating the results', cycle=cycle)
         
         # Add domain knowledge context for evaluation
         domain_context = format_domain_knowledge_for_planning(self.domain_knowledge, user_question)
         
-        evaluation_task = Task(
+        evaluation_task = load_crewai().Task(
             description=f"""As the Results Intelligence Evaluator, analyze these query results using comprehensive AIMS business knowledge:
 
 USER QUESTION: {user_question}
@@ -1382,8 +1761,7 @@ Respond with JSON:
             agent=self.results_evaluator.get_agent()
         )
         
-        crew = Crew(agents=[self.results_evaluator.get_agent()], tasks=[evaluation_task], process=Process.sequential, memory=False)
-        result = str(crew.kickoff())
+        result = self._kickoff_crew(self.results_evaluator.get_agent(), evaluation_task)
         
         try:
             import json as js
@@ -1396,7 +1774,7 @@ Respond with JSON:
         
         customer_names = [customer.get('DOC_CUST_NAME', '') for customer in available_customers]
         
-        matching_task = Task(
+        matching_task = load_crewai().Task(
             description=f"""Match user input with available customer names using intelligent comparison:
 
 USER INPUT: "{user_input}"
@@ -1422,8 +1800,7 @@ Return JSON format:
             agent=self.name_matcher.get_agent()
         )
         
-        crew = Crew(agents=[self.name_matcher.get_agent()], tasks=[matching_task], process=Process.sequential, memory=False)
-        result = str(crew.kickoff())
+        result = self._kickoff_crew(self.name_matcher.get_agent(), matching_task)
         
         try:
             import json as js
@@ -1498,7 +1875,9 @@ Return JSON format:
                 query += f" AND ({branch_filter_clause})"
                 print(f"🔍 Filtering brokers by branch(es): {', '.join(branch_filter)}")
             
-            results = self.db_utils._safe_execute_query(query)
+            results = self.db_utils._safe_execute_query(
+                query, timeout=self._query_timeout(), cancel_scope=self.request_context
+            )
             
             if len(results) > 0:
                 broker_names = results['DOC_AGENT_NAME'].dropna().unique().tolist()
@@ -1520,7 +1899,7 @@ Return JSON format:
         # Limit the list to prevent overwhelming the AI
         broker_sample = available_brokers  # Top 100 brokers for matching
         
-        matching_task = Task(
+        matching_task = load_crewai().Task(
             description=f"""Match user input with available broker names using intelligent comparison:
 
 USER INPUT: "{user_input}"
@@ -1557,8 +1936,7 @@ For exact_match, also include: "broker": "exact_broker_name"
             agent=self.name_matcher.get_agent()
         )
         
-        crew = Crew(agents=[self.name_matcher.get_agent()], tasks=[matching_task], process=Process.sequential, memory=False)
-        result = str(crew.kickoff())
+        result = self._kickoff_crew(self.name_matcher.get_agent(), matching_task)
         
         try:
             import json as js
@@ -1600,79 +1978,25 @@ For exact_match, also include: "broker": "exact_broker_name"
     def _handle_multiple_broker_matches(self, match_result: dict, agent_name: str, user_question: str) -> dict:
         """Handle cases where multiple brokers match the input name"""
         brokers = match_result.get('matches', [])
-        confidence_scores = match_result.get('confidence_scores', [])
         
-        print(f"\n📋 Found {len(brokers)} broker matches for '{agent_name}':")
-        print("🔍 Please select the correct broker:")
-        
-        # Display matches with confidence scores if available
-        for i, broker in enumerate(brokers, 1):
-            confidence = confidence_scores[i-1] if i-1 < len(confidence_scores) else 0.0
-            if confidence > 0:
-                print(f"{i}. {broker} (confidence: {confidence:.2f})")
-            else:
-                print(f"{i}. {broker}")
-        
-        while True:
-            try:
-                choice = input(f"\n🎯 Select broker (1-{len(brokers)}) or type the broker name: ").strip()
-                
-                # Check if user entered a number
-                try:
-                    choice_num = int(choice)
-                    if 1 <= choice_num <= len(brokers):
-                        selected_broker = brokers[choice_num - 1]
-                        print(f"✅ Selected: {selected_broker}")
-                        return {
-                            'status': 'valid',
-                            'broker_name': selected_broker,
-                            'search_type': 'AGENT_NAME',
-                            'proceed': True
-                        }
-                    else:
-                        print(f"❌ Please enter a number between 1 and {len(brokers)}")
-                        continue
-                except ValueError:
-                    # User entered text, try to match with the provided options
-                    user_choice_lower = choice.lower()
-                    matched_broker = None
-                    
-                    # Try exact match first
-                    for broker in brokers:
-                        if broker.lower() == user_choice_lower:
-                            matched_broker = broker
-                            break
-                    
-                    # Try partial match if exact match fails
-                    if not matched_broker:
-                        for broker in brokers:
-                            if user_choice_lower in broker.lower() or broker.lower() in user_choice_lower:
-                                matched_broker = broker
-                                break
-                    
-                    if matched_broker:
-                        print(f"✅ Selected: {matched_broker}")
-                        return {
-                            'status': 'valid',
-                            'broker_name': matched_broker,
-                            'search_type': 'AGENT_NAME',
-                            'proceed': True
-                        }
-                    else:
-                        print(f"❌ '{choice}' doesn't match any of the provided options. Please try again.")
-                        continue
-                        
-            except KeyboardInterrupt:
-                return {'status': 'cancelled', 'proceed': False}
+        print(f"\n📋 Found {len(brokers)} broker matches for '{agent_name}'")
+        return self._clarification_needed(
+            BROKER_CHOICE,
+            agent_name,
+            f"Found {len(brokers)} broker matches for '{agent_name}'. "
+            f"Select broker (1-{len(brokers)}) or type the broker name.",
+            candidates=brokers
+        )
     
     def _evaluate_and_decide(self, execution_result: dict, user_question: str, cycle: int) -> dict:
         """PHASE 3: Results Evaluation & Decision Making"""
         print("🤔 PHASE 3: Results Evaluation & Decision Making")
+        self.request_context.emit('phase', phase='evaluation', message='Evaluating the results', cycle=cycle)
         
         # Add domain knowledge context for evaluation
         domain_context = format_domain_knowledge_for_planning(self.domain_knowledge, user_question)
         
-        evaluation_task = Task(
+        evaluation_task = load_crewai().Task(
             description=f"""As the Results Intelligence Evaluator, analyze these query results using comprehensive AIMS business knowledge:
 
 USER QUESTION: {user_question}
@@ -1716,8 +2040,7 @@ Respond with JSON:
             agent=self.results_evaluator.get_agent()
         )
         
-        crew = Crew(agents=[self.results_evaluator.get_agent()], tasks=[evaluation_task], process=Process.sequential, memory=False)
-        result = str(crew.kickoff())
+        result = self._kickoff_crew(self.results_evaluator.get_agent(), evaluation_task)
         
         try:
             import json as js
@@ -1745,7 +2068,9 @@ Respond with JSON:
                 query += f" AND ({branch_filter_clause})"
                 print(f"🔍 Filtering users by branch(es): {', '.join(branch_filter)}")
             
-            results = self.db_utils._safe_execute_query(query)
+            results = self.db_utils._safe_execute_query(
+                query, timeout=self._query_timeout(), cancel_scope=self.request_context
+            )
             
             if len(results) > 0:
                 user_names = results['DOC_USER_NAME'].dropna().unique().tolist()
@@ -1765,7 +2090,7 @@ Respond with JSON:
         """Use AI agent to intelligently match user input with available system user names"""
         
         # Use the same name matcher agent for users
-        matching_task = Task(
+        matching_task = load_crewai().Task(
             description=f"""Match user input with available system user names using intelligent comparison:
 
 USER INPUT: "{user_input}"
@@ -1802,8 +2127,7 @@ For exact_match, also include: "user": "exact_user_name"
             agent=self.name_matcher.get_agent()
         )
         
-        crew = Crew(agents=[self.name_matcher.get_agent()], tasks=[matching_task], process=Process.sequential, memory=False)
-        result = str(crew.kickoff())
+        result = self._kickoff_crew(self.name_matcher.get_agent(), matching_task)
         
         try:
             import json as js
@@ -1845,79 +2169,25 @@ For exact_match, also include: "user": "exact_user_name"
     def _handle_multiple_user_matches(self, match_result: dict, user_name: str, user_question: str) -> dict:
         """Handle cases where multiple system users match the input name"""
         users = match_result.get('matches', [])
-        confidence_scores = match_result.get('confidence_scores', [])
         
-        print(f"\n📋 Found {len(users)} system user matches for '{user_name}':")
-        print("🔍 Please select the correct system user:")
-        
-        # Display matches with confidence scores if available
-        for i, user in enumerate(users, 1):
-            confidence = confidence_scores[i-1] if i-1 < len(confidence_scores) else 0.0
-            if confidence > 0:
-                print(f"{i}. {user} (confidence: {confidence:.2f})")
-            else:
-                print(f"{i}. {user}")
-        
-        while True:
-            try:
-                choice = input(f"\n🎯 Select system user (1-{len(users)}) or type the user name: ").strip()
-                
-                # Check if user entered a number
-                try:
-                    choice_num = int(choice)
-                    if 1 <= choice_num <= len(users):
-                        selected_user = users[choice_num - 1]
-                        print(f"✅ Selected: {selected_user}")
-                        return {
-                            'status': 'valid',
-                            'user_name': selected_user,
-                            'search_type': 'USER_NAME',
-                            'proceed': True
-                        }
-                    else:
-                        print(f"❌ Please enter a number between 1 and {len(users)}")
-                        continue
-                except ValueError:
-                    # User entered text, try to match with the provided options
-                    user_choice_lower = choice.lower()
-                    matched_user = None
-                    
-                    # Try exact match first
-                    for user in users:
-                        if user.lower() == user_choice_lower:
-                            matched_user = user
-                            break
-                    
-                    # Try partial match if exact match fails
-                    if not matched_user:
-                        for user in users:
-                            if user_choice_lower in user.lower() or user.lower() in user_choice_lower:
-                                matched_user = user
-                                break
-                    
-                    if matched_user:
-                        print(f"✅ Selected: {matched_user}")
-                        return {
-                            'status': 'valid',
-                            'user_name': matched_user,
-                            'search_type': 'USER_NAME',
-                            'proceed': True
-                        }
-                    else:
-                        print(f"❌ '{choice}' doesn't match any of the provided options. Please try again.")
-                        continue
-                        
-            except KeyboardInterrupt:
-                return {'status': 'cancelled', 'proceed': False}
+        print(f"\n📋 Found {len(users)} system user matches for '{user_name}'")
+        return self._clarification_needed(
+            USER_CHOICE,
+            user_name,
+            f"Found {len(users)} system user matches for '{user_name}'. "
+            f"Select system user (1-{len(users)}) or type the user name.",
+            candidates=users
+        )
     
     def _evaluate_and_decide(self, execution_result: dict, user_question: str, cycle: int) -> dict:
         """PHASE 3: Results Evaluation & Decision Making"""
         print("🤔 PHASE 3: Results Evaluation & Decision Making")
+        self.request_context.emit('phase', phase='evaluation', message='Evaluating the results', cycle=cycle)
         
         # Add domain knowledge context for evaluation
         domain_context = format_domain_knowledge_for_planning(self.domain_knowledge, user_question)
         
-        evaluation_task = Task(
+        evaluation_task = load_crewai().Task(
             description=f"""As the Results Intelligence Evaluator, analyze these query results using comprehensive AIMS business knowledge:
 
 USER QUESTION: {user_question}
@@ -1961,8 +2231,7 @@ Respond with JSON:
             agent=self.results_evaluator.get_agent()
         )
         
-        crew = Crew(agents=[self.results_evaluator.get_agent()], tasks=[evaluation_task], process=Process.sequential, memory=False)
-        result = str(crew.kickoff())
+        result = self._kickoff_crew(self.results_evaluator.get_agent(), evaluation_task)
         
         try:
             import json as js
@@ -41,7 +41,7 @@ class CustomerValidator:
             You guide users through the validation process and ensure data integrity.""",
             verbose=True,
             allow_delegation=False,
-            llm=self.llm_factory.create_gemini_llm(),
+            llm=self.llm_factory.create_resilient_llm(),
             max_iter=3
         )
     
@@ -39,7 +39,7 @@ class NameDetector:
             You analyze the semantic context to make accurate classifications.""",
             verbose=True,
             allow_delegation=False,
-            llm=self.llm_factory.create_gemini_llm(),
+            llm=self.llm_factory.create_resilient_llm(),
             max_iter=2
         )
     
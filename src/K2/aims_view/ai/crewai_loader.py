@@ -0,0 +1,13 @@
+"""
+Deferred crewai import
+crewai pulls in litellm and its HTTP stack, which takes seconds, so it is imported on the first
+agent or LLM client instead of at startup
+"""
+
+
+def load_crewai():
+    """The crewai module, imported on first use after the SSL bypass is in place"""
+    # Importing ssl_config applies the bypass, which must happen before litellm is imported
+    import src.K2.aims_view.security.ssl_config  # noqa: F401
+    import crewai
+    return crewai
@@ -0,0 +1,39 @@
+"""
+Hedged and failover LLM client spanning the Gemini and Groq providers
+"""
+
+from typing import List
+
+from crewai import BaseLLM
+
+from src.K2.aims_view.ai.hedging import HedgedCompletion, ProviderHealth, _run_coroutine
+
+
+class HedgedLLM(BaseLLM):
+    """crewai LLM that answers through a HedgedCompletion (see there for the hedging rules)"""
+
+    def __init__(self, providers: list, health: ProviderHealth = None, hedge_config: dict = None):
+        if not providers:
+            raise ValueError("HedgedLLM requires at least one provider")
+        super().__init__(model=providers[0].model, temperature=providers[0].temperature)
+        self.completion = HedgedCompletion(providers, health=health, hedge_config=hedge_config)
+        self.providers = self.completion.providers
+        self.health = self.completion.health
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs) -> str:
+        """Run a hedged completion and return the winning response text"""
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        return _run_coroutine(self.completion.acall_hedged(messages))
+
+    async def acall_hedged(self, messages: List[dict]) -> str:
+        return await self.completion.acall_hedged(messages)
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def supports_stop_words(self) -> bool:
+        return False
+
+    def get_context_window_size(self) -> int:
+        return 128000
@@ -0,0 +1,316 @@
+"""
+Provider health tracking and hedged completions across LLM providers
+Kept free of crewai so the hedging and circuit breaker logic can run (and be tested) on its own
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Per-provider circuit breaker (closed -> open -> half-open)"""
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        """Current breaker state: closed, open or half_open"""
+        with self._lock:
+            return self._state_locked()
+
+    def _state_locked(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow_request(self) -> bool:
+        """Check whether a request may be sent to this provider now (see acquire)"""
+        return self.acquire() is not None
+
+    def acquire(self) -> Optional[bool]:
+        """Admit a request: None if refused, else whether it is the half-open probe
+
+        While half-open only one probe is let through; the caller must report
+        its outcome with record_success/record_failure, or release_probe if it
+        was abandoned.
+        """
+        with self._lock:
+            state = self._state_locked()
+            if state == "closed":
+                return False
+            if state == "open" or self._probing:
+                return None
+            self._probing = True
+            return True
+
+    def release_probe(self):
+        """Let another probe through after one ended without an outcome (e.g. it was cancelled)"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        """Close the breaker after a successful call"""
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        """Count a failure, opening (or re-opening) the breaker at the threshold"""
+        with self._lock:
+            self._probing = False
+            self._consecutive_failures += 1
+            if self._state_locked() == "half_open" or self._consecutive_failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies for one provider"""
+
+    def __init__(self, window: int = 100):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+
+    def record(self, latency: float):
+        """Add a latency sample in seconds"""
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Get the given latency percentile, or None without samples"""
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+
+class ProviderHealth:
+    """Process-wide circuit breakers and latency history keyed by provider name"""
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0, latency_window: int = 100):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.latency_window = latency_window
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._latencies = {}
+
+    def breaker(self, provider_name: str) -> CircuitBreaker:
+        """Get (or create) the circuit breaker of a provider"""
+        with self._lock:
+            if provider_name not in self._breakers:
+                self._breakers[provider_name] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[provider_name]
+
+    def latency(self, provider_name: str) -> LatencyTracker:
+        """Get (or create) the latency tracker of a provider"""
+        with self._lock:
+            if provider_name not in self._latencies:
+                self._latencies[provider_name] = LatencyTracker(self.latency_window)
+            return self._latencies[provider_name]
+
+    def get_stats(self) -> dict:
+        """Get breaker state and latency percentiles for every known provider"""
+        with self._lock:
+            names = set(self._breakers) | set(self._latencies)
+        return {
+            name: {
+                "breaker_state": self.breaker(name).state,
+                "samples": len(self.latency(name)),
+                "p50_latency": self.latency(name).percentile(50),
+                "p95_latency": self.latency(name).percentile(95)
+            }
+            for name in sorted(names)
+        }
+
+
+class LLMProvider:
+    """One chat-completion endpoint reachable through litellm"""
+
+    def __init__(self, name: str, model: str, api_key: str = None, base_url: str = None,
+                 temperature: float = 0.7, max_tokens: int = None):
+        self.name = name
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+    async def acomplete(self, messages: List[dict]) -> str:
+        """Send the messages and return the completion text"""
+        import litellm
+
+        response = await litellm.acompletion(
+            model=self.model,
+            messages=messages,
+            api_key=self.api_key,
+            api_base=self.base_url,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
+        return response.choices[0].message.content or ""
+
+
+class HedgedCompletion:
+    """Hedges slow completions and fails over between providers
+
+    The first available provider is called first. If it has not answered
+    after its p95 latency (clamped to the configured bounds), the same request
+    is sent to the next provider; the first valid response wins and the other
+    request is cancelled. Failed providers are skipped while their circuit
+    breaker is open. Providers only need a ``name`` and an async
+    ``acomplete(messages)``, so tests can use stub providers or point
+    ``base_url`` at a local OpenAI-compatible stub server.
+    """
+
+    def __init__(self, providers: list, health: ProviderHealth = None, hedge_config: dict = None):
+        if not providers:
+            raise ValueError("HedgedCompletion requires at least one provider")
+        hedge_config = hedge_config or {}
+        self.providers = providers
+        self.health = health or ProviderHealth()
+        self.hedge_percentile = hedge_config.get("hedge_percentile", 95)
+        self.default_hedge_delay = hedge_config.get("default_hedge_delay", 4.0)
+        self.min_hedge_delay = hedge_config.get("min_hedge_delay", 0.5)
+        self.max_hedge_delay = hedge_config.get("max_hedge_delay", 15.0)
+        self.min_latency_samples = hedge_config.get("min_latency_samples", 10)
+        self.request_timeout = hedge_config.get("request_timeout", 120.0)
+
+    def hedge_delay(self, provider_name: str) -> float:
+        """Delay before hedging a request to this provider (p95-based)"""
+        tracker = self.health.latency(provider_name)
+        if len(tracker) < self.min_latency_samples:
+            delay = self.default_hedge_delay
+        else:
+            delay = tracker.percentile(self.hedge_percentile)
+        return max(self.min_hedge_delay, min(self.max_hedge_delay, delay))
+
+    async def acall_hedged(self, messages: List[dict]) -> str:
+        """Hedged completion: first valid response across providers wins"""
+        candidates = [p for p in self.providers if self.health.breaker(p.name).state != "open"]
+        tasks = {}
+        errors = []
+
+        def launch():
+            """Start the next provider whose breaker admits a request, or return None"""
+            while candidates:
+                provider = candidates.pop(0)
+                # Half-open providers admit a single probe, so re-check at launch time
+                probe = self.health.breaker(provider.name).acquire()
+                if probe is not None:
+                    task = asyncio.ensure_future(self._attempt(provider, messages, probe))
+                    tasks[task] = provider
+                    return task
+            return None
+
+        first = launch()
+        if first is None:
+            raise RuntimeError("All LLM providers are unavailable (circuit breakers open)")
+        pending = {first}
+        hedge_after = self.hedge_delay(tasks[first].name)
+
+        try:
+            while pending:
+                timeout = hedge_after if candidates else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Hedge timer fired - send the same request to the next provider
+                    task = launch()
+                    if task is not None:
+                        slow = ", ".join(tasks[running].name for running in pending)
+                        logger.info(f"Hedging LLM request from {slow} to {tasks[task].name}")
+                        pending.add(task)
+                        hedge_after = self.hedge_delay(tasks[task].name)
+                    continue
+
+                for task in done:
+                    provider = tasks[task]
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        errors.append(f"{provider.name}: {e}")
+
+                # A provider failed outright - fail over immediately
+                if not pending:
+                    task = launch()
+                    if task is not None:
+                        pending.add(task)
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        raise RuntimeError(f"All LLM providers failed: {'; '.join(errors)}")
+
+    async def _attempt(self, provider, messages: List[dict], probe: bool = False) -> str:
+        """Call one provider, updating its breaker and latency history
+
+        probe is True when this attempt holds the provider's half-open probe.
+        """
+        breaker = self.health.breaker(provider.name)
+        start = time.monotonic()
+        try:
+            text = await asyncio.wait_for(provider.acomplete(messages), timeout=self.request_timeout)
+        except asyncio.CancelledError:
+            # Lost the race (or the caller gave up): no verdict on the provider.
+            # Only the probe's own attempt may hand the probe to someone else.
+            if probe:
+                breaker.release_probe()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+
+        if not text or not text.strip():
+            breaker.record_failure()
+            raise ValueError("empty response")
+
+        breaker.record_success()
+        self.health.latency(provider.name).record(time.monotonic() - start)
+        return text
+
+
+def _run_coroutine(coroutine):
+    """Run a coroutine to completion from synchronous code"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    # Called from inside a running event loop - run on a helper thread instead
+    result = {}
+
+    def runner():
+        try:
+            result["value"] = asyncio.run(coroutine)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=runner, daemon=True)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
@@ -3,7 +3,82 @@ LLM Factory for creating different AI model instances
 """
 
 import os
-from crewai import LLM
+import threading
+from src.K2.aims_view.ai.crewai_loader import load_crewai
+
+
+class ModelTierRouter:
+    """Routes SQL generation between the Flash and Pro Gemini tiers"""
+    
+    TIERS = ("flash", "pro")
+    
+    # Step wording that usually means joins, aggregations or nested logic
+    COMPLEXITY_KEYWORDS = [
+        'join', 'group by', 'aggregate', 'sum', 'average', 'avg', 'ratio', 'loss ratio',
+        'compare', 'comparison', 'trend', 'rank', 'top', 'per ', 'each', 'across',
+        'breakdown', 'subquery', 'nested', 'window', 'partition', 'distinct', 'percentage',
+        'year over year', 'month over month', 'growth'
+    ]
+    
+    def __init__(self, routing_config: dict = None):
+        routing_config = routing_config or {}
+        self.enabled = routing_config.get("enabled", True)
+        self.default_tier = routing_config.get("default_tier", "flash")
+        self.complexity_threshold = routing_config.get("complexity_threshold", 4)
+        self.step_count_threshold = routing_config.get("step_count_threshold", 3)
+        self.escalate_after_failures = routing_config.get("escalate_after_failures", 1)
+        
+        self._lock = threading.Lock()
+        self._stats = {
+            tier: {"calls": 0, "successes": 0, "failures": 0, "total_latency": 0.0}
+            for tier in self.TIERS
+        }
+    
+    def complexity_score(self, step: str, step_count: int = 1) -> int:
+        """Score how demanding a query step is from its wording and the plan size"""
+        step_lower = str(step).lower()
+        score = sum(1 for keyword in self.COMPLEXITY_KEYWORDS if keyword in step_lower)
+        if step_count >= self.step_count_threshold:
+            score += 2
+        return score
+    
+    def select_tier(self, step: str, step_count: int = 1, previous_failures: int = 0) -> str:
+        """Pick the model tier for a query step, escalating to Pro after failures"""
+        if not self.enabled:
+            return "pro"
+        if previous_failures >= self.escalate_after_failures:
+            return "pro"
+        if self.complexity_score(step, step_count) >= self.complexity_threshold:
+            return "pro"
+        return self.default_tier
+    
+    def record(self, tier: str, latency: float, success: bool):
+        """Record the latency and outcome of one SQL generation on a tier"""
+        with self._lock:
+            stats = self._stats.setdefault(
+                tier, {"calls": 0, "successes": 0, "failures": 0, "total_latency": 0.0}
+            )
+            stats["calls"] += 1
+            stats["total_latency"] += latency
+            if success:
+                stats["successes"] += 1
+            else:
+                stats["failures"] += 1
+    
+    def get_stats(self) -> dict:
+        """Get per-tier call counts, average latency and success rate"""
+        with self._lock:
+            summary = {}
+            for tier, stats in self._stats.items():
+                calls = stats["calls"]
+                summary[tier] = {
+                    "calls": calls,
+                    "successes": stats["successes"],
+                    "failures": stats["failures"],
+                    "avg_latency": stats["total_latency"] / calls if calls else 0.0,
+                    "success_rate": stats["successes"] / calls if calls else 0.0
+                }
+            return summary
 
 
 class LLMFactory:
@@ -11,58 +86,143 @@ class LLMFactory:
     
     def __init__(self, config: dict):
         self.config = config
+        routing_config = config.get("intelligence_manager", {}).get("model_routing", {})
+        self.tier_router = ModelTierRouter(routing_config)
+        
+        # Shared circuit breakers and latency history for hedged requests
+        self.hedging_config = config.get("intelligence_manager", {}).get("hedging", {})
+        self._provider_health = None
+        self._provider_health_lock = threading.Lock()
+    
+    @property
+    def provider_health(self):
+        """Shared ProviderHealth, created with the first hedged client"""
+        with self._provider_health_lock:
+            if self._provider_health is None:
+                from src.K2.aims_view.ai.hedging import ProviderHealth
+                self._provider_health = ProviderHealth(
+                    failure_threshold=self.hedging_config.get("failure_threshold", 3),
+                    reset_timeout=self.hedging_config.get("reset_timeout", 30.0),
+                    latency_window=self.hedging_config.get("latency_window", 100)
+                )
+            return self._provider_health
     
-    def create_gemini_llm(self, stream: bool = False) -> LLM:
+    def create_gemini_llm(self, stream: bool = False) -> "LLM":
         """Create Gemini LLM instance for intelligent reasoning"""
         gemini_config = self.config["agents"]["router"]["models"]["gemini_model"]
         
-        return LLM(
+        return load_crewai().LLM(
             model=gemini_config["model_name"],
             api_key=os.getenv("GEMINI_API_KEY"),
             temperature=gemini_config["temperature"],
             max_tokens=gemini_config["max_tokens"],
+            base_url=gemini_config.get("api_base"),
             stream=stream
         )
     
-    def create_gemini_pro_llm(self, stream: bool = False) -> LLM:
+    def create_gemini_pro_llm(self, stream: bool = False) -> "LLM":
         """Create Gemini Pro LLM instance for intelligent reasoning"""
         gemini_pro_config = self.config["agents"]["router"]["models"]["gemini_pro_model"]
         
-        return LLM(
+        return load_crewai().LLM(
             model=gemini_pro_config["model_name"],
             api_key=os.getenv("GEMINI_API_KEY"),
             temperature=gemini_pro_config["temperature"],
             max_tokens=gemini_pro_config["max_tokens"],
+            base_url=gemini_pro_config.get("api_base"),
             stream=stream
         )
     
-    def create_gemini_streaming_llm(self) -> LLM:
+    def create_gemini_streaming_llm(self) -> "LLM":
         """Create Gemini LLM instance with streaming enabled for real-time response generation"""
         return self.create_gemini_llm(stream=True)
     
-    def create_groq_llm(self, stream: bool = False) -> LLM:
+    def get_completion_settings(self, model_key: str = "gemini_model") -> dict:
+        """Get litellm completion keyword arguments for a router model"""
+        model_config = self.config["agents"]["router"]["models"][model_key]
+        api_key_env = "GROQ_API_KEY" if model_config["model_name"].startswith("groq/") else "GEMINI_API_KEY"
+        
+        return {
+            "model": model_config["model_name"],
+            "api_key": os.getenv(api_key_env),
+            "api_base": model_config.get("api_base"),
+            "temperature": model_config["temperature"],
+            "max_tokens": model_config["max_tokens"]
+        }
+    
+    def create_groq_llm(self, stream: bool = False) -> "LLM":
         """Create Groq LLM instance"""
         groq_config = self.config["agents"]["router"]["models"]["groq_model"]
         
-        return LLM(
+        return load_crewai().LLM(
             model=groq_config["model_name"],
             api_key=os.getenv("GROQ_API_KEY"),
             temperature=groq_config["temperature"],
             max_tokens=groq_config["max_tokens"],
+            base_url=groq_config.get("api_base"),
             stream=stream
         )
     
-    def create_tools_groq_llm(self) -> LLM:
+    def create_tools_groq_llm(self) -> "LLM":
         """Create Groq LLM instance specifically for tools"""
         tools_config = self.config["agents"]["tools"]["models"]["groq_model"]
         
-        return LLM(
+        return load_crewai().LLM(
             model=tools_config["model_name"],
             api_key=os.getenv("GROQ_API_KEY"),
             temperature=tools_config["temperature"],
             max_tokens=tools_config["max_tokens"]
         )
     
+    def create_resilient_llm(self):
+        """Create a Gemini-first LLM that hedges and fails over to Groq when enabled"""
+        if not self.hedging_config.get("enabled", False):
+            return self.create_gemini_llm()
+        
+        models = self.config["agents"]["router"]["models"]
+        providers = [
+            self._create_provider("gemini", models["gemini_model"], "GEMINI_API_KEY"),
+            self._create_provider("groq", models["groq_model"], "GROQ_API_KEY")
+        ]
+        from src.K2.aims_view.ai.hedged_llm import HedgedLLM
+        return HedgedLLM(providers, health=self.provider_health, hedge_config=self.hedging_config)
+    
+    def _create_provider(self, name: str, model_config: dict, api_key_env: str) -> "LLMProvider":
+        """Create a hedging provider from a model configuration block"""
+        from src.K2.aims_view.ai.hedging import LLMProvider
+        return LLMProvider(
+            name=name,
+            model=model_config["model_name"],
+            api_key=os.getenv(api_key_env),
+            base_url=model_config.get("api_base"),
+            temperature=model_config["temperature"],
+            max_tokens=model_config["max_tokens"]
+        )
+    
+    def get_provider_stats(self) -> dict:
+        """Get circuit breaker state and latency percentiles per provider (empty before the first hedged client)"""
+        if self._provider_health is None:
+            return {}
+        return self.provider_health.get_stats()
+    
+    def create_tier_llm(self, tier: str) -> "LLM":
+        """Create the Gemini LLM instance for a routing tier ("flash" or "pro")"""
+        if tier == "pro":
+            return self.create_gemini_pro_llm()
+        return self.create_resilient_llm()
+    
+    def select_query_tier(self, step: str, step_count: int = 1, previous_failures: int = 0) -> str:
+        """Select the model tier for SQL generation of a query step"""
+        return self.tier_router.select_tier(step, step_count, previous_failures)
+    
+    def record_tier_result(self, tier: str, latency: float, success: bool):
+        """Record latency and success of a tiered SQL generation call"""
+        self.tier_router.record(tier, latency, success)
+    
+    def get_tier_stats(self) -> dict:
+        """Get per-tier latency and success statistics for threshold tuning"""
+        return self.tier_router.get_stats()
+    
     def get_ai_model_config(self) -> dict:
         """Get AI model configuration"""
         return self.config.get("ai", {})
@@ -0,0 +1,237 @@
+"""
+Process-wide LLM scheduler: per-model concurrency, rate limits, priority lanes and backoff
+"""
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+
+# Lower value is served first
+PRIORITY_ORDER = {
+    PRIORITY_INTERACTIVE: 0,
+    PRIORITY_BACKGROUND: 1
+}
+
+RATE_LIMIT_MARKERS = ["429", "rate limit", "ratelimit", "resource_exhausted", "quota", "too many requests"]
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a provider keeps rate limiting after all backoff retries"""
+    pass
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at capacity per minute"""
+
+    def __init__(self, capacity_per_minute: float):
+        self.capacity = float(capacity_per_minute)
+        self.refill_rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+        self.last_refill = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount tokens are available (0 when available now)"""
+        self._refill()
+        # Requests larger than the bucket only wait for a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_rate
+
+    def consume(self, amount: float):
+        """Take tokens from the bucket (may go negative for oversized requests)"""
+        self._refill()
+        self.tokens -= amount
+
+
+class _ModelLane:
+    """Admission state for one model: slots, buckets and the priority queue"""
+
+    def __init__(self, limits: dict):
+        self.max_concurrency = limits.get("max_concurrency", 4)
+        self.rpm_bucket = TokenBucket(limits.get("requests_per_minute", 60))
+        self.tpm_bucket = TokenBucket(limits.get("tokens_per_minute", 1000000))
+        self.in_flight = 0
+        self.waiting = []
+
+
+class LLMScheduler:
+    """Coordinates every LLM call in the process across users and questions"""
+
+    def __init__(self, config: dict = None):
+        config = config or {}
+        self.default_limits = config.get("default", {})
+        self.model_limits = config.get("models", {})
+        self.max_retries = config.get("max_retries", 5)
+        self.backoff_base = config.get("backoff_base", 1.0)
+        self.backoff_max = config.get("backoff_max", 30.0)
+
+        self._condition = threading.Condition()
+        self._lanes = {}
+        self._sequence = itertools.count()
+        self._wait_stats = {
+            priority: {"count": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for priority in PRIORITY_ORDER
+        }
+        self._rate_limit_retries = 0
+
+    def _lane(self, model: str) -> _ModelLane:
+        if model not in self._lanes:
+            self._lanes[model] = _ModelLane(self.model_limits.get(model, self.default_limits))
+        return self._lanes[model]
+
+    def acquire(self, model: str, priority: str = PRIORITY_BACKGROUND, estimated_tokens: int = 0) -> float:
+        """Block until a slot and rate budget are free for the model; returns the wait time"""
+        ticket = (PRIORITY_ORDER.get(priority, 1), next(self._sequence))
+        start = time.monotonic()
+
+        with self._condition:
+            lane = self._lane(model)
+            heapq.heappush(lane.waiting, ticket)
+
+            while True:
+                wait_for = None
+                if lane.waiting[0] == ticket and lane.in_flight < lane.max_concurrency:
+                    wait_for = max(lane.rpm_bucket.wait_time(1), lane.tpm_bucket.wait_time(estimated_tokens))
+                    if wait_for == 0:
+                        heapq.heappop(lane.waiting)
+                        lane.in_flight += 1
+                        lane.rpm_bucket.consume(1)
+                        lane.tpm_bucket.consume(estimated_tokens)
+                        # The next ticket may also be admissible
+                        self._condition.notify_all()
+                        break
+                self._condition.wait(timeout=wait_for)
+
+        waited = time.monotonic() - start
+        self._record_wait(priority, waited)
+        return waited
+
+    def release(self, model: str):
+        """Return a model slot taken by acquire()"""
+        with self._condition:
+            lane = self._lane(model)
+            lane.in_flight = max(0, lane.in_flight - 1)
+            self._condition.notify_all()
+
+    def run(self, model: str, fn, *args, priority: str = PRIORITY_BACKGROUND, estimated_tokens: int = 0, **kwargs):
+        """Run fn under the model's limits, retrying rate-limit errors with jittered backoff"""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(model, priority, estimated_tokens)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not self.is_rate_limit_error(e):
+                    raise
+                if attempt == self.max_retries:
+                    raise RateLimitExceeded(f"{model} still rate limited after {self.max_retries} retries: {e}") from e
+                with self._condition:
+                    self._rate_limit_retries += 1
+                delay = self.backoff_delay(attempt)
+                logger.warning(f"Rate limited by {model}, retrying in {delay:.1f}s (attempt {attempt + 1})")
+            finally:
+                self.release(model)
+            time.sleep(delay)
+
+    def stream(self, model: str, stream_factory, priority: str = PRIORITY_BACKGROUND, estimated_tokens: int = 0):
+        """Yield from a streaming call, holding the model slot until the stream ends
+
+        Rate-limit errors raised before the first item are retried with backoff;
+        once items have been yielded errors propagate to the consumer.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(model, priority, estimated_tokens)
+            started = False
+            try:
+                for item in stream_factory():
+                    started = True
+                    yield item
+                return
+            except Exception as e:
+                if started or not self.is_rate_limit_error(e):
+                    raise
+                if attempt == self.max_retries:
+                    raise RateLimitExceeded(f"{model} still rate limited after {self.max_retries} retries: {e}") from e
+                with self._condition:
+                    self._rate_limit_retries += 1
+                delay = self.backoff_delay(attempt)
+                logger.warning(f"Rate limited by {model}, retrying stream in {delay:.1f}s (attempt {attempt + 1})")
+            finally:
+                self.release(model)
+            time.sleep(delay)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    @staticmethod
+    def is_rate_limit_error(error: Exception) -> bool:
+        """Check whether an exception is a provider rate-limit (429) response"""
+        if getattr(error, "status_code", None) == 429:
+            return True
+        text = f"{type(error).__name__} {error}".lower()
+        return any(marker in text for marker in RATE_LIMIT_MARKERS)
+
+    def _record_wait(self, priority: str, waited: float):
+        with self._condition:
+            stats = self._wait_stats.setdefault(priority, {"count": 0, "total_wait": 0.0, "max_wait": 0.0})
+            stats["count"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+
+    def get_metrics(self) -> dict:
+        """Get queue depth per model and lane, in-flight calls and wait-time statistics"""
+        with self._condition:
+            models = {}
+            for model, lane in self._lanes.items():
+                depth = {priority: 0 for priority in PRIORITY_ORDER}
+                for priority_value, _ in lane.waiting:
+                    for name, value in PRIORITY_ORDER.items():
+                        if value == priority_value:
+                            depth[name] += 1
+                models[model] = {
+                    "in_flight": lane.in_flight,
+                    "max_concurrency": lane.max_concurrency,
+                    "queue_depth": depth
+                }
+            wait_times = {
+                priority: {
+                    "count": stats["count"],
+                    "avg_wait": stats["total_wait"] / stats["count"] if stats["count"] else 0.0,
+                    "max_wait": stats["max_wait"]
+                }
+                for priority, stats in self._wait_stats.items()
+            }
+            return {
+                "models": models,
+                "wait_times": wait_times,
+                "rate_limit_retries": self._rate_limit_retries
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler(config: dict = None) -> LLMScheduler:
+    """Get the process-wide LLM scheduler (configured by the first caller)"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler((config or {}).get("llm_scheduler", {}))
+        return _scheduler
@@ -0,0 +1,359 @@
+"""
+ASGI web service for the K2 chatbot frontend
+Serves the chat UI and streams pipeline phases and response tokens over server-sent events
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+
+from src.K2.aims_view.core.step_result import StepResult
+from src.K2.aims_view.utils.memory_store import new_session_id
+from src.K2.aims_view.utils.result_export import (
+    EXPORT_FORMATS, ExportUnavailable, get_result_registry, iter_export, iter_result_batches, page_result
+)
+
+logger = logging.getLogger(__name__)
+
+
+FRONTEND_DIR = Path(__file__).parent.parent.parent.parent.parent / "frontend"
+CONFIG_PATH = Path(__file__).parent.parent / "config.json"
+SESSION_COOKIE = "k2_session"
+
+# Result fields sent to the browser (execution summaries stay server-side)
+CLIENT_RESULT_FIELDS = [
+    "status", "response", "message", "confidence", "cycles_used", "request_id",
+    "continuation_token", "clarification_type", "prompt", "choices", "renderer",
+    "latency_budget", "approximate", "refinement"
+]
+
+_STREAM_END = object()
+
+
+class QueueFullError(Exception):
+    """Raised when the worker pool queue has no room for another question"""
+    pass
+
+
+class ChatWorkerPool:
+    """Bounded thread pool running blocking manager calls
+
+    At most max_workers questions run at once and at most max_queue more may
+    wait; beyond that submit() raises QueueFullError so the API can answer 429.
+    """
+
+    def __init__(self, max_workers: int = 8, max_queue: int = 32, retry_after_seconds: int = 5):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after_seconds = retry_after_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="k2-chat")
+        self._lock = threading.Lock()
+        self._outstanding = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn on the pool, or raise QueueFullError when saturated"""
+        with self._lock:
+            if self._outstanding >= self.max_workers + self.max_queue:
+                raise QueueFullError()
+            self._outstanding += 1
+
+        future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future):
+        with self._lock:
+            self._outstanding -= 1
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait before retrying"""
+        return self.retry_after_seconds
+
+    def get_stats(self) -> dict:
+        """Get running and queued question counts"""
+        with self._lock:
+            outstanding = self._outstanding
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "running": min(outstanding, self.max_workers),
+            "queued": max(0, outstanding - self.max_workers)
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def client_result(result: dict) -> dict:
+    """Reduce a manager result to the fields the browser needs"""
+    payload = {field: result[field] for field in CLIENT_RESULT_FIELDS if field in result}
+    if result.get("status") == "needs_clarification":
+        # Plain-text fallback for clients that only read "response"
+        choices = "\n".join(f"{i}. {choice}" for i, choice in enumerate(result.get("choices", []), 1))
+        payload["response"] = f"{result.get('message', '')}\n{choices}".strip()
+    elif "response" not in payload:
+        payload["response"] = result.get("message", "")
+
+    # Handles let the browser page through or download full step results
+    step_results = result.get("execution_summary", {}).get("results", {})
+    handles = [
+        {"step": step_key, "handle": step["result_handle"], "row_count": step.get("row_count", 0)}
+        for step_key, step in step_results.items()
+        if isinstance(step, (dict, StepResult)) and step.get("result_handle")
+    ]
+    if handles:
+        payload["result_handles"] = handles
+    return payload
+
+
+def format_sse(event: str, data) -> str:
+    """Encode one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def create_app(config: dict = None, manager=None) -> FastAPI:
+    """Build the ASGI application around one shared IntelligentSQLManager"""
+    if config is None:
+        with open(CONFIG_PATH, "r") as f:
+            config = json.load(f)
+    api_config = config.get("api", {})
+    max_cycles = api_config.get("max_cycles", 3)
+    export_config = config.get("result_exports", {})
+    export_batch_size = export_config.get("batch_size", 5000)
+    max_page_size = export_config.get("max_page_size", 1000)
+    results = get_result_registry(config)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if app.state.manager is None:
+            # One manager for the process; every request shares its agents through its own RequestContext
+            from src.K2.aims_view.agents.intelligence_manager import IntelligentSQLManager
+            app.state.manager = await asyncio.to_thread(IntelligentSQLManager, config)
+            app.state.manager.warm_up()
+        local_sources = [app.state.manager.db_utils.replica, app.state.manager.db_utils.kpi_cube]
+        for local_source in local_sources:
+            local_source.start_auto_refresh()
+        yield
+        for local_source in local_sources:
+            local_source.stop_auto_refresh()
+        app.state.pool.shutdown()
+
+    app = FastAPI(title="K2 Insurance AI Assistant", lifespan=lifespan)
+    app.state.manager = manager
+    app.state.pool = ChatWorkerPool(
+        max_workers=api_config.get("max_workers", 8),
+        max_queue=api_config.get("max_queue", 32),
+        retry_after_seconds=api_config.get("retry_after_seconds", 5)
+    )
+
+    app.mount("/static", StaticFiles(directory=FRONTEND_DIR / "static"), name="static")
+
+    @app.get("/")
+    async def index():
+        return FileResponse(FRONTEND_DIR / "templates" / "chatbot.html")
+
+    @app.get("/api/health")
+    async def health():
+        return {"status": "ok" if app.state.manager is not None else "starting", "pool": app.state.pool.get_stats()}
+
+    @app.get("/api/metrics")
+    async def metrics():
+        manager = app.state.manager
+        return {
+            "pool": app.state.pool.get_stats(),
+            "llm_scheduler": manager.get_llm_scheduler_metrics() if manager else {},
+            "providers": manager.llm_factory.get_provider_stats() if manager else {},
+            "sql_rewriter": manager.db_utils.rewriter.get_stats() if manager else {},
+            "latency_budget": manager.latency_policy.get_stats() if manager else {},
+            "local_replica": manager.db_utils.replica.get_stats() if manager else {},
+            "kpi_cube": manager.db_utils.kpi_cube.get_stats() if manager else {},
+            "approximate": manager.db_utils.approximate.get_stats() if manager else {},
+            "result_cache": manager.db_utils.result_cache.get_stats() if manager else {},
+            "single_flight": manager.db_utils.single_flight.get_stats() if manager else {}
+        }
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        message = str(body.get("message", "")).strip()
+        continuation_token = body.get("continuation_token")
+        if not message:
+            return JSONResponse({"status": "error", "response": "Please enter a message"}, status_code=400)
+        if app.state.manager is None:
+            return _too_busy(app.state.pool, "The assistant is still starting up")
+
+        # The session only ever comes from the HttpOnly cookie, never from the body or query string
+        session_id = request.cookies.get(SESSION_COOKIE) or new_session_id()
+        wants_stream = body.get("stream", False) or "text/event-stream" in request.headers.get("accept", "")
+        request_id = uuid.uuid4().hex[:12]
+        approximate = bool(body.get("approximate", False))
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def push(kind, data):
+            loop.call_soon_threadsafe(queue.put_nowait, (kind, data))
+
+        def run():
+            manager = app.state.manager
+            callbacks = {}
+            if wants_stream:
+                callbacks = {
+                    "on_token": lambda token: push("token", {"text": token}),
+                    "on_event": lambda event, data: push(event, data)
+                }
+            if continuation_token:
+                return manager.resume(
+                    continuation_token, message, request_id=request_id, approximate=approximate,
+                    session_id=session_id, **callbacks
+                )
+            return manager.solve_intelligently(
+                message, max_cycles=max_cycles, session_id=session_id, request_id=request_id,
+                approximate=approximate, **callbacks
+            )
+
+        try:
+            future = app.state.pool.submit(run)
+        except QueueFullError:
+            return _too_busy(app.state.pool, "The assistant is busy - please retry shortly")
+
+        if not wants_stream:
+            try:
+                result = await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                # Client went away - stop the running statement instead of letting it finish unseen
+                app.state.manager.cancel(request_id)
+                raise
+            except Exception as e:
+                logger.exception("Chat request failed")
+                return JSONResponse({"status": "error", "response": f"Request failed: {e}"}, status_code=500)
+            response = JSONResponse(client_result(result))
+            response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="lax")
+            return response
+
+        def finish(done_future):
+            error = done_future.exception()
+            push("error" if error else "result", {"message": str(error)} if error else client_result(done_future.result()))
+            loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+
+        future.add_done_callback(finish)
+
+        async def events():
+            yield format_sse("session", {"request_id": request_id})
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is _STREAM_END:
+                        break
+                    kind, data = item
+                    yield format_sse(kind, data)
+            finally:
+                if not future.done():
+                    app.state.manager.cancel(request_id)
+
+        response = StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="lax")
+        return response
+
+    @app.post("/api/chat/{request_id}/cancel")
+    async def cancel_chat(request_id: str, request: Request):
+        manager = app.state.manager
+        session_id = request.cookies.get(SESSION_COOKIE)
+        if manager is None or not session_id or not manager.cancel(request_id, session_id):
+            return JSONResponse({"status": "error", "message": "No running request with that id"}, status_code=404)
+        return {"status": "cancelling", "request_id": request_id}
+
+    @app.get("/api/chat/{request_id}/refinement")
+    async def chat_refinement(request_id: str, request: Request):
+        manager = app.state.manager
+        session_id = request.cookies.get(SESSION_COOKIE)
+        refinement = manager.get_refinement(request_id, session_id) if manager and session_id else None
+        if refinement is None:
+            return JSONResponse({"status": "error", "message": "No refinement for that request"}, status_code=404)
+        return JSONResponse(json.loads(json.dumps(refinement, default=str)))
+
+    def find_handle(request: Request, handle_id: str):
+        session_id = request.cookies.get(SESSION_COOKIE)
+        return results.get(handle_id, session_id) if session_id else None
+
+    @app.get("/api/results/{handle_id}")
+    async def result_info(handle_id: str, request: Request):
+        handle = find_handle(request, handle_id)
+        if handle is None:
+            return _not_found()
+        return handle.to_dict()
+
+    @app.get("/api/results/{handle_id}/rows")
+    async def result_rows(handle_id: str, request: Request, offset: int = 0, limit: int = None):
+        handle = find_handle(request, handle_id)
+        if handle is None:
+            return _not_found()
+        if app.state.manager is None:
+            return _too_busy(app.state.pool, "The assistant is still starting up")
+        limit = min(max(1, limit or export_config.get("default_page_size", 100)), max_page_size)
+
+        try:
+            future = app.state.pool.submit(page_result, app.state.manager.db_utils, handle, max(0, offset), limit)
+        except QueueFullError:
+            return _too_busy(app.state.pool, "The assistant is busy - please retry shortly")
+        try:
+            page = await asyncio.wrap_future(future)
+        except Exception as e:
+            logger.exception("Result page read failed")
+            return JSONResponse({"status": "error", "response": f"Could not read results: {e}"}, status_code=500)
+        return JSONResponse(json.loads(json.dumps(page, default=str)))
+
+    @app.get("/api/results/{handle_id}/export/{fmt}")
+    async def result_export(handle_id: str, fmt: str, request: Request):
+        handle = find_handle(request, handle_id)
+        if handle is None:
+            return _not_found()
+        if fmt not in EXPORT_FORMATS:
+            return JSONResponse(
+                {"status": "error", "response": f"Unknown format '{fmt}'", "formats": list(EXPORT_FORMATS)},
+                status_code=400
+            )
+        if app.state.manager is None:
+            return _too_busy(app.state.pool, "The assistant is still starting up")
+
+        try:
+            # Batches are pulled from the database cursor as the client reads the body
+            body = iter_export(fmt, iter_result_batches(app.state.manager.db_utils, handle, export_batch_size))
+        except ExportUnavailable as e:
+            return JSONResponse({"status": "error", "response": str(e)}, status_code=501)
+
+        filename = f"{handle.step_key or 'result'}.{fmt}"
+        return StreamingResponse(
+            body,
+            media_type=EXPORT_FORMATS[fmt],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+
+    return app
+
+
+def _not_found() -> JSONResponse:
+    """404 for unknown, expired or other-session result handles"""
+    return JSONResponse({"status": "error", "response": "Result not found or expired"}, status_code=404)
+
+
+def _too_busy(pool: ChatWorkerPool, message: str) -> JSONResponse:
+    """429 response telling the client when to retry"""
+    return JSONResponse(
+        {"status": "busy", "response": message},
+        status_code=429,
+        headers={"Retry-After": str(pool.retry_after())}
+    )
@@ -0,0 +1,315 @@
+"""
+Batch question runner for scheduled report packs
+Answers a file of fixed questions concurrently with one shared manager, writing each answer to
+results.jsonl as it completes so an interrupted run resumes where it stopped
+"""
+
+import html
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from src.K2.aims_view.database.query_cache import QueryResultCache
+
+RESULTS_FILE = "results.jsonl"
+PARQUET_FILE = "results.parquet"
+HTML_FILE = "report.html"
+
+OUTPUT_FORMATS = ("jsonl", "parquet", "html")
+
+# Statuses that count as answered when resuming (others are asked again)
+FINISHED_STATUSES = {"success", "partial", "needs_clarification", "clarification_needed"}
+
+
+class BatchQuestion:
+    """One question of a batch file"""
+
+    def __init__(self, question_id: str, question: str, approximate: bool = False, section: str = None):
+        self.question_id = question_id
+        self.question = question
+        self.approximate = approximate
+        self.section = section
+
+    @property
+    def dedup_key(self) -> tuple:
+        """Questions with the same text (ignoring case and spacing) and mode are answered once"""
+        return " ".join(self.question.lower().split()), self.approximate
+
+
+def load_questions(path: str) -> list:
+    """Read questions from a .jsonl, .json, .yaml or .yml file
+
+    Each entry is a question string or an object with "question" and optional
+    "id", "approximate" and "section"; ids default to the entry's position.
+    """
+    path = Path(path)
+    text = path.read_text(encoding="utf-8")
+    if path.suffix.lower() == ".jsonl":
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+    elif path.suffix.lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("YAML question files need pyyaml - pip install pyyaml, or use JSONL")
+        entries = yaml.safe_load(text) or []
+    else:
+        entries = json.loads(text)
+    if isinstance(entries, dict):
+        entries = entries.get("questions", [])
+
+    questions, seen_ids = [], set()
+    for position, entry in enumerate(entries, 1):
+        if isinstance(entry, str):
+            entry = {"question": entry}
+        question = str(entry.get("question", "")).strip()
+        if not question:
+            continue
+        question_id = str(entry.get("id") or f"q{position:03d}")
+        if question_id in seen_ids:
+            raise ValueError(f"Duplicate question id '{question_id}' in {path}")
+        seen_ids.add(question_id)
+        questions.append(BatchQuestion(
+            question_id, question, bool(entry.get("approximate", False)), entry.get("section")
+        ))
+    return questions
+
+
+def read_results(output_dir: str) -> dict:
+    """Records already written by earlier runs, by question id (a line cut off by a crash is skipped)"""
+    results_path = Path(output_dir) / RESULTS_FILE
+    records = {}
+    if not results_path.exists():
+        return records
+    with open(results_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record["id"]] = record
+    return records
+
+
+class BatchWriter:
+    """Appends one JSON line per answer and periodically rewrites the Parquet and HTML reports"""
+
+    def __init__(self, output_dir: str, formats: list = None, checkpoint_every: int = 10, title: str = "CoreReports"):
+        self.output_dir = Path(output_dir)
+        self.formats = [fmt for fmt in (formats or OUTPUT_FORMATS) if fmt in OUTPUT_FORMATS]
+        self.checkpoint_every = checkpoint_every
+        self.title = title
+        self._lock = threading.Lock()
+        self._since_checkpoint = 0
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._drop_partial_line()
+
+    def _drop_partial_line(self):
+        """Cut off a last line left unfinished by a crash so new records start on their own line"""
+        results_path = self.output_dir / RESULTS_FILE
+        if not results_path.exists():
+            return
+        with open(results_path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def write(self, record: dict):
+        """Persist one answer before anything else happens to it"""
+        with self._lock:
+            with open(self.output_dir / RESULTS_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._since_checkpoint += 1
+            due = self.checkpoint_every and self._since_checkpoint >= self.checkpoint_every
+        if due:
+            self.checkpoint()
+
+    def checkpoint(self, order: list = None):
+        """Rewrite the Parquet and HTML reports from results.jsonl (latest record per question)"""
+        with self._lock:
+            self._since_checkpoint = 0
+            records = list(read_results(self.output_dir).values())
+            if order:
+                position = {question_id: i for i, question_id in enumerate(order)}
+                records.sort(key=lambda record: position.get(record["id"], len(position)))
+            if "parquet" in self.formats:
+                self._write_parquet(records)
+            if "html" in self.formats:
+                self._replace(HTML_FILE, render_html(records, self.title).encode("utf-8"))
+
+    def _replace(self, name: str, data: bytes):
+        temp_path = self.output_dir / f"{name}.{uuid.uuid4().hex}.tmp"
+        temp_path.write_bytes(data)
+        os.replace(temp_path, self.output_dir / name)
+
+    def _write_parquet(self, records: list):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("⚠️  pyarrow is not installed - skipping the Parquet report")
+            self.formats.remove("parquet")
+            return
+        columns = list(dict.fromkeys(key for record in records for key in record))
+        rows = [
+            {key: json.dumps(record.get(key), default=str) if isinstance(record.get(key), (list, dict)) else record.get(key)
+             for key in columns}
+            for record in records
+        ]
+        temp_path = self.output_dir / f"{PARQUET_FILE}.{uuid.uuid4().hex}.tmp"
+        pq.write_table(pa.Table.from_pylist(rows), temp_path)
+        os.replace(temp_path, self.output_dir / PARQUET_FILE)
+
+
+def render_html(records: list, title: str) -> str:
+    """Self-contained HTML report: one section per question, grouped by section"""
+    parts = [
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>",
+        f"<title>{html.escape(title)}</title>",
+        "<style>body{font-family:sans-serif;max-width:960px;margin:auto}"
+        ".answer{white-space:pre-wrap;border-left:3px solid #ccc;padding-left:12px}"
+        ".meta{color:#666;font-size:90%}.error{color:#b00}</style></head><body>",
+        f"<h1>{html.escape(title)}</h1>",
+        f"<p class='meta'>{len(records)} questions - generated {time.strftime('%Y-%m-%d %H:%M')}</p>"
+    ]
+    section = None
+    for record in records:
+        if record.get("section") and record["section"] != section:
+            section = record["section"]
+            parts.append(f"<h2>{html.escape(str(section))}</h2>")
+        parts.append(f"<h3 id='{html.escape(record['id'])}'>{html.escape(record['id'])}: "
+                     f"{html.escape(record.get('question', ''))}</h3>")
+        answer_class = "answer" if str(record.get("status")).lower() in ("success", "partial") else "answer error"
+        parts.append(f"<div class='{answer_class}'>{html.escape(str(record.get('response') or record.get('error') or ''))}</div>")
+        meta = f"status {record.get('status')} - {record.get('seconds', 0)}s"
+        if record.get("approximate"):
+            meta += " - approximate"
+        if record.get("duplicate_of"):
+            meta += f" - same question as {record['duplicate_of']}"
+        parts.append(f"<p class='meta'>{html.escape(meta)}</p>")
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+class BatchRunner:
+    """Answers a list of questions with one shared IntelligentSQLManager
+
+    Questions run concurrently up to max_concurrent_questions; LLM calls are
+    still bounded by the process-wide LLM scheduler and Oracle statements by
+    database.max_concurrent_queries. Identical questions are answered once and
+    a run-scoped query result cache runs each identical sub-query once.
+    """
+
+    def __init__(self, manager, output_dir: str, max_concurrent_questions: int = 4, max_cycles: int = 3,
+                 formats: list = None, checkpoint_every: int = 10, title: str = "CoreReports"):
+        self.manager = manager
+        self.output_dir = output_dir
+        self.max_concurrent_questions = max_concurrent_questions
+        self.max_cycles = max_cycles
+        self.writer = BatchWriter(output_dir, formats, checkpoint_every, title)
+        self.run_id = uuid.uuid4().hex[:8]
+
+    @classmethod
+    def from_config(cls, manager, config: dict, output_dir: str = None, **overrides) -> "BatchRunner":
+        """Build a runner from the batch config block; keyword overrides win over config values"""
+        batch_config = dict((config or {}).get("batch", {}))
+        batch_config.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(
+            manager,
+            output_dir or batch_config.get("output_dir", "data/batch_runs/latest"),
+            max_concurrent_questions=batch_config.get("max_concurrent_questions", 4),
+            max_cycles=batch_config.get("max_cycles", 3),
+            formats=batch_config.get("formats"),
+            checkpoint_every=batch_config.get("checkpoint_every", 10),
+            title=batch_config.get("title", "CoreReports")
+        )
+
+    def _session_id(self, question: BatchQuestion) -> str:
+        # Questions are independent: no conversation memory carries over between them
+        return f"batch-{self.run_id}-{re.sub(r'[^A-Za-z0-9_-]', '_', question.question_id)}"
+
+    def _answer(self, question: BatchQuestion) -> dict:
+        start_time = time.time()
+        record = {"id": question.question_id, "question": question.question, "section": question.section}
+        try:
+            result = self.manager.solve_intelligently(
+                question.question, max_cycles=self.max_cycles, session_id=self._session_id(question),
+                approximate=question.approximate
+            )
+            execution_summary = result.get("execution_summary", {})
+            record.update(
+                status=result.get("status"),
+                response=result.get("response") or result.get("message"),
+                confidence=result.get("confidence"),
+                cycles_used=result.get("cycles_used"),
+                queries=execution_summary.get("executed_queries", []),
+                approximate=bool(result.get("approximate")),
+                request_id=result.get("request_id")
+            )
+        except Exception as e:
+            record.update(status="error", error=f"{type(e).__name__}: {e}")
+        record["seconds"] = round(time.time() - start_time, 2)
+        record["completed_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        return record
+
+    def run(self, questions: list, resume: bool = True) -> dict:
+        """Answer every question not already answered in output_dir; returns a run summary"""
+        start_time = time.time()
+        done = read_results(self.output_dir) if resume else {}
+        pending = [
+            question for question in questions
+            if str(done.get(question.question_id, {}).get("status")).lower() not in FINISHED_STATUSES
+        ]
+        if not resume and (Path(self.output_dir) / RESULTS_FILE).exists():
+            os.remove(Path(self.output_dir) / RESULTS_FILE)
+
+        # Answer each distinct question once; duplicates are written from the first answer
+        groups = {}
+        for question in pending:
+            groups.setdefault(question.dedup_key, []).append(question)
+        print(f"📋 Batch: {len(questions)} questions, {len(questions) - len(pending)} already answered, "
+              f"{len(groups)} distinct to run with up to {self.max_concurrent_questions} at once")
+
+        db_utils = self.manager.db_utils
+        # Unless the shared cache is already on, the run gets its own cache, dropped with its entries at the end
+        shared_cache = db_utils.result_cache
+        run_cache = shared_cache if shared_cache.enabled else QueryResultCache(
+            enabled=True, max_entries=shared_cache.max_entries, ttl_seconds=shared_cache.ttl_seconds,
+            answer_from_broader=shared_cache.answer_from_broader
+        )
+        db_utils.result_cache = run_cache
+        statuses = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrent_questions, thread_name_prefix="k2-batch") as pool:
+                futures = {pool.submit(self._answer, group[0]): group for group in groups.values()}
+                for completed, future in enumerate(as_completed(futures), 1):
+                    group = futures[future]
+                    record = future.result()
+                    self.writer.write(record)
+                    for duplicate in group[1:]:
+                        self.writer.write(dict(
+                            record, id=duplicate.question_id, section=duplicate.section,
+                            duplicate_of=record["id"]
+                        ))
+                    statuses[record["status"]] = statuses.get(record["status"], 0) + len(group)
+                    print(f"   [{completed}/{len(groups)}] {record['id']}: {record['status']} in {record['seconds']}s")
+        finally:
+            db_utils.result_cache = shared_cache
+            self.writer.checkpoint(order=[question.question_id for question in questions])
+
+        return {
+            "questions": len(questions),
+            "answered": len(pending),
+            "skipped": len(questions) - len(pending),
+            "distinct": len(groups),
+            "statuses": statuses,
+            "query_cache": run_cache.get_stats(),
+            "seconds": round(time.time() - start_time, 1),
+            "output_dir": str(self.output_dir)
+        }
@@ -0,0 +1,108 @@
+"""
+Resumable clarification protocol for name identification
+A solve that needs user input returns a continuation token instead of blocking on input()
+"""
+
+import secrets
+import threading
+import time
+from typing import Optional
+
+
+# Clarification kinds and what the answer is expected to be
+CUSTOMER_IDENTIFIER = "customer_identifier"   # Customer ID, phone number or company ID
+CUSTOMER_CHOICE = "customer_choice"           # Pick one of several matching customers
+BROKER_CHOICE = "broker_choice"               # Pick one of several matching brokers
+USER_CHOICE = "user_choice"                   # Pick one of several matching system users
+
+CANCEL_ANSWERS = {"cancel", "quit", "exit", "stop"}
+
+
+class PendingClarification:
+    """Saved solve state waiting for one user answer"""
+
+    def __init__(self, kind: str, user_question: str, session_id: str, max_cycles: int,
+                 name: str, prompt: str, candidates: list = None, search_type: str = None, attempts: int = 0):
+        self.token = secrets.token_urlsafe(16)
+        self.kind = kind
+        self.user_question = user_question
+        self.session_id = session_id
+        self.max_cycles = max_cycles
+        self.name = name
+        self.prompt = prompt
+        self.candidates = candidates or []
+        self.search_type = search_type
+        self.attempts = attempts
+        self.created_at = time.time()
+
+    def choices(self) -> list:
+        """Human-readable labels of the candidates, numbered from 1"""
+        labels = []
+        for candidate in self.candidates:
+            if not isinstance(candidate, dict):
+                labels.append(str(candidate))
+                continue
+            cust_name = candidate.get('DOC_CUST_NAME', 'Unknown')
+            if candidate.get('CUST_ID_NO'):
+                labels.append(f"{cust_name} (Individual - ID: {candidate['CUST_ID_NO']})")
+            elif candidate.get('COMP_EID_NO'):
+                labels.append(f"{cust_name} (Company - ID: {candidate['COMP_EID_NO']})")
+            else:
+                labels.append(cust_name)
+        return labels
+
+    def to_response(self, message: str = None) -> dict:
+        """Build the needs_clarification result returned to the caller"""
+        return {
+            'status': 'needs_clarification',
+            'continuation_token': self.token,
+            'clarification_type': self.kind,
+            'prompt': self.prompt,
+            'choices': self.choices(),
+            'message': message or self.prompt,
+            'question': self.user_question,
+            'session_id': self.session_id,
+            'cycles_used': 0
+        }
+
+
+class ClarificationStore:
+    """Thread-safe, expiring store of pending clarifications keyed by token"""
+
+    def __init__(self, ttl_seconds: float = 900.0, max_pending: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def save(self, pending: PendingClarification) -> str:
+        """Store a pending clarification and return its continuation token"""
+        with self._lock:
+            self._expire_locked()
+            while len(self._pending) >= self.max_pending:
+                oldest = min(self._pending, key=lambda token: self._pending[token].created_at)
+                del self._pending[oldest]
+            self._pending[pending.token] = pending
+        return pending.token
+
+    def pop(self, token: str, session_id: str = None) -> Optional[PendingClarification]:
+        """Take a pending clarification (each token resumes at most once)
+
+        With session_id, only a clarification of that session is taken; another
+        session's token is left in place for its owner.
+        """
+        with self._lock:
+            self._expire_locked()
+            pending = self._pending.get(token)
+            if pending is None or (session_id and pending.session_id != session_id):
+                return None
+            return self._pending.pop(token)
+
+    def _expire_locked(self):
+        cutoff = time.time() - self.ttl_seconds
+        for token in [token for token, pending in self._pending.items() if pending.created_at < cutoff]:
+            del self._pending[token]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
@@ -14,6 +14,28 @@ from src.K2.aims_view.agents.intelligence_manager import IntelligentSQLManager
 import json
 
 
+def print_token(token: str):
+    """Print a streamed response token immediately"""
+    sys.stdout.write(token)
+    sys.stdout.flush()
+
+
+def answer_clarifications(manager: IntelligentSQLManager, result: dict) -> dict:
+    """Prompt for clarification answers on the console and resume until the solve finishes"""
+    while result.get('status') == 'needs_clarification':
+        print(f"\n💡 {result.get('message')}")
+        for i, choice in enumerate(result.get('choices', []), 1):
+            print(f"{i}. {choice}")
+        
+        try:
+            answer = input("🔍 Your answer: ").strip()
+        except KeyboardInterrupt:
+            answer = "cancel"
+        
+        result = manager.resume(result['continuation_token'], answer, on_token=print_token)
+    return result
+
+
 def interactive_intelligent_manager():
     """Interactive session with the Master Intelligence Manager"""
     print("🚀 MASTER INTELLIGENCE MANAGER ACTIVATED!")
@@ -35,20 +57,44 @@ def interactive_intelligent_manager():
         config = json.load(f)
     
     manager = IntelligentSQLManager(config)
+    if config.get("intelligence_manager", {}).get("warm_up_in_background", True):
+        # crewai and the Oracle driver load while the user types the first question
+        manager.warm_up()
     
     print("\n🤖 Master Intelligence Manager Ready!")
     print("Ask me any complex question about insurance data - I'll solve it completely!")
     print("🔍 I have comprehensive knowledge of AIMS database structure and business rules.")
+    print("Start a question with '~' for a quick sampled estimate.")
+    print("Type 'explain' after a quick answer for the full written analysis.")
     print("Type 'quit', 'exit', or 'bye' to stop.\n")
     
+    # Last answer rendered without the LLM, kept for 'explain'
+    last_local_answer = None
+    
     while True:
         try:
             user_input = input("🎯 Your question: ").strip()
+            approximate = user_input.startswith('~')
+            user_input = user_input.lstrip('~').strip()
             
             if str(user_input).lower() in ['quit', 'exit', 'bye', 'goodbye']:
                 print("👋 Master Intelligence Manager shutting down. Thank you!")
                 break
             
+            if str(user_input).lower() == 'explain':
+                if last_local_answer is None:
+                    print("Nothing to explain yet - 'explain' follows a quick answer.")
+                    continue
+                print(f"\n{'='*70}")
+                print(f"🔍 Writing the full analysis for: {last_local_answer['question']}")
+                print('='*70)
+                narrative = manager.generate_narrative(last_local_answer, on_token=print_token)
+                if narrative.get('status') != 'success':
+                    print(f"\n❌ {narrative.get('message', 'Could not generate the analysis')}")
+                last_local_answer = None
+                print(f"\n{'='*70}\n")
+                continue
+            
             if not user_input:
                 print("Please enter your question about the insurance data.")
                 continue
@@ -58,22 +104,23 @@ def interactive_intelligent_manager():
             print('='*70)
             
             # The Master Intelligence Manager takes full control (reduced cycles for efficiency)
-            result = manager.solve_intelligently(user_input, max_cycles=3)
+            # Response tokens are printed live as they stream in
+            result = manager.solve_intelligently(user_input, max_cycles=3, on_token=print_token, approximate=approximate)
+            result = answer_clarifications(manager, result)
             
             # Present results intelligently based on Master Intelligence Manager format
             if result.get('status') == 'success':
                 print(f"\n🎉 COMPLETE SOLUTION ACHIEVED!")
                 print(f"✅ Confidence: {result.get('confidence', 0.9)*100:.1f}%")
                 print(f"🔄 Solved in {result.get('cycles_used', 0)} intelligence cycles")
+                if result.get('refinement') == 'pending':
+                    print(f"🔬 Figures are estimates - exact results are being computed in the background")
+                if result.get('narrative_available'):
+                    last_local_answer = result
+                    print(f"💬 Answered directly from the data - type 'explain' for the full analysis")
                 
-                # Show the comprehensive response (already streamed during generation)
-                response_text = result.get('response', '')
-                if response_text:
-                    print(f"\n📋 FINAL COMPREHENSIVE ANSWER:")
-                    print("="*70)
-                    print(response_text)
-                    print("="*70)
-                else:
+                # The comprehensive response was already streamed during generation
+                if not result.get('response'):
                     print(f"📊 Summary: {result.get('summary', 'Solution provided')}")
                 
                 # Show technical details if needed (abbreviated)
@@ -94,6 +141,8 @@ def interactive_intelligent_manager():
             elif result.get('status') == 'error':
                 print(f"\n❌ SYSTEM ERROR")
                 print(f"💡 {result.get('message', 'Unknown error occurred')}")
+            elif result.get('status') == 'cancelled':
+                print(f"\n🚫 {result.get('message', 'Cancelled')}")
             else:
                 print(f"❌ Unexpected result format: {result}")
             
@@ -201,7 +250,9 @@ def interactive_sql_agent():
             print('='*70)
             
             # The Master Intelligence Manager takes full control (reduced cycles for efficiency)
-            result = manager.solve_intelligently(user_input, max_cycles=3)
+            # Response tokens are printed live as they stream in
+            result = manager.solve_intelligently(user_input, max_cycles=3, on_token=print_token)
+            result = answer_clarifications(manager, result)
             
             # Present results intelligently based on Master Intelligence Manager format
             if result.get('status') == 'success':
@@ -209,14 +260,8 @@ def interactive_sql_agent():
                 print(f"✅ Confidence: {result.get('confidence', 0.9)*100:.1f}%")
                 print(f"🔄 Solved in {result.get('cycles_used', 0)} intelligence cycles")
                 
-                # Show the comprehensive response (already streamed during generation)
-                response_text = result.get('response', '')
-                if response_text:
-                    print(f"\n📋 FINAL COMPREHENSIVE ANSWER:")
-                    print("="*70)
-                    print(response_text)
-                    print("="*70)
-                else:
+                # The comprehensive response was already streamed during generation
+                if not result.get('response'):
                     print(f"📊 Summary: {result.get('summary', 'Solution provided')}")
                 
                 # Show technical details if needed (abbreviated)
@@ -237,6 +282,8 @@ def interactive_sql_agent():
             elif result.get('status') == 'error':
                 print(f"\n❌ SYSTEM ERROR")
                 print(f"💡 {result.get('message', 'Unknown error occurred')}")
+            elif result.get('status') == 'cancelled':
+                print(f"\n🚫 {result.get('message', 'Cancelled')}")
             else:
                 print(f"❌ Unexpected result format: {result}")
             
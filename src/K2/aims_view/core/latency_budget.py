@@ -0,0 +1,199 @@
+"""
+Per-question latency budget
+One end-to-end SLA is split across planning, SQL generation, execution and response;
+retries and fallback cycles run only when the remaining budget can cover them
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+PHASES = ("planning", "sql_generation", "execution", "response")
+
+# Share of the SLA assumed for each phase until real latencies have been observed
+DEFAULT_PHASE_SHARES = {"planning": 0.2, "sql_generation": 0.3, "execution": 0.3, "response": 0.2}
+
+# Cheaper tier to fall back to when the preferred one no longer fits
+TIER_DOWNGRADES = {"pro": "flash"}
+
+
+class PhaseLatencyTracker:
+    """Process-wide smoothed latency per phase (and per model tier for SQL generation)"""
+
+    def __init__(self, smoothing: float = 0.3):
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._averages = {}
+        self._counts = {}
+
+    @staticmethod
+    def key(phase: str, tier: str = None) -> str:
+        return f"{phase}:{tier}" if tier else phase
+
+    def record(self, phase: str, seconds: float, tier: str = None):
+        """Fold one observed phase duration into the moving average"""
+        keys = [self.key(phase)] + ([self.key(phase, tier)] if tier else [])
+        with self._lock:
+            for key in keys:
+                previous = self._averages.get(key)
+                self._averages[key] = seconds if previous is None else (
+                    self.smoothing * seconds + (1 - self.smoothing) * previous
+                )
+                self._counts[key] = self._counts.get(key, 0) + 1
+
+    def average(self, phase: str, tier: str = None) -> Optional[float]:
+        """Smoothed duration of one phase call, or None before the first sample"""
+        with self._lock:
+            if tier and self.key(phase, tier) in self._averages:
+                return self._averages[self.key(phase, tier)]
+            return self._averages.get(self.key(phase))
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                key: {"avg_seconds": round(average, 3), "samples": self._counts[key]}
+                for key, average in self._averages.items()
+            }
+
+
+class LatencyBudget:
+    """Time budget of one question
+
+    Decisions compare the time left before the SLA with the expected cost of
+    the work (tracked averages, else this request's own timings, else the
+    phase's share of the SLA), always holding back enough for the response.
+    A budget without an SLA allows everything.
+    """
+
+    def __init__(self, sla_seconds: float = None, tracker: PhaseLatencyTracker = None,
+                 phase_shares: dict = None, min_query_seconds: float = 5.0):
+        self.sla_seconds = sla_seconds
+        self.tracker = tracker or PhaseLatencyTracker()
+        self.phase_shares = phase_shares or DEFAULT_PHASE_SHARES
+        self.min_query_seconds = min_query_seconds
+        self.started_at = time.time()
+        self.spent = {phase: 0.0 for phase in PHASES}
+        self.skipped = []
+        self._last = {}
+
+    @property
+    def bounded(self) -> bool:
+        return bool(self.sla_seconds)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the SLA, or None when unbounded"""
+        if not self.bounded:
+            return None
+        return self.sla_seconds - (time.time() - self.started_at)
+
+    def estimate(self, phase: str, tier: str = None) -> float:
+        """Expected seconds for one call of a phase"""
+        average = self.tracker.average(phase, tier)
+        if average is not None:
+            return average
+        if phase in self._last:
+            return self._last[phase]
+        return (self.sla_seconds or 0) * self.phase_shares.get(phase, 0)
+
+    @contextmanager
+    def phase(self, phase: str, tier: str = None):
+        """Time a block of work as one call of the given phase"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            self.spent[phase] = self.spent.get(phase, 0.0) + seconds
+            self._last[phase] = seconds
+            self.tracker.record(phase, seconds, tier)
+
+    def _fits(self, *costs: float) -> bool:
+        return self.remaining() - self.estimate("response") >= sum(costs)
+
+    def attempt_tier(self, tier: str, required: bool = False) -> Optional[str]:
+        """Tier for the next SQL attempt: tier itself, a cheaper tier, or None to skip
+
+        A required attempt (the first query of the question) is never skipped,
+        only downgraded.
+        """
+        if not self.bounded:
+            return tier
+        execution = self.estimate("execution")
+        candidate = tier
+        while candidate:
+            if self._fits(self.estimate("sql_generation", candidate), execution):
+                return candidate
+            candidate = TIER_DOWNGRADES.get(candidate)
+        if required:
+            return self._cheapest(tier)
+        return None
+
+    @staticmethod
+    def _cheapest(tier: str) -> str:
+        while tier in TIER_DOWNGRADES:
+            tier = TIER_DOWNGRADES[tier]
+        return tier
+
+    def allows_cycle(self) -> bool:
+        """Whether a fallback re-plan (planning, one generation, one execution) still fits"""
+        if not self.bounded:
+            return True
+        return self._fits(
+            self.estimate("planning"),
+            self.estimate("sql_generation", self._cheapest("pro")),
+            self.estimate("execution")
+        )
+
+    def query_timeout(self) -> Optional[float]:
+        """Longest a retried query may run without eating into the response reserve"""
+        if not self.bounded:
+            return None
+        return max(self.min_query_seconds, self.remaining() - self.estimate("response"))
+
+    def skip(self, what: str):
+        """Record work dropped to stay within the SLA"""
+        self.skipped.append(what)
+
+    def summary(self) -> dict:
+        elapsed = time.time() - self.started_at
+        return {
+            "sla_seconds": self.sla_seconds,
+            "elapsed_seconds": round(elapsed, 3),
+            "within_sla": not self.bounded or elapsed <= self.sla_seconds,
+            "phase_seconds": {phase: round(seconds, 3) for phase, seconds in self.spent.items()},
+            "skipped": list(self.skipped)
+        }
+
+
+class LatencyBudgetPolicy:
+    """Creates a LatencyBudget per question from the intelligence_manager.latency_budget config"""
+
+    def __init__(self, enabled: bool = True, sla_seconds: float = 30.0, phase_shares: dict = None,
+                 min_query_seconds: float = 5.0, smoothing: float = 0.3):
+        self.enabled = enabled
+        self.sla_seconds = sla_seconds
+        self.phase_shares = {**DEFAULT_PHASE_SHARES, **(phase_shares or {})}
+        self.min_query_seconds = min_query_seconds
+        self.tracker = PhaseLatencyTracker(smoothing)
+
+    @classmethod
+    def from_config(cls, config: dict = None) -> "LatencyBudgetPolicy":
+        budget_config = (config or {}).get("intelligence_manager", {}).get("latency_budget", {})
+        return cls(
+            enabled=budget_config.get("enabled", True),
+            sla_seconds=budget_config.get("sla_seconds", 30.0),
+            phase_shares=budget_config.get("phase_shares"),
+            min_query_seconds=budget_config.get("min_query_seconds", 5.0),
+            smoothing=budget_config.get("smoothing", 0.3)
+        )
+
+    def new_budget(self, sla_seconds: float = None) -> LatencyBudget:
+        """Budget for one question (unbounded when the policy is disabled)"""
+        return LatencyBudget(
+            (sla_seconds or self.sla_seconds) if self.enabled else None,
+            self.tracker, self.phase_shares, self.min_query_seconds
+        )
+
+    def get_stats(self) -> dict:
+        return {"enabled": self.enabled, "sla_seconds": self.sla_seconds, "phases": self.tracker.get_stats()}
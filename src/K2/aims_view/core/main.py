@@ -11,10 +11,7 @@ project_root = str(Path(__file__).parent.parent.parent.parent.parent)
 print(f"Adding project root to Python path: {project_root}")
 sys.path.insert(0, project_root)
 
-# Configure SSL before any AI imports
-from src.K2.aims_view.security.ssl_config import configure_ssl_bypass
-configure_ssl_bypass()
-
+# crewai, the agents and the Oracle driver are imported on first use (SSL is configured then)
 from src.K2.aims_view.core.interactive import interactive_intelligent_manager, demo_intelligent_manager
 
 
@@ -39,6 +36,91 @@ def main():
     interactive_intelligent_manager()
 
 
+def refresh_replica(full: bool = False):
+    """Load or incrementally refresh the local AIMS_ALL_DATA replica"""
+    import json
+    from src.K2.aims_view.database.database import SecureOracleDBUtils
+    
+    with open(Path(__file__).parent.parent / "config.json", "r") as f:
+        config = json.load(f)
+    
+    db_utils = SecureOracleDBUtils(config=config.get("database", {}))
+    if not db_utils.replica.enabled:
+        print("Local replica is disabled - set database.local_replica.enabled (requires duckdb and pyarrow)")
+        return
+    
+    print(f"Refreshing local replica ({'full reload' if full else 'incremental'})...")
+    summary = db_utils.replica.refresh(full=full)
+    print(f"Refreshed {summary['partitions_refreshed']} partitions in {summary['seconds']}s - "
+          f"{summary['partitions']} partitions, {summary['rows']} rows, watermark {summary['watermark']}")
+
+
+def build_kpi_cube():
+    """Rebuild the KPI cube from Oracle"""
+    import json
+    from src.K2.aims_view.database.database import SecureOracleDBUtils
+    
+    with open(Path(__file__).parent.parent / "config.json", "r") as f:
+        config = json.load(f)
+    
+    db_utils = SecureOracleDBUtils(config=config.get("database", {}))
+    if not db_utils.kpi_cube.enabled:
+        print("KPI cube is disabled - set database.kpi_cube.enabled (requires duckdb and pyarrow)")
+        return
+    
+    print("Building KPI cube...")
+    summary = db_utils.kpi_cube.build()
+    sketched = [name for name, info in summary['distinct'].items() if not info['additive']]
+    print(f"Built {summary['cells']} cells in {summary['seconds']}s "
+          f"(distinct counts merged from sketches: {', '.join(sketched) or 'none'})")
+
+
+def run_batch(args: list):
+    """Answer a file of questions concurrently and write a report pack"""
+    import argparse
+    import json
+    from src.K2.aims_view.agents.intelligence_manager import IntelligentSQLManager
+    from src.K2.aims_view.core.batch import OUTPUT_FORMATS, BatchRunner, load_questions
+    
+    parser = argparse.ArgumentParser(prog="main.py batch", description=run_batch.__doc__)
+    parser.add_argument("questions", help="JSONL, JSON or YAML file of questions")
+    parser.add_argument("--output", help="Output directory (default: batch.output_dir/<questions file name>)")
+    parser.add_argument("--concurrency", type=int, help="Questions answered at once")
+    parser.add_argument("--formats", nargs="+", choices=OUTPUT_FORMATS, help="Report formats to write")
+    parser.add_argument("--approximate", action="store_true", help="Answer every question in approximate mode")
+    parser.add_argument("--no-resume", action="store_true", help="Start over instead of skipping answered questions")
+    options = parser.parse_args(args)
+    
+    with open(Path(__file__).parent.parent / "config.json", "r") as f:
+        config = json.load(f)
+    
+    questions = load_questions(options.questions)
+    if options.approximate:
+        for question in questions:
+            question.approximate = True
+    
+    output_dir = options.output or str(
+        Path(config.get("batch", {}).get("output_dir", "data/batch_runs")) / Path(options.questions).stem
+    )
+    runner = BatchRunner.from_config(
+        IntelligentSQLManager(config), config, output_dir,
+        max_concurrent_questions=options.concurrency, formats=options.formats
+    )
+    summary = runner.run(questions, resume=not options.no_resume)
+    print(f"Answered {summary['answered']} questions ({summary['distinct']} distinct, {summary['skipped']} already done) "
+          f"in {summary['seconds']}s - {summary['statuses']}")
+    print(f"Query cache: {summary['query_cache']['hits']} hits, {summary['query_cache']['misses']} misses")
+    print(f"Results written to {summary['output_dir']}")
+
+
+def profile_startup(args: list):
+    """Print an import-time profile of CLI startup and the deferred imports"""
+    from src.K2.aims_view.core.startup_profile import startup_report
+    
+    top = int(args[args.index("--top") + 1]) if "--top" in args else 15
+    print(startup_report(top))
+
+
 if __name__ == "__main__":
     import sys
     
@@ -47,10 +129,22 @@ if __name__ == "__main__":
             demo_intelligent_manager()
         elif sys.argv[1] == "interactive":
             interactive_intelligent_manager()
+        elif sys.argv[1] == "refresh-replica":
+            refresh_replica(full="--full" in sys.argv[2:])
+        elif sys.argv[1] == "build-cube":
+            build_kpi_cube()
+        elif sys.argv[1] == "batch":
+            run_batch(sys.argv[2:])
+        elif sys.argv[1] == "profile-startup":
+            profile_startup(sys.argv[2:])
         else:
-            print("Usage: python main.py [demo|interactive]")
-            print("  demo        - Run demonstration of Master Intelligence Manager")
-            print("  interactive - Start interactive problem-solving session")
+            print("Usage: python main.py [demo|interactive|refresh-replica [--full]|build-cube|batch <questions file>|profile-startup [--top N]]")
+            print("  demo            - Run demonstration of Master Intelligence Manager")
+            print("  interactive     - Start interactive problem-solving session")
+            print("  refresh-replica - Refresh the local AIMS_ALL_DATA replica (--full reloads every partition)")
+            print("  build-cube      - Rebuild the KPI cube used for metric aggregates")
+            print("  batch           - Answer a file of questions and write a report pack (batch --help for options)")
+            print("  profile-startup - Show import times on the way to the prompt and of the deferred imports")
     else:
         # Default to main function
         main()
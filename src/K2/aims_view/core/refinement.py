@@ -0,0 +1,85 @@
+"""
+Background exact refinement of approximate answers
+After an approximate answer is returned, its estimated steps are re-run exactly on a worker thread;
+callers poll the refined rows by request id
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+class Refinement:
+    """Exact re-run of one request's approximate steps"""
+
+    def __init__(self, request_id: str, steps: dict, session_id: str = None):
+        self.request_id = request_id
+        self.session_id = session_id
+        # step key -> SQL of the exact query
+        self.steps = steps
+        self.status = PENDING
+        self.results = {}
+        self.errors = {}
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self) -> dict:
+        return {
+            "request_id": self.request_id,
+            "status": self.status,
+            "results": self.results,
+            "errors": self.errors,
+            "seconds": round((self.finished_at or time.time()) - self.started_at, 3)
+        }
+
+
+class RefinementStore:
+    """Thread-safe, expiring store of refinements keyed by request id"""
+
+    def __init__(self, ttl_seconds: float = 3600.0, max_refinements: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_refinements = max_refinements
+        self._lock = threading.Lock()
+        self._refinements = {}
+
+    def start(self, request_id: str, steps: dict, run_query: Callable, session_id: str = None) -> Refinement:
+        """Re-run steps ({step key: SQL}) with run_query(sql) -> DataFrame on a daemon thread"""
+        refinement = Refinement(request_id, steps, session_id)
+        with self._lock:
+            self._expire()
+            if len(self._refinements) >= self.max_refinements:
+                oldest = min(self._refinements.values(), key=lambda item: item.started_at)
+                del self._refinements[oldest.request_id]
+            self._refinements[request_id] = refinement
+        threading.Thread(
+            target=self._run, args=(refinement, run_query), name=f"refine-{request_id}", daemon=True
+        ).start()
+        return refinement
+
+    def _run(self, refinement: Refinement, run_query: Callable):
+        for step_key, sql in refinement.steps.items():
+            try:
+                df = run_query(sql)
+                refinement.results[step_key] = {"row_count": len(df), "results": df.to_dict("records")}
+            except Exception as e:
+                refinement.errors[step_key] = f"{type(e).__name__}: {e}"
+        refinement.finished_at = time.time()
+        refinement.status = FAILED if refinement.errors and not refinement.results else DONE
+
+    def get(self, request_id: str, session_id: str = None) -> Optional[Refinement]:
+        """Look up a refinement, optionally requiring it to belong to the session"""
+        with self._lock:
+            self._expire()
+            refinement = self._refinements.get(request_id)
+        if refinement is None or (session_id and refinement.session_id and refinement.session_id != session_id):
+            return None
+        return refinement
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        for request_id in [key for key, item in self._refinements.items() if item.started_at < cutoff]:
+            del self._refinements[request_id]
@@ -0,0 +1,123 @@
+"""
+Per-question request context for the shared Intelligence Manager
+Holds everything one solve_intelligently call mutates, scoped to the current thread or task
+"""
+
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from src.K2.aims_view.core.latency_budget import LatencyBudget
+from src.K2.aims_view.utils.memory_store import DEFAULT_SESSION_ID
+
+logger = logging.getLogger(__name__)
+
+
+class RequestContext:
+    """State of one question: session, token callback, strategy, results so far, deadline, latency budget and accuracy"""
+
+    def __init__(self, session_id: str = DEFAULT_SESSION_ID, token_callback: Optional[Callable[[str], None]] = None,
+                 request_id: str = None, event_callback: Optional[Callable[[str, dict], None]] = None,
+                 timeout: float = None, budget: LatencyBudget = None, approximate: bool = False):
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self.session_id = session_id
+        self.token_callback = token_callback
+        self.event_callback = event_callback
+        self.execution_history = []
+        self.accumulated_results = {}
+        self.current_strategy = None
+        self.started_at = time.time()
+        self.deadline = self.started_at + timeout if timeout else None
+        self.cancelled = False
+        # Soft SLA split across phases (unbounded unless the manager sets one)
+        self.budget = budget or LatencyBudget()
+        # Eligible aggregates may be answered from a sample
+        self.approximate = approximate
+        self._cleanups = []
+        self._cancel_lock = threading.Lock()
+        self._cancel_callbacks = []
+
+    def elapsed(self) -> float:
+        """Seconds since the request started"""
+        return time.time() - self.started_at
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the request deadline, or None when there is no deadline"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def expired(self) -> bool:
+        """Whether the request ran out of time or was cancelled"""
+        return self.cancelled or (self.deadline is not None and time.time() >= self.deadline)
+
+    def add_cancel_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Call callback if the request is cancelled (e.g. to cancel a running statement)
+
+        Returns a function that unregisters it; called at once if already cancelled.
+        """
+        with self._cancel_lock:
+            if not self.cancelled:
+                self._cancel_callbacks.append(callback)
+                return lambda: self._remove_cancel_callback(callback)
+        callback()
+        return lambda: None
+
+    def _remove_cancel_callback(self, callback):
+        with self._cancel_lock:
+            if callback in self._cancel_callbacks:
+                self._cancel_callbacks.remove(callback)
+
+    def cancel(self):
+        """Cancel the request: work checks cancelled, running statements are interrupted"""
+        with self._cancel_lock:
+            self.cancelled = True
+            callbacks, self._cancel_callbacks = self._cancel_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Request {self.request_id} cancel callback failed: {e}")
+
+    def emit(self, event: str, **data):
+        """Report a pipeline event (phase changes, step progress) to the caller, if listening"""
+        if self.event_callback:
+            data.setdefault("elapsed", round(self.elapsed(), 3))
+            self.event_callback(event, data)
+
+    def on_close(self, callback: Callable[[], None]):
+        """Register a cleanup to run when the request ends (e.g. deleting spill files)"""
+        self._cleanups.append(callback)
+
+    def close(self):
+        """Run registered cleanups, most recent first"""
+        while self._cleanups:
+            callback = self._cleanups.pop()
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Request {self.request_id} cleanup failed: {e}")
+
+
+# contextvars keep concurrent threads and asyncio tasks from seeing each other's request
+_current_request = contextvars.ContextVar("aims_request_context", default=None)
+
+
+def get_request_context() -> Optional[RequestContext]:
+    """Get the request context active in this thread or task, if any"""
+    return _current_request.get()
+
+
+@contextmanager
+def request_scope(context: RequestContext):
+    """Make a request context current for the duration of the block, closing it afterwards"""
+    token = _current_request.set(context)
+    try:
+        yield context
+    finally:
+        _current_request.reset(token)
+        context.close()
@@ -0,0 +1,107 @@
+"""
+Import-time profile of CLI startup
+Runs fresh interpreters with -X importtime to show which imports the CLI pays for before its first
+prompt, and what the deferred imports (crewai, the Oracle driver) cost when they do load
+"""
+
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Imported by main.py before the interactive prompt
+STARTUP_MODULES = ["src.K2.aims_view.core.interactive"]
+
+# Imported on first use or by the background warm-up
+DEFERRED_MODULES = ["src.K2.aims_view.security.ssl_config", "crewai", "src.K2.aims_view.database.database"]
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.parent.parent
+CONFIG_PATH = Path(__file__).parent.parent / "config.json"
+
+
+def _run(code: str, importtime: bool = False) -> tuple:
+    """(completed process, wall seconds) of a fresh interpreter running code from the project root"""
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    start_time = time.perf_counter()
+    completed = subprocess.run(command, cwd=PROJECT_ROOT, capture_output=True, text=True)
+    return completed, time.perf_counter() - start_time
+
+
+def profile_imports(modules: list) -> dict:
+    """Per-module import times (ms) for importing modules in a fresh interpreter"""
+    completed, seconds = _run("; ".join(f"import {module}" for module in modules), importtime=True)
+    imports, errors = [], []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        imports.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": int(fields[0]) / 1000,
+            "cumulative_ms": int(fields[1]) / 1000
+        })
+    return {
+        "modules": modules,
+        "seconds": round(seconds, 3),
+        "import_ms": round(sum(item["self_ms"] for item in imports), 1),
+        "imports": imports,
+        "error": "\n".join(errors[-5:]) if completed.returncode else None
+    }
+
+
+def time_to_prompt() -> dict:
+    """Wall time for a fresh interpreter to import the CLI and build the manager (what precedes the prompt)"""
+    # The conversation memory goes to a throwaway directory so profiling leaves the real store alone
+    with tempfile.TemporaryDirectory() as memory_dir:
+        code = (
+            "import json; "
+            "from src.K2.aims_view.core.interactive import IntelligentSQLManager; "
+            f"config = json.load(open({str(CONFIG_PATH)!r})); "
+            f"config.setdefault('memory', {{}}).update(store_path={str(Path(memory_dir) / 'memory.db')!r}, "
+            f"legacy_json_path={str(Path(memory_dir) / 'memory.json')!r}); "
+            "IntelligentSQLManager(config)"
+        )
+        completed, seconds = _run(code)
+    return {"seconds": round(seconds, 3), "error": completed.stderr.strip()[-500:] if completed.returncode else None}
+
+
+def format_profile(profile: dict, title: str, top: int = 15) -> str:
+    """Report of a profile: top-level imports by cumulative time, then the slowest modules by self time"""
+    lines = [f"{title}: {profile['seconds']}s wall, {profile['import_ms']:.0f}ms importing ({', '.join(profile['modules'])})"]
+    if profile["error"]:
+        lines.append(f"  ⚠️  import failed: {profile['error']}")
+    roots = sorted((item for item in profile["imports"] if item["depth"] == 0),
+                   key=lambda item: item["cumulative_ms"], reverse=True)
+    lines.append("  Top-level imports (cumulative):")
+    lines.extend(f"    {item['cumulative_ms']:9.1f}ms  {item['module']}" for item in roots[:top])
+    slowest = sorted(profile["imports"], key=lambda item: item["self_ms"], reverse=True)
+    lines.append("  Slowest modules (self):")
+    lines.extend(f"    {item['self_ms']:9.1f}ms  {item['module']}" for item in slowest[:top])
+    return "\n".join(lines)
+
+
+def startup_report(top: int = 15) -> str:
+    """Import profile of the startup path and of the deferred imports, plus time to prompt"""
+    startup = profile_imports(STARTUP_MODULES)
+    prompt = time_to_prompt()
+    sections = [format_profile(startup, "Startup imports", top)]
+    # Each deferred module in its own interpreter, so one missing package does not hide the others
+    sections.extend(
+        format_profile(profile_imports([module]), "Deferred import (first use / background warm-up)", top)
+        for module in DEFERRED_MODULES
+    )
+    sections += [
+        f"Time to prompt (interpreter start, imports, manager construction): {prompt['seconds']}s"
+        + (f"\n  ⚠️  {prompt['error']}" if prompt["error"] else "")
+    ]
+    heavy = [name for name in ("crewai", "litellm", "cx_Oracle", "pandas", "numpy", "torch", "transformers")
+             if any(item["module"] == name for item in startup["imports"])]
+    if heavy:
+        sections.append(f"⚠️  Heavy packages still imported at startup: {', '.join(heavy)}")
+    return "\n\n".join(sections)
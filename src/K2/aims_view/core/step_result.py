@@ -0,0 +1,185 @@
+"""
+Typed store for executed query step results
+Column metadata, schema fingerprint and summaries are derived once per step and shared by every phase
+"""
+
+import hashlib
+from typing import Optional
+
+
+def _column_kind(dtype) -> str:
+    """Map a pandas dtype to the coarse kind used in summaries"""
+    kind = getattr(dtype, "kind", "O")
+    if kind in "iuf":
+        return "numeric"
+    if kind == "b":
+        return "boolean"
+    if kind in "mM":
+        return "datetime"
+    return "text"
+
+
+def schema_fingerprint(columns: list, column_types: dict) -> str:
+    """Short stable hash of a result's column names and kinds"""
+    signature = "|".join(f"{column}:{column_types.get(column, 'text')}" for column in columns)
+    return hashlib.sha1(signature.encode("utf-8")).hexdigest()[:16]
+
+
+class StepResult:
+    """One executed query step, readable like the step_result dict it replaces
+
+    Dict-style access ('results', 'row_count', 'error', ...) is kept so the
+    evaluator, renderers and API code work unchanged; summaries used by the
+    prompt builders are computed on first use and cached.
+    """
+
+    __slots__ = (
+        "step_key", "query", "rows", "row_count", "columns", "column_types", "fingerprint",
+        "step_description", "retry_attempts", "result_handle", "error", "row_limit", "approximation",
+        "_summaries"
+    )
+
+    # Dict keys exposed through __getitem__ / get, mapped to slot names
+    FIELDS = {
+        "query": "query",
+        "results": "rows",
+        "row_count": "row_count",
+        "step_description": "step_description",
+        "retry_attempts": "retry_attempts",
+        "result_handle": "result_handle",
+        "error": "error",
+        "columns": "columns",
+        "schema_fingerprint": "fingerprint",
+        "row_limit": "row_limit",
+        "approximation": "approximation"
+    }
+
+    def __init__(self, step_key: str, query: str, rows=None, row_count: int = 0, columns: list = None,
+                 column_types: dict = None, step_description: str = None, retry_attempts: int = 1,
+                 result_handle: str = None, error: str = None, row_limit: int = None,
+                 approximation: str = None):
+        self.step_key = step_key
+        self.query = query
+        self.rows = rows
+        self.row_count = row_count
+        self.columns = list(columns or [])
+        self.column_types = column_types or {}
+        self.fingerprint = schema_fingerprint(self.columns, self.column_types) if self.columns else None
+        self.step_description = step_description
+        self.retry_attempts = retry_attempts
+        self.result_handle = result_handle
+        self.error = error
+        # Set when the cost gate cut the result to its first row_limit rows
+        self.row_limit = row_limit
+        # Error-bound note when some values are estimates rather than exact
+        self.approximation = approximation
+        self._summaries = {}
+
+    @classmethod
+    def from_dataframe(cls, step_key: str, query: str, df, rows, **kwargs) -> "StepResult":
+        """Build a successful step from its DataFrame (for metadata) and the rows to keep"""
+        columns = [str(column) for column in getattr(df, "columns", [])]
+        dtypes = getattr(df, "dtypes", {})
+        column_types = {str(column): _column_kind(dtypes[column]) for column in getattr(df, "columns", [])}
+        kwargs.setdefault("row_limit", getattr(df, "attrs", {}).get("row_limit"))
+        kwargs.setdefault("approximation", getattr(df, "attrs", {}).get("approximation"))
+        return cls(step_key, query, rows=rows, row_count=len(df), columns=columns, column_types=column_types, **kwargs)
+
+    @classmethod
+    def failed(cls, step_key: str, query: str, error: str, **kwargs) -> "StepResult":
+        """Build a step whose query failed on every attempt"""
+        return cls(step_key, query, error=error, **kwargs)
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+    # Dict-style access for code written against plain step_result dicts
+
+    def _present(self, key: str) -> bool:
+        if key not in self.FIELDS:
+            return False
+        if key == "results":
+            return self.succeeded
+        if key in ("error", "result_handle", "schema_fingerprint", "row_limit", "approximation"):
+            return getattr(self, self.FIELDS[key]) is not None
+        return True
+
+    def __contains__(self, key) -> bool:
+        return self._present(key)
+
+    def __getitem__(self, key):
+        if not self._present(key):
+            raise KeyError(key)
+        return getattr(self, self.FIELDS[key])
+
+    def get(self, key, default=None):
+        return self[key] if self._present(key) else default
+
+    def keys(self) -> list:
+        return [key for key in self.FIELDS if self._present(key)]
+
+    def items(self) -> list:
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+    # Summaries are computed once and reused by every prompt builder
+
+    def sample_row(self) -> Optional[dict]:
+        """First row as a dict, or None for empty and failed steps"""
+        if "sample_row" not in self._summaries:
+            rows = self.rows if self.succeeded else None
+            self._summaries["sample_row"] = rows[0] if rows else None
+        return self._summaries["sample_row"]
+
+    def numeric_sample(self) -> dict:
+        """Numeric values of the first row, keyed by column"""
+        if "numeric_sample" not in self._summaries:
+            sample = self.sample_row() or {}
+            self._summaries["numeric_sample"] = {
+                column: value for column, value in sample.items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)
+            }
+        return self._summaries["numeric_sample"]
+
+    def context_line(self) -> str:
+        """One-line description used when designing later steps' queries"""
+        if "context_line" not in self._summaries:
+            line = f"- {self.step_key}: {self.row_count} rows"
+            if self.row_limit:
+                line += " (truncated by row limit)"
+            if self.approximation:
+                line += " (approximate)"
+            if self.row_count > 0 and self.columns:
+                line += f", columns: {self.columns}"
+            self._summaries["context_line"] = line
+        return self._summaries["context_line"]
+
+    def data_source_summary(self) -> str:
+        """Block describing this step as an input to computational analysis"""
+        if "data_source" not in self._summaries:
+            summary = f"\n{self.step_key.upper()} ({self.row_count} rows):\n"
+            summary += f"  Description: {self.step_description or 'Query results'}\n"
+            if self.columns:
+                summary += f"  Columns: {self.columns}\n"
+            if self.numeric_sample():
+                summary += f"  Sample numeric values: {self.numeric_sample()}\n"
+            self._summaries["data_source"] = summary
+        return self._summaries["data_source"]
+
+    def rows_summary(self, max_rows: int = None) -> str:
+        """Row listing used for response generation (all rows unless max_rows is given)"""
+        cache_key = ("rows", max_rows)
+        if cache_key not in self._summaries:
+            rows = self.rows if self.succeeded and self.rows else []
+            shown = rows if max_rows is None else rows[:max_rows]
+            lines = [f"  Row {i+1}: {str(row)}\n" for i, row in enumerate(shown)]
+            if len(shown) < self.row_count:
+                lines.append(f"  ... {self.row_count - len(shown)} more rows not shown\n")
+            self._summaries[cache_key] = "".join(lines)
+        return self._summaries[cache_key]
@@ -0,0 +1,260 @@
+"""
+Approximate execution mode for exploratory aggregates
+Eligible SUM/COUNT/AVG queries read an Oracle SAMPLE of AIMS_ALL_DATA; sums and counts are scaled back up
+and returned with the half-width of their confidence interval
+"""
+
+import logging
+import math
+import statistics
+import threading
+from typing import Callable
+
+from src.K2.aims_view.database.errors import QueryCancelledError, QueryTimeoutError, SecurityException
+from src.K2.aims_view.database.local_replica import REPLICA_TABLE
+from src.K2.aims_view.database.sql_analyzer import FROM_TERMINATORS, QUOTED, WORD, SQLAnalysis
+
+logger = logging.getLogger(__name__)
+
+# Accuracy levels accepted by SecureOracleDBUtils._safe_execute_query
+APPROXIMATE = "approximate"  # sampling allowed
+DEFAULT = "default"          # exact, or a cube answer with documented sketch error bounds
+EXACT = "exact"              # exact only
+
+# Aggregates whose sample value does not estimate the full-table value
+UNSCALABLE_FUNCTIONS = frozenset({
+    "MIN", "MAX", "MEDIAN", "PERCENTILE_CONT", "PERCENTILE_DISC", "STDDEV", "VARIANCE", "LISTAGG",
+    "RANK", "DENSE_RANK", "ROW_NUMBER", "NTILE", "APPROX_COUNT_DISTINCT", "COLLECT", "STATS_MODE"
+})
+
+# Suffix of the margin-of-error column added next to each scaled sum or count
+MARGIN_SUFFIX = "_MARGIN"
+
+
+class SampleIneligible(Exception):
+    """Raised while rewriting a query whose answer cannot be estimated from a sample"""
+    pass
+
+
+class SampleQuery:
+    """A query rewritten to read a sample, plus what is needed to finish its result"""
+
+    def __init__(self, sql: str, original: str, percent: float, method: str, margins: dict):
+        self.sql = sql
+        self.original = original
+        self.percent = percent
+        self.method = method
+        # output column -> (hidden column, "sum" | "count")
+        self.margins = margins
+
+    @property
+    def fraction(self) -> float:
+        return self.percent / 100.0
+
+
+def _closing_paren(tokens: list, i: int) -> int:
+    """Index of the ')' matching the '(' at tokens[i]"""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j].value == "(":
+            depth += 1
+        elif tokens[j].value == ")":
+            depth -= 1
+            if depth == 0:
+                return j
+    raise SampleIneligible("unbalanced parentheses")
+
+
+def _select_item_name(tokens: list, start: int, end: int):
+    """(output column name, whether an alias follows) of a whole select-list item, else (None, False)"""
+    before = tokens[start - 1] if start > 0 else None
+    after = tokens[end] if end < len(tokens) else None
+    if before is None or not (before.is_word("SELECT", "DISTINCT") or before.value == ","):
+        return None, False
+    if after is None or after.value == "," or after.is_word("FROM"):
+        return "".join(token.value for token in tokens[start:end]).upper().replace('"', ""), False
+    alias = tokens[end + 1] if after.is_word("AS") and end + 1 < len(tokens) else after
+    if alias.kind == QUOTED:
+        return alias.value.strip('"'), True
+    if alias.kind == WORD:
+        return alias.upper, True
+    return None, False
+
+
+class ApproximateMode:
+    """Rewrites aggregate SQL onto a sample and turns sample totals into estimates
+
+    Sums and counts are divided by the sampling fraction q. Their margin uses
+    the Horvitz-Thompson variance estimate (1 - q) / q^2 * sum(y^2) over the
+    sampled rows, which assumes rows are sampled independently: exact for
+    SAMPLE (row sampling), optimistic for SAMPLE BLOCK when values cluster by
+    block. Averages and ratios of sums need no scaling and get no margin.
+    """
+
+    def __init__(self, enabled: bool = True, sample_percent: float = 5.0, sample_method: str = "block",
+                 seed: int = None, confidence: float = 0.95, refine_in_background: bool = True):
+        self.enabled = enabled
+        self.sample_percent = sample_percent
+        # "block" reads only the sampled blocks; "row" reads every block but samples rows independently
+        self.sample_method = sample_method
+        self.seed = seed
+        self.confidence = confidence
+        self.z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+        self.refine_in_background = refine_in_background
+        self._stats_lock = threading.Lock()
+        self._stats = {"sampled": 0, "ineligible": 0}
+
+    @classmethod
+    def from_config(cls, config: dict = None) -> "ApproximateMode":
+        """Build the mode from the database.approximate config block"""
+        approximate_config = (config or {}).get("approximate", {})
+        return cls(
+            enabled=approximate_config.get("enabled", True),
+            sample_percent=approximate_config.get("sample_percent", 5.0),
+            sample_method=approximate_config.get("sample_method", "block"),
+            seed=approximate_config.get("seed"),
+            confidence=approximate_config.get("confidence", 0.95),
+            refine_in_background=approximate_config.get("refine_in_background", True)
+        )
+
+    def _sample_clause(self) -> str:
+        clause = "SAMPLE BLOCK" if self.sample_method == "block" else "SAMPLE"
+        clause += f" ({self.sample_percent:g})"
+        if self.seed is not None:
+            clause += f" SEED ({int(self.seed)})"
+        return clause
+
+    def rewrite(self, analysis: SQLAnalysis) -> SampleQuery:
+        """Rewrite a query to read a sample and scale its sums and counts; raises SampleIneligible"""
+        if analysis.tables != {REPLICA_TABLE} or analysis.ctes:
+            raise SampleIneligible("query reads something other than AIMS_ALL_DATA")
+        tokens = analysis.tokens
+        if sum(1 for token in tokens if token.is_word("SELECT")) != 1:
+            raise SampleIneligible("subqueries are not sampled")
+        for token in tokens:
+            if token.is_word("HAVING", "OVER", "UNION", "INTERSECT", "MINUS", "CONNECT"):
+                raise SampleIneligible(f"{token.upper} is not sampled")
+            if token.kind == WORD and token.upper in UNSCALABLE_FUNCTIONS:
+                raise SampleIneligible(f"{token.upper} cannot be estimated from a sample")
+
+        scale = f"{100.0 / self.sample_percent:g}"
+        table_name = REPLICA_TABLE.split(".")[-1]
+        output, hidden, margins, aggregated, depth, i = [], [], {}, False, 0, 0
+        in_from = expect_table = False
+        while i < len(tokens):
+            token = tokens[i]
+            if token.is_word("SUM", "COUNT") and i + 1 < len(tokens) and tokens[i + 1].value == "(":
+                end = _closing_paren(tokens, i + 1)
+                inner = tokens[i + 2:end]
+                if inner and inner[0].is_word("DISTINCT"):
+                    raise SampleIneligible("distinct aggregates cannot be scaled from a sample")
+                call = " ".join(t.value for t in tokens[i:end + 1])
+                name, aliased = _select_item_name(tokens, i, end + 1)
+                if token.is_word("SUM"):
+                    output.append(f"({call} * {scale})")
+                    variance_term = f"SUM(POWER({' '.join(t.value for t in inner)}, 2))"
+                else:
+                    output.append(f"ROUND({call} * {scale})")
+                    variance_term = call
+                if name is not None:
+                    hidden_column = f"__SAMPLE_{len(margins) + 1}"
+                    hidden.append(f'{variance_term} AS "{hidden_column}"')
+                    margins[name] = (hidden_column, token.upper.lower())
+                    if not aliased:
+                        # Keep the column name Oracle would have given the original expression
+                        output.append(f'AS "{name}"')
+                aggregated = True
+                i = end + 1
+                continue
+            if token.is_word("AVG"):
+                aggregated = True
+            if token.value == "(":
+                depth += 1
+            elif token.value == ")":
+                depth -= 1
+            if token.is_word("FROM") and depth == 0 and hidden:
+                output.append(", " + ", ".join(hidden))
+                hidden = []
+            output.append(token.value)
+            if depth == 0 and token.is_word("FROM", "JOIN"):
+                in_from = expect_table = True
+            elif depth == 0 and in_from and token.value == ",":
+                expect_table = True
+            elif depth == 0 and token.kind == WORD and token.upper in FROM_TERMINATORS:
+                in_from = False
+            elif expect_table and token.kind in (WORD, QUOTED) and not (i + 1 < len(tokens) and tokens[i + 1].value == "."):
+                # Last part of a table reference in the FROM list - the sample clause goes before any alias
+                # (column qualifiers such as AIMS_ALL_DATA.DOC_BRANCH are left alone)
+                expect_table = False
+                if token.value.strip('"').upper() == table_name:
+                    output.append(self._sample_clause())
+            i += 1
+
+        if not aggregated:
+            raise SampleIneligible("not an aggregate query")
+        return SampleQuery(" ".join(output), analysis.sql, self.sample_percent, self.sample_method, margins)
+
+    def try_rewrite(self, analysis: SQLAnalysis):
+        """SampleQuery for an eligible query, else None (run exactly)"""
+        if not self.enabled:
+            return None
+        try:
+            sample_query = self.rewrite(analysis)
+        except SampleIneligible as e:
+            with self._stats_lock:
+                self._stats["ineligible"] += 1
+            logger.info(f"Approximate mode skipped, running exactly: {e}")
+            return None
+        with self._stats_lock:
+            self._stats["sampled"] += 1
+        return sample_query
+
+    def execute(self, sample_query: SampleQuery, run_query: Callable):
+        """Run a sampled query with run_query(sql) -> DataFrame and finish its estimates
+
+        If Oracle rejects the sampled SQL the exact query runs instead. Timeouts
+        and cancellations are raised as they are: the exact query would scan
+        more under the same deadline, or for a request nobody is waiting for.
+        """
+        try:
+            df = run_query(sample_query.sql)
+        except (QueryTimeoutError, QueryCancelledError):
+            raise
+        except SecurityException:
+            logger.warning("Sampled query failed, running it exactly")
+            return run_query(sample_query.original)
+        return self.finish(df, sample_query)
+
+    def finish(self, df, sample_query: SampleQuery):
+        """Replace hidden variance columns with margin columns and describe the estimate"""
+        q = sample_query.fraction
+        for name, (hidden_column, kind) in sample_query.margins.items():
+            if hidden_column not in df.columns:
+                continue
+            if name in df.columns:
+                position = list(df.columns).index(name) + 1
+                margins = [
+                    None if value is None or value != value else self.z * math.sqrt((1 - q) / (q * q) * float(value))
+                    for value in df[hidden_column]
+                ]
+                if kind == "count":
+                    margins = [None if margin is None else int(math.ceil(margin)) for margin in margins]
+                df.insert(position, f"{name}{MARGIN_SUFFIX}", margins)
+            df = df.drop(columns=[hidden_column])
+
+        method = "block" if sample_query.method == "block" else "row"
+        note = (f"estimated from a {sample_query.percent:g}% {method} sample of AIMS_ALL_DATA with sums and counts "
+                f"scaled by {1 / q:g}x")
+        if sample_query.margins:
+            note += (f"; each {MARGIN_SUFFIX} column is the ± margin at {self.confidence:.0%} confidence"
+                     + (" (assuming rows are independent of their storage block)" if method == "block" else ""))
+        note += "; groups too small to be sampled may be missing"
+        df.attrs["approximation"] = note
+        df.attrs["sampled"] = {"percent": sample_query.percent, "method": method, "exact_sql": sample_query.original}
+        return df
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update(enabled=self.enabled, sample_percent=self.sample_percent, sample_method=self.sample_method)
+        return stats
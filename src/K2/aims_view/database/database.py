@@ -4,10 +4,22 @@ import pandas as pd
 import re
 import logging
 import hashlib
+import threading
 import time
+import uuid
 
 from dotenv import load_dotenv
 
+from src.K2.aims_view.database.errors import QueryCancelledError, QueryTimeoutError, SecurityException
+from src.K2.aims_view.database.sql_analyzer import SQLAnalysis, SQLAnalysisError, analyze_sql
+from src.K2.aims_view.database.sql_rewriter import RewriteResult, SQLRewriter
+from src.K2.aims_view.database.query_guard import PLAN_COLUMNS, PlanEstimate, QueryGuard
+from src.K2.aims_view.database.local_replica import LocalReplica
+from src.K2.aims_view.database.kpi_cube import KPICube
+from src.K2.aims_view.database.approximate import APPROXIMATE, DEFAULT, EXACT, ApproximateMode
+from src.K2.aims_view.database.query_cache import QueryResultCache
+from src.K2.aims_view.database.single_flight import SingleFlight
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -20,9 +32,8 @@ db_user = os.getenv('DB_USER_CORE')
 db_password = os.getenv('DB_PASSWORD_CORE')
 db_port = os.getenv('DB_PORT_CORE')
 
-class SecurityException(Exception):
-    """Custom exception for security-related errors"""
-    pass
+# Oracle / driver errors meaning the call was interrupted (call timeout or cancel)
+INTERRUPTED_CALL_ERRORS = ("DPI-1067", "ORA-03156", "ORA-01013")
 
 class InputValidator:
     """Centralized input validation and sanitization"""
@@ -128,36 +139,25 @@ class InputValidator:
         return name
     
     @staticmethod
-    def validate_sql_query(sql: str, allowed_operations: list = None) -> str:
-        """Validate SQL query for read_the_view method"""
-        if not sql or not isinstance(sql, str):
-            raise SecurityException("SQL query must be a non-empty string")
-        
-        # Default allowed operations (only SELECT for safety)
+    def analyze_sql_query(sql: str, allowed_operations: list = None) -> SQLAnalysis:
+        """Tokenize and structurally check a query (single read-only statement on allowed tables)"""
         if allowed_operations is None:
             allowed_operations = ['SELECT']
         
-        sql = sql.strip().upper()
-        
-        # Check if query starts with allowed operations
-        if not any(sql.startswith(op) for op in allowed_operations):
-            raise SecurityException(f"SQL query must start with one of: {allowed_operations}")
-        
-        # Dangerous patterns to block
-        dangerous_patterns = [
-            r'\b(INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|TRUNCATE|EXEC|EXECUTE)\b',
-            r'\b(GRANT|REVOKE)\b',
-            r'\b(DECLARE|CURSOR)\b',
-            r'(;.*SELECT|SELECT.*;)',  # Multiple statements
-            r'(--|/\*)',  # SQL comments
-            r'\b(xp_|sp_)\w+',  # System procedures
-        ]
+        try:
+            analysis = analyze_sql(sql)
+        except SQLAnalysisError as e:
+            raise SecurityException(str(e))
         
-        for pattern in dangerous_patterns:
-            if re.search(pattern, sql):
-                raise SecurityException("SQL query contains prohibited operations")
+        if analysis.statement_type not in allowed_operations:
+            raise SecurityException(f"SQL query must be one of: {allowed_operations}")
         
-        return sql
+        return analysis
+    
+    @staticmethod
+    def validate_sql_query(sql: str, allowed_operations: list = None) -> str:
+        """Validate SQL query for read_the_view method, returning it without a trailing semicolon"""
+        return InputValidator.analyze_sql_query(sql, allowed_operations).sql
 
 class RateLimiter:
     """Simple in-memory rate limiter"""
@@ -187,7 +187,7 @@ class RateLimiter:
 
 class SecureOracleDBUtils:
     
-    def __init__(self, connection_string: dict = None):
+    def __init__(self, connection_string: dict = None, config: dict = None):
         if not connection_string:
             self.connection_string = {
                 "user": db_user, 
@@ -203,6 +203,34 @@ class SecureOracleDBUtils:
         self.validator = InputValidator()
         self.rate_limiter = RateLimiter()
         
+        # Sargable predicate rewriting (settings from the "database" config block)
+        self.rewriter = SQLRewriter.from_config(config)
+        
+        # Optional EXPLAIN PLAN cost gate before executing generated queries
+        self.query_guard = QueryGuard.from_config(config)
+        
+        # Default per-query call timeout in seconds (0 disables)
+        self.query_timeout = (config or {}).get("query_timeout_seconds", 60)
+        
+        # Optional DuckDB/Parquet replica that answers read-only aggregates instead of Oracle
+        self.replica = LocalReplica.from_config(config, source=self)
+        
+        # Optional nightly KPI cube; metric aggregates it covers never reach the replica or Oracle
+        self.kpi_cube = KPICube.from_config(config, source=self)
+        
+        # Sampling rewrite used when a request asks for approximate answers
+        self.approximate = ApproximateMode.from_config(config)
+        
+        # Results shared by identical queries (normalized fingerprint + literals), e.g. across a batch run
+        self.result_cache = QueryResultCache.from_config(config)
+        
+        # Concurrent identical queries (e.g. from parallel batch questions) share one execution
+        self.single_flight = SingleFlight.from_config(config)
+        
+        # Upper bound on Oracle statements running at once from this process (0 = unlimited)
+        max_concurrent_queries = (config or {}).get("max_concurrent_queries", 0)
+        self._query_slots = threading.BoundedSemaphore(max_concurrent_queries) if max_concurrent_queries else None
+        
         # Validate connection parameters
         self._validate_connection_params()
     
@@ -289,12 +317,198 @@ class SecureOracleDBUtils:
             else:
                 raise SecurityException("Database connection failed due to unexpected error.")
     
-    def _safe_execute_query(self, sql: str, params: dict = None) -> pd.DataFrame:
-        """Safely execute a query with proper error handling and Unicode support"""
+    def prepare_query(self, sql: str) -> RewriteResult:
+        """Validate a query and apply sargable predicate rewrites"""
+        # Rejected queries raise here with the reason, so callers can feed it back to the LLM
+        analysis = self.validator.analyze_sql_query(sql)
+        logger.debug(f"Preparing query fingerprint {analysis.fingerprint}")
+        
+        rewrite = self.rewriter.rewrite(analysis)
+        if rewrite.changed:
+            # The rewritten text must pass the same checks as the original
+            self.validator.analyze_sql_query(rewrite.sql)
+            logger.info(f"Rewrote query predicates: {', '.join(rewrite.rules)}")
+        return rewrite
+    
+    def _safe_execute_query(self, sql: str, params: dict = None, timeout: float = None,
+                            cancel_scope=None, accuracy: str = DEFAULT) -> pd.DataFrame:
+        """Safely execute a query with proper error handling and Unicode support
+        
+        timeout (seconds, default query_timeout) bounds each database call; cancel_scope
+        is a RequestContext whose cancel() interrupts the running statement.
+        accuracy "approximate" lets eligible aggregates read a sample, "exact" rules out
+        sketch estimates from the KPI cube.
+        """
+        rewrite = self.prepare_query(sql)
+        if not (self.result_cache.enabled or self.single_flight.enabled):
+            return self._execute_prepared(rewrite, params, timeout, cancel_scope, accuracy)
+        
+        analysis = analyze_sql(rewrite.sql)
+        cache_key = QueryResultCache.key(analysis, params, accuracy)
+        if self.result_cache.enabled:
+            df = self.result_cache.get(cache_key)
+            if df is None:
+                df = self.result_cache.get_filtered(analysis, params, accuracy)
+                if df is not None:
+                    logger.info("Query answered by filtering a cached broader GROUP BY result")
+            else:
+                logger.info("Query result served from the shared result cache")
+            if df is not None:
+                return df
+        
+        def execute():
+            df = self._execute_prepared(rewrite, params, timeout, cancel_scope, accuracy)
+            if self.result_cache.enabled:
+                self.result_cache.put(cache_key, df)
+            return df
+        
+        # A waiter gives up at its own call timeout or request deadline, whichever comes first
+        limits = [limit for limit in (self.query_timeout if timeout is None else timeout,
+                                      cancel_scope.remaining() if cancel_scope is not None else None) if limit is not None]
+        return self.single_flight.run(
+            cache_key, execute,
+            check_cancelled=lambda: self._check_cancelled(cancel_scope),
+            retry_errors=(QueryCancelledError, QueryTimeoutError),
+            deadline=time.time() + min(limits) if limits else None
+        )
+    
+    def _check_cancelled(self, cancel_scope):
+        """Raise QueryCancelledError if the request was cancelled"""
+        if cancel_scope is not None and cancel_scope.cancelled:
+            raise QueryCancelledError("The request was cancelled while waiting for a shared query.")
+    
+    def _execute_prepared(self, rewrite: RewriteResult, params: dict, timeout: float, cancel_scope,
+                          accuracy: str) -> pd.DataFrame:
+        """Run a validated query on the KPI cube, the replica, a sample or Oracle"""
+        if (self.kpi_cube.enabled or self.replica.enabled) and not params:
+            analysis = analyze_sql(rewrite.sql)
+            if self.kpi_cube.enabled:
+                df = self.kpi_cube.try_query(analysis, allow_estimates=accuracy != EXACT)
+                if df is not None:
+                    return df
+            if self.replica.enabled:
+                df = self.replica.try_query(analysis)
+                if df is not None:
+                    return df
+        
+        def run(sql: str) -> pd.DataFrame:
+            row_limit = None
+            if self.query_guard.enabled:
+                sql, row_limit = self._apply_query_guard(sql)
+            df = self._fetch_dataframe(sql, params, timeout, cancel_scope)
+            if row_limit:
+                df.attrs["row_limit"] = row_limit
+            return df
+        
+        if accuracy == APPROXIMATE:
+            sample_query = self.approximate.try_rewrite(analyze_sql(rewrite.sql))
+            if sample_query is not None:
+                logger.info(f"Approximate mode: reading a {sample_query.percent:g}% sample")
+                return self.approximate.execute(sample_query, run)
+        
+        start_time = time.time()
+        df = run(rewrite.sql)
+        
+        if rewrite.changed:
+            rewritten_seconds = time.time() - start_time
+            original_seconds = None
+            if self.rewriter.compare_original:
+                # Benchmark mode: also run the unrewritten query to measure the gain
+                start_time = time.time()
+                self._fetch_dataframe(rewrite.original, params, timeout, cancel_scope)
+                original_seconds = time.time() - start_time
+            self.rewriter.record_timing(rewrite, rewritten_seconds, original_seconds)
+        
+        return df
+    
+    def explain_query(self, sql: str) -> PlanEstimate:
+        """Get the optimizer's cost and row estimates for a query without running it"""
+        statement_id = f"k2_{uuid.uuid4().hex[:24]}"
         connection = None
         cursor = None
         try:
             connection = self.connect_to_database(debug_mode=False)
+            self._start_call(connection)
+            cursor = connection.cursor()
+            cursor.execute(f"EXPLAIN PLAN SET STATEMENT_ID = '{statement_id}' FOR {sql}")
+            cursor.execute(
+                f"SELECT {', '.join(PLAN_COLUMNS)} FROM PLAN_TABLE WHERE STATEMENT_ID = :statement_id ORDER BY ID",
+                {"statement_id": statement_id}
+            )
+            rows = [dict(zip(PLAN_COLUMNS, row)) for row in cursor.fetchall()]
+            # Discard this statement's PLAN_TABLE rows
+            connection.rollback()
+            return PlanEstimate(rows)
+        
+        except cx_Oracle.Error as e:
+            error_code = str(e).split(':')[0] if ':' in str(e) else 'Unknown'
+            logger.error(f"EXPLAIN PLAN failed with error code: {error_code}")
+            raise SecurityException("Query plan could not be estimated.")
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+    
+    def _apply_query_guard(self, sql: str) -> tuple:
+        """Check a query's plan, returning the SQL to run and the row limit applied (if any)
+        
+        Raises QueryPlanRejected when the plan is over the configured limits.
+        """
+        try:
+            plan = self.explain_query(sql)
+        except SecurityException:
+            # The gate is advisory infrastructure - a missing PLAN_TABLE must not block queries
+            logger.warning("Running query without cost gate because EXPLAIN PLAN failed")
+            return sql, None
+        
+        logger.info(f"Query plan: {plan.summary()}")
+        row_limit = self.query_guard.check(plan)
+        if row_limit:
+            logger.warning(f"Query limited to {row_limit} rows by the cost gate ({plan.summary()})")
+            return self.query_guard.limit_sql(sql, row_limit), row_limit
+        return sql, None
+    
+    def _start_call(self, connection, timeout: float = None, cancel_scope=None):
+        """Apply the call timeout and hook request cancellation; returns the cancel hook remover"""
+        timeout = self.query_timeout if timeout is None else timeout
+        if timeout:
+            try:
+                # Each round trip is interrupted server-side once it runs past the timeout
+                connection.callTimeout = max(1, int(timeout * 1000))
+            except AttributeError:
+                logger.warning("Oracle client does not support call timeouts - query runs unbounded")
+        if cancel_scope is None:
+            return lambda: None
+        if cancel_scope.cancelled:
+            raise QueryCancelledError("The request was cancelled before the query started.")
+        return cancel_scope.add_cancel_callback(connection.cancel)
+    
+    def _interrupted_error(self, error, timeout: float = None, cancel_scope=None) -> Exception:
+        """Map an Oracle error to a timeout/cancel exception, or None for other failures"""
+        message = str(error)
+        if cancel_scope is not None and cancel_scope.cancelled:
+            return QueryCancelledError("The query was cancelled because the request was cancelled.")
+        if any(code in message for code in INTERRUPTED_CALL_ERRORS):
+            timeout = self.query_timeout if timeout is None else timeout
+            return QueryTimeoutError(f"The query exceeded its {timeout:.0f}s time limit and was cancelled on the server.")
+        return None
+    
+    def _fetch_dataframe(self, sql: str, params: dict = None, timeout: float = None,
+                         cancel_scope=None) -> pd.DataFrame:
+        """Execute a prepared query and fetch all rows into a DataFrame"""
+        connection = None
+        cursor = None
+        remove_cancel_hook = lambda: None
+        slot_taken = False
+        try:
+            if self._query_slots is not None:
+                wait = self.query_timeout if timeout is None else timeout
+                slot_taken = self._query_slots.acquire(timeout=wait or None)
+                if not slot_taken:
+                    raise QueryTimeoutError(f"No database slot became free within {wait:.0f}s.")
+            connection = self.connect_to_database(debug_mode=False)
+            remove_cancel_hook = self._start_call(connection, timeout, cancel_scope)
             cursor = connection.cursor()
             
             if params:
@@ -308,7 +522,13 @@ class SecureOracleDBUtils:
             
             return df
             
+        except (QueryCancelledError, QueryTimeoutError):
+            raise
         except cx_Oracle.Error as e:
+            interrupted = self._interrupted_error(e, timeout, cancel_scope)
+            if interrupted is not None:
+                logger.warning(f"Query interrupted: {interrupted}")
+                raise interrupted
             error_code = str(e).split(':')[0] if ':' in str(e) else 'Unknown'
             logger.error(f"Query execution failed with error code: {error_code}")
             raise SecurityException("Query execution failed. Please contact administrator.")
@@ -319,11 +539,58 @@ class SecureOracleDBUtils:
             logger.error(f"Unexpected error during query execution: {type(e).__name__}")
             raise SecurityException("Query execution failed due to unexpected error.")
         finally:
+            remove_cancel_hook()
             if cursor:
                 cursor.close()
             if connection:
                 connection.close()
+            if slot_taken:
+                self._query_slots.release()
     
+    def iter_query(self, sql: str, params: dict = None, batch_size: int = 5000, timeout: float = None):
+        """Stream query rows in batches with fetchmany, yielding (columns, rows) tuples
+
+        Only one batch is held in memory at a time; the connection is closed
+        when the generator is exhausted or closed. timeout bounds each fetch call.
+        """
+        sql = self.prepare_query(sql).sql
+        connection = None
+        cursor = None
+        try:
+            connection = self.connect_to_database(debug_mode=False)
+            self._start_call(connection, timeout)
+            cursor = connection.cursor()
+            cursor.arraysize = batch_size
+
+            if params:
+                cursor.execute(sql, params)
+            else:
+                cursor.execute(sql)
+
+            columns = [desc[0] for desc in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield columns, rows
+
+        except cx_Oracle.Error as e:
+            interrupted = self._interrupted_error(e, timeout)
+            if interrupted is not None:
+                logger.warning(f"Streaming query interrupted: {interrupted}")
+                raise interrupted
+            error_code = str(e).split(':')[0] if ':' in str(e) else 'Unknown'
+            logger.error(f"Streaming query failed with error code: {error_code}")
+            raise SecurityException("Query execution failed. Please contact administrator.")
+        except UnicodeError as e:
+            logger.error(f"Unicode encoding error during streaming query: {e}")
+            raise SecurityException("Query failed due to character encoding issues. Please check the text format.")
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+
     def test_connection(self, debug_mode: bool = False) -> bool:
         """Test the database connection with optional debug information."""
         try:
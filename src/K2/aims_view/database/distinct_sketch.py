@@ -0,0 +1,193 @@
+"""
+Mergeable distinct-count sketches
+Small sets are kept exactly as 64-bit key hashes and turn into HyperLogLog registers once they outgrow
+exact_limit; either form merges with the other, so distinct counts roll up across any set of cube cells
+"""
+
+import hashlib
+import math
+from typing import Iterable
+
+EXACT = b"E"
+HLL = b"H"
+
+# Two standard errors: the estimate lies within this many sigmas of the true count 95% of the time
+CONFIDENCE_SIGMAS = 1.96
+
+
+def hash_keys(values: Iterable):
+    """64-bit hashes of key values (NULLs skipped), as a numpy uint64 array"""
+    import numpy as np
+
+    hashes = [
+        int.from_bytes(hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest(), "little")
+        for value in values if value is not None
+    ]
+    return np.array(hashes, dtype=np.uint64)
+
+
+def sorted_unique(values):
+    """Sorted distinct values (sorting is much faster than np.unique's hashing for uint64 keys)"""
+    import numpy as np
+
+    values = np.sort(values)
+    if len(values) < 2:
+        return values
+    return values[np.append(True, values[1:] != values[:-1])]
+
+
+def _sigma(x: float) -> float:
+    """Correction for empty registers in the improved HyperLogLog estimator"""
+    if x == 1:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x: float) -> float:
+    """Correction for saturated registers in the improved HyperLogLog estimator"""
+    if x == 0 or x == 1:
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+def relative_error(precision: int) -> float:
+    """Relative standard error of a HyperLogLog estimate with 2**precision registers"""
+    return 1.04 / math.sqrt(1 << precision)
+
+
+class DistinctSketch:
+    """Distinct count over a set of key hashes, exact until it exceeds exact_limit"""
+
+    def __init__(self, precision: int = 14, exact_limit: int = None, hashes=None, registers=None):
+        import numpy as np
+
+        self.precision = precision
+        # By default a hash set stays exact while it is no larger than the registers would be
+        self.exact_limit = exact_limit if exact_limit is not None else (1 << precision) // 8
+        self.hashes = None
+        self.registers = registers
+        if registers is None:
+            self.hashes = sorted_unique(hashes if hashes is not None else np.array([], dtype=np.uint64))
+            if len(self.hashes) > self.exact_limit:
+                self._promote()
+
+    @property
+    def exact(self) -> bool:
+        return self.registers is None
+
+    def _promote(self):
+        """Switch from the exact hash set to HyperLogLog registers"""
+        import numpy as np
+
+        self.registers = np.zeros(1 << self.precision, dtype=np.uint8)
+        self._add_to_registers(self.hashes)
+        self.hashes = None
+
+    def _add_to_registers(self, hashes):
+        import numpy as np
+
+        if not len(hashes):
+            return
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.int64)
+        remainder = hashes & np.uint64((1 << width) - 1)
+        # Exact bit length of the remainder (floating point log2 rounds near powers of two)
+        bit_length = np.zeros(len(hashes), dtype=np.int64)
+        for shift in (32, 16, 8, 4, 2, 1):
+            over = remainder >= (np.uint64(1) << np.uint64(shift))
+            bit_length[over] += shift
+            remainder[over] >>= np.uint64(shift)
+        bit_length += (remainder > 0)
+        rank = width - bit_length + 1
+        # Highest rank per register: sort by (register, rank) and keep each register's last entry
+        keys = np.sort(index * 64 + rank)
+        index, rank = keys >> 6, (keys & 63).astype(np.uint8)
+        last = np.append(index[1:] != index[:-1], True)
+        index, rank = index[last], rank[last]
+        self.registers[index] = np.maximum(self.registers[index], rank)
+
+    def merge(self, other: "DistinctSketch") -> "DistinctSketch":
+        """Union of two sketches with the same precision, as a new sketch"""
+        import numpy as np
+
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge sketches of precision {self.precision} and {other.precision}")
+        if self.exact and other.exact:
+            hashes = sorted_unique(np.concatenate([self.hashes, other.hashes]))
+            return DistinctSketch(self.precision, self.exact_limit, hashes=hashes)
+        merged = DistinctSketch(self.precision, self.exact_limit, registers=np.zeros(1 << self.precision, dtype=np.uint8))
+        for sketch in (self, other):
+            if sketch.exact:
+                merged._add_to_registers(sketch.hashes)
+            else:
+                np.maximum(merged.registers, sketch.registers, out=merged.registers)
+        return merged
+
+    @classmethod
+    def merge_all(cls, sketches: list, precision: int = 14, exact_limit: int = None) -> "DistinctSketch":
+        """Union of many sketches in one pass"""
+        import numpy as np
+
+        exact_limit = exact_limit if exact_limit is not None else (1 << precision) // 8
+        exact = [sketch.hashes for sketch in sketches if sketch.exact]
+        dense = [sketch.registers for sketch in sketches if not sketch.exact]
+        hashes = np.concatenate(exact) if exact else np.array([], dtype=np.uint64)
+        if not dense:
+            hashes = sorted_unique(hashes)
+            if len(hashes) <= exact_limit:
+                return cls(precision, exact_limit, hashes=hashes)
+        registers = np.maximum.reduce(dense) if dense else np.zeros(1 << precision, dtype=np.uint8)
+        merged = cls(precision, exact_limit, registers=registers.copy())
+        merged._add_to_registers(hashes)
+        return merged
+
+    def count(self) -> int:
+        """Distinct count: exact for hash sets, HyperLogLog estimate otherwise"""
+        import numpy as np
+
+        if self.exact:
+            return len(self.hashes)
+        # Ertl's improved estimator: unbiased from small to very large cardinalities without bias tables
+        registers = 1 << self.precision
+        width = 64 - self.precision
+        histogram = np.bincount(self.registers, minlength=width + 2)
+        z = registers * _tau(1 - histogram[width + 1] / registers)
+        for k in range(width, 0, -1):
+            z = 0.5 * (z + histogram[k])
+        z += registers * _sigma(histogram[0] / registers)
+        return int(round(registers * registers / (2 * math.log(2) * z)))
+
+    @property
+    def relative_error(self) -> float:
+        """Relative standard error of count() (0 while exact)"""
+        return 0.0 if self.exact else relative_error(self.precision)
+
+    def to_bytes(self) -> bytes:
+        if self.exact:
+            return EXACT + self.hashes.astype("<u8").tobytes()
+        return HLL + bytes([self.precision]) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, precision: int = 14, exact_limit: int = None) -> "DistinctSketch":
+        import numpy as np
+
+        if data[:1] == EXACT:
+            # Stored hashes are already unique and sorted
+            sketch = cls(precision, exact_limit)
+            sketch.hashes = np.frombuffer(data, dtype="<u8", offset=1).astype(np.uint64)
+            return sketch
+        return cls(data[1], exact_limit, registers=np.frombuffer(data, dtype=np.uint8, offset=2).copy())
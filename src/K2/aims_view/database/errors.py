@@ -0,0 +1,19 @@
+"""
+Database error types
+Kept apart from database.py so callers can catch them without importing the Oracle driver
+"""
+
+
+class SecurityException(Exception):
+    """Custom exception for security-related errors"""
+    pass
+
+
+class QueryTimeoutError(SecurityException):
+    """Raised when a query exceeds its call timeout and is cancelled on the server"""
+    pass
+
+
+class QueryCancelledError(SecurityException):
+    """Raised when the request that issued a query was cancelled"""
+    pass
@@ -0,0 +1,701 @@
+"""
+Pre-aggregated KPI cube over insmv.AIMS_ALL_DATA
+Additive loss ratio / premium components, distinct counts and mergeable distinct-count sketches per
+(year, LOB, product, branch, office, channel) cell, rebuilt nightly; generated metric SQL is rewritten
+onto the cube and answered with DuckDB in milliseconds
+"""
+
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+from src.K2.aims_view.database.distinct_sketch import CONFIDENCE_SIGMAS, DistinctSketch, hash_keys, sorted_unique
+from src.K2.aims_view.database.local_replica import (
+    REPLICA_SQL_WORDS, REPLICA_TABLE, collect_aliases, query_parquet, rows_to_table
+)
+from src.K2.aims_view.database.sql_analyzer import NUMBER, OP, PUNCT, QUOTED, STRING, WORD, SQLAnalysis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CUBE_DIMENSIONS = [
+    "DOC_MAJ_INS_TYPE", "DOC_MAJ_NAME", "DOC_MIN_INS_TYPE", "DOC_MIN_NAME",
+    "DOC_BRANCH", "DOC_BRANCH_NAME", "DOC_OFFICE", "DOC_OFFICE_NAME", "DOC_TYPE"
+]
+
+# Loss ratio components plus the gross written premium adjustments
+DEFAULT_CUBE_MEASURES = ["DOC_PREMIUM", "PRD_FEES4L", "PRD_NPREM7L", "PRD_NPREM8L", "PAY_AMT", "CLAIM_OS_VAL", "PAY_REC_AMT"]
+
+# Distinct counts kept per cell: name -> counted column, optionally restricted to some DOC_TYPEs
+DEFAULT_DISTINCT_COUNTS = {
+    "POLICY": {"column": "DOC_KEY_FORM", "doc_types": [1, 4]},
+    "TRANSACTION": {"column": "DOC_KEY_FORM"},
+    "CUSTOMER": {"column": "CUST_ID_NO"},
+    "COMPANY": {"column": "COMP_EID_NO"}
+}
+
+# Derived cube columns
+CELL_ID = "CELL_ID"
+YEAR_DIMENSION = "DOC_YEAR"
+CHANNEL_DIMENSION = "DOC_CHANNEL"
+DIRECT_CHANNEL = "DIRECT"
+BROKER_CHANNEL = "BROKER"
+
+# Aggregates only reach the cube through the rewrite patterns below, never on their own
+CUBE_SQL_WORDS = REPLICA_SQL_WORDS - {"COUNT", "SUM", "AVG"}
+
+CUBE_METADATA_KEY = b"k2_kpi_cube"
+
+
+class CubeIneligible(Exception):
+    """Raised while translating a query the cube cannot answer"""
+    pass
+
+
+class CubeQuery:
+    """A query translated onto the cube
+
+    When distinct counts come from sketches the DuckDB query returns the cell
+    ids of every output row; the counts, and any ORDER BY / FETCH FIRST over
+    them, are applied after merging the sketches.
+    """
+
+    def __init__(self, sql: str, sketched: bool = False, order_by: list = None, fetch: int = None):
+        self.sql = sql
+        self.sketched = sketched
+        # [(output column or 1-based position, descending)]
+        self.order_by = order_by or []
+        self.fetch = fetch
+
+
+def _seconds_until(clock_time: str) -> float:
+    """Seconds from now until the next local HH:MM"""
+    hour, minute = (int(part) for part in clock_time.split(":"))
+    now = datetime.datetime.now()
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += datetime.timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+class KPICube:
+    """Materialized metric cube and the router that answers matching SQL from it
+
+    Sums are additive across cells. A distinct count is summed across cells
+    when the build verified that no key falls in two cells; otherwise the
+    cells' sketches are merged, which is exact for small sets and a
+    HyperLogLog estimate (relative standard error 1.04/sqrt(2**precision),
+    0.8% at the default precision 14) for large ones.
+    """
+
+    def __init__(self, enabled: bool = False, cube_path: str = "data/kpi_cube.parquet", dimensions: List[str] = None,
+                 measures: List[str] = None, year_column: str = "DOC_REG_DT", channel_column: str = "DOC_AGENT_NAME",
+                 distinct_counts: dict = None, sketch_precision: int = 14, exact_sketch_limit: int = None,
+                 refresh_at: str = "02:00", max_staleness_seconds: float = 129600, build_timeout_seconds: float = 3600,
+                 source=None):
+        self.cube_path = cube_path
+        self.dimensions = [column.upper() for column in (dimensions or DEFAULT_CUBE_DIMENSIONS)]
+        self.measures = [column.upper() for column in (measures or DEFAULT_CUBE_MEASURES)]
+        self.year_column = year_column.upper()
+        self.channel_column = channel_column.upper()
+        self.distinct_counts = {
+            name.upper(): {"column": spec["column"].upper(), "doc_types": sorted(spec.get("doc_types") or [])}
+            for name, spec in (distinct_counts or DEFAULT_DISTINCT_COUNTS).items()
+        }
+        self.sketch_precision = sketch_precision
+        self.exact_sketch_limit = exact_sketch_limit
+        self.refresh_at = refresh_at
+        self.max_staleness_seconds = max_staleness_seconds
+        self.build_timeout_seconds = build_timeout_seconds
+        # Object with iter_query(sql, params, batch_size, timeout) used to read from Oracle
+        self.source = source
+        self.enabled = enabled and self._has_dependencies()
+
+        self._dimension_set = frozenset(self.dimensions + [YEAR_DIMENSION, CHANNEL_DIMENSION])
+        self._measure_set = frozenset(self.measures)
+        self._metadata = None
+        self._metadata_mtime = None
+        self._sketch_table = None
+        self._sketch_mtime = None
+        self._sketch_cache = {}
+        self._sketch_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"served": 0, "sketched": 0, "ineligible": 0, "errors": 0, "total_seconds": 0.0, "builds": 0}
+        self._stop = threading.Event()
+        self._refresher = None
+
+    @classmethod
+    def from_config(cls, config: dict = None, source=None) -> "KPICube":
+        """Build the cube from the database.kpi_cube config block"""
+        cube_config = (config or {}).get("kpi_cube", {})
+        return cls(
+            enabled=cube_config.get("enabled", False),
+            cube_path=cube_config.get("cube_path", "data/kpi_cube.parquet"),
+            dimensions=cube_config.get("dimensions"),
+            measures=cube_config.get("measures"),
+            year_column=cube_config.get("year_column", "DOC_REG_DT"),
+            channel_column=cube_config.get("channel_column", "DOC_AGENT_NAME"),
+            distinct_counts=cube_config.get("distinct_counts"),
+            sketch_precision=cube_config.get("sketch_precision", 14),
+            exact_sketch_limit=cube_config.get("exact_sketch_limit"),
+            refresh_at=cube_config.get("refresh_at", "02:00"),
+            max_staleness_seconds=cube_config.get("max_staleness_seconds", 129600),
+            build_timeout_seconds=cube_config.get("build_timeout_seconds", 3600),
+            source=source
+        )
+
+    @staticmethod
+    def _has_dependencies() -> bool:
+        try:
+            import duckdb  # noqa: F401
+            import pyarrow  # noqa: F401
+        except ImportError:
+            logger.warning("duckdb/pyarrow are not installed - KPI cube disabled")
+            return False
+        return True
+
+    # Build
+
+    def _cell_expressions(self) -> list:
+        year = f"EXTRACT(YEAR FROM {self.year_column})"
+        channel = f"CASE WHEN {self.channel_column} IS NULL THEN '{DIRECT_CHANNEL}' ELSE '{BROKER_CHANNEL}' END"
+        return [(year, YEAR_DIMENSION)] + [(column, column) for column in self.dimensions] + [(channel, CHANNEL_DIMENSION)]
+
+    def build_sql(self) -> str:
+        """Oracle query producing one row per cube cell"""
+        cells = self._cell_expressions()
+        select = (
+            [f"{expression} AS {name}" if expression != name else name for expression, name in cells]
+            + ["COUNT(*) AS ROW_COUNT"] + [f"SUM({measure}) AS SUM_{measure}" for measure in self.measures]
+        )
+        group_by = [expression for expression, _ in cells]
+        return f"SELECT {', '.join(select)} FROM insmv.AIMS_ALL_DATA GROUP BY {', '.join(group_by)}"
+
+    def distinct_sql(self, name: str) -> str:
+        """Oracle query listing each (cell, key) pair of one distinct count"""
+        spec = self.distinct_counts[name]
+        cells = self._cell_expressions()
+        select = [f"{expression} AS {alias}" if expression != alias else alias for expression, alias in cells]
+        conditions = [f"{spec['column']} IS NOT NULL"]
+        if spec["doc_types"]:
+            conditions.append(f"DOC_TYPE IN ({', '.join(str(doc_type) for doc_type in spec['doc_types'])})")
+        return (f"SELECT DISTINCT {', '.join(select)}, {spec['column']} AS DISTINCT_KEY "
+                f"FROM insmv.AIMS_ALL_DATA WHERE {' AND '.join(conditions)}")
+
+    def _build_distinct(self, name: str, cell_index: dict, cell_count: int):
+        """Per-cell exact counts and sketches of one distinct count, plus its global count"""
+        import numpy as np
+
+        cell_batches, hash_batches, unknown = [], [], 0
+        for _, batch_rows in self.source.iter_query(self.distinct_sql(name), timeout=self.build_timeout_seconds):
+            cells = [cell_index.get(tuple(row[:-1]), -1) for row in batch_rows]
+            cell_batches.append(np.array(cells, dtype=np.int64))
+            hash_batches.append(hash_keys(row[-1] for row in batch_rows))
+        cells = np.concatenate(cell_batches) if cell_batches else np.array([], dtype=np.int64)
+        hashes = np.concatenate(hash_batches) if hash_batches else np.array([], dtype=np.uint64)
+        if (cells < 0).any():
+            # Rows loaded between the cell query and this one; they have no cell to go in
+            unknown = int((cells < 0).sum())
+            logger.warning(f"{unknown} {name} keys fall outside the cube's cells and were skipped")
+            cells, hashes = cells[cells >= 0], hashes[cells >= 0]
+
+        order = np.argsort(cells, kind="stable")
+        cells, hashes = cells[order], hashes[order]
+        bounds = np.searchsorted(cells, np.arange(cell_count + 1))
+        counts, sketches = [], []
+        for cell in range(cell_count):
+            cell_hashes = sorted_unique(hashes[bounds[cell]:bounds[cell + 1]])
+            counts.append(len(cell_hashes))
+            sketches.append(DistinctSketch(self.sketch_precision, self.exact_sketch_limit, hashes=cell_hashes).to_bytes())
+        return counts, sketches, len(sorted_unique(hashes))
+
+    def build(self) -> dict:
+        """Recompute every cell from Oracle and atomically replace the cube file"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.source is None:
+            raise ValueError("KPI cube has no Oracle source to build from")
+        with self._build_lock:
+            start_time = time.time()
+            columns, rows = None, []
+            for batch_columns, batch_rows in self.source.iter_query(self.build_sql(), timeout=self.build_timeout_seconds):
+                columns = batch_columns
+                rows.extend(batch_rows)
+            if not rows:
+                raise ValueError("KPI cube build returned no rows")
+
+            table = rows_to_table(columns, rows)
+            table = table.append_column(CELL_ID, pa.array(range(len(rows)), type=pa.int64()))
+            cell_width = len(self._cell_expressions())
+            cell_index = {tuple(row[:cell_width]): i for i, row in enumerate(rows)}
+
+            # A distinct count only sums across cells if no key appears in two of them
+            distinct = {}
+            for name in self.distinct_counts:
+                counts, sketches, total = self._build_distinct(name, cell_index, len(rows))
+                table = table.append_column(f"{name}_COUNT", pa.array(counts, type=pa.int64()))
+                table = table.append_column(f"{name}_SKETCH", pa.array(sketches, type=pa.binary()))
+                distinct[name] = {"count": total, "additive": sum(counts) == total}
+
+            metadata = {
+                "built_at": time.time(),
+                "cells": table.num_rows,
+                "sketch_precision": self.sketch_precision,
+                "distinct": distinct
+            }
+            table = table.replace_schema_metadata({CUBE_METADATA_KEY: json.dumps(metadata)})
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.cube_path)), exist_ok=True)
+            temp_path = f"{self.cube_path}.{uuid.uuid4().hex}.tmp"
+            pq.write_table(table, temp_path)
+            os.replace(temp_path, self.cube_path)
+            with self._stats_lock:
+                self._stats["builds"] += 1
+
+            sketched = [name for name, info in distinct.items() if not info["additive"]]
+            if sketched:
+                logger.info(f"Distinct counts span cube cells and will be merged from sketches: {', '.join(sketched)}")
+            metadata["seconds"] = round(time.time() - start_time, 3)
+            logger.info(f"KPI cube built: {metadata}")
+            return metadata
+
+    def metadata(self) -> Optional[dict]:
+        """Build metadata of the current cube file, or None if there is none"""
+        try:
+            mtime = os.path.getmtime(self.cube_path)
+        except OSError:
+            return None
+        if self._metadata is None or mtime != self._metadata_mtime:
+            import pyarrow.parquet as pq
+            schema_metadata = pq.read_schema(self.cube_path).metadata or {}
+            self._metadata = json.loads(schema_metadata.get(CUBE_METADATA_KEY, b"{}"))
+            self._metadata_mtime = mtime
+        return self._metadata
+
+    def is_fresh(self) -> bool:
+        metadata = self.metadata()
+        return bool(metadata) and time.time() - metadata.get("built_at", 0) <= self.max_staleness_seconds
+
+    # Query rewriting
+
+    def _column_at(self, tokens: list, i: int):
+        """(column name, next index) for COL or ALIAS.COL at i, else None"""
+        if i >= len(tokens) or tokens[i].kind != WORD:
+            return None
+        if i + 2 < len(tokens) and tokens[i + 1].value == "." and tokens[i + 2].kind == WORD \
+                and not tokens[i].is_word("INSMV"):
+            return tokens[i + 2].upper, i + 3
+        return tokens[i].upper, i + 1
+
+    @staticmethod
+    def _expect(tokens: list, i: int, value: str) -> int:
+        if i >= len(tokens) or tokens[i].upper != value:
+            raise CubeIneligible(f"expected {value}")
+        return i + 1
+
+    def _match_sum(self, tokens: list, i: int):
+        """SUM over a +/- combination of measures -> sums of the cube's per-cell sums"""
+        i = self._expect(tokens, i + 1, "(")
+        terms, sign = [], "+"
+        while True:
+            token = tokens[i] if i < len(tokens) else None
+            if token is not None and token.is_word("COALESCE", "NVL"):
+                i = self._expect(tokens, i + 1, "(")
+                column = self._column_at(tokens, i)
+                if column is None:
+                    raise CubeIneligible("unsupported SUM argument")
+                name, i = column
+                i = self._expect(tokens, i, ",")
+                if i >= len(tokens) or tokens[i].kind != NUMBER or float(tokens[i].value) != 0:
+                    raise CubeIneligible("SUM of COALESCE with a non-zero default")
+                i = self._expect(tokens, i + 1, ")")
+                terms.append((sign, name, True))
+            else:
+                column = self._column_at(tokens, i)
+                if column is None:
+                    raise CubeIneligible("unsupported SUM argument")
+                name, i = column
+                terms.append((sign, name, False))
+            if i < len(tokens) and tokens[i].kind == OP and tokens[i].value in ("+", "-"):
+                sign, i = tokens[i].value, i + 1
+                continue
+            i = self._expect(tokens, i, ")")
+            break
+
+        for _, name, _ in terms:
+            if name not in self._measure_set:
+                raise CubeIneligible(f"SUM over {name}, which is not a cube measure")
+        if len(terms) == 1 and not terms[0][2]:
+            return f"SUM(SUM_{terms[0][1]})", i
+        if not all(coalesced for _, _, coalesced in terms):
+            # SUM(a + b) is NULL for rows where either is NULL, which per-column sums cannot reproduce
+            raise CubeIneligible("SUM over an expression of nullable measures")
+        parts = [f"COALESCE(SUM(SUM_{name}), 0)" for _, name, _ in terms]
+        expression = parts[0] if terms[0][0] == "+" else f"-{parts[0]}"
+        for (term_sign, _, _), part in zip(terms[1:], parts[1:]):
+            expression += f" {term_sign} {part}"
+        return f"({expression})", i
+
+    def _match_count(self, tokens: list, i: int, distinct_additive: dict):
+        """COUNT(*) and COUNT(DISTINCT ...) of a cube distinct count -> (SQL, next index, sketched)
+
+        Additive counts become sums of cell counts; the others become a struct
+        of the sketch name and the row's cell ids, merged after the query runs.
+        """
+        i = self._expect(tokens, i + 1, "(")
+        if i < len(tokens) and tokens[i].value == "*":
+            return "CAST(SUM(ROW_COUNT) AS BIGINT)", self._expect(tokens, i + 1, ")"), False
+        i = self._expect(tokens, i, "DISTINCT")
+
+        doc_types = []
+        if i < len(tokens) and tokens[i].is_word("CASE"):
+            i = self._expect(tokens, i + 1, "WHEN")
+            column = self._column_at(tokens, i)
+            if column is None or column[0] != "DOC_TYPE":
+                raise CubeIneligible("unsupported COUNT(DISTINCT CASE ...)")
+            i = self._expect(tokens, column[1], "IN")
+            i = self._expect(tokens, i, "(")
+            while i < len(tokens) and tokens[i].kind == NUMBER:
+                doc_types.append(int(float(tokens[i].value)))
+                i += 1
+                if i < len(tokens) and tokens[i].value == ",":
+                    i += 1
+            i = self._expect(tokens, i, ")")
+            i = self._expect(tokens, i, "THEN")
+            column = self._column_at(tokens, i)
+            if column is None:
+                raise CubeIneligible("unsupported COUNT(DISTINCT CASE ...)")
+            i = self._expect(tokens, column[1], "END")
+        else:
+            column = self._column_at(tokens, i)
+            if column is None:
+                raise CubeIneligible("unsupported COUNT(DISTINCT ...)")
+            i = column[1]
+        i = self._expect(tokens, i, ")")
+
+        name = next((
+            name for name, spec in self.distinct_counts.items()
+            if spec["column"] == column[0] and spec["doc_types"] == sorted(doc_types)
+        ), None)
+        if name is None or name not in distinct_additive:
+            raise CubeIneligible("COUNT(DISTINCT ...) of something the cube does not count")
+        if distinct_additive[name]:
+            return f"CAST(SUM({name}_COUNT) AS BIGINT)", i, False
+        return f"{{'sketch': '{name}', 'cells': LIST({CELL_ID})}}", i, True
+
+    def _match_year_column(self, tokens: list, i: int, end: int):
+        """EXTRACT(YEAR FROM year_column) or a year-aligned range on year_column -> DOC_YEAR"""
+        if tokens[i].is_word("EXTRACT"):
+            i = self._expect(tokens, i + 1, "(")
+            i = self._expect(tokens, i, "YEAR")
+            i = self._expect(tokens, i, "FROM")
+            column = self._column_at(tokens, i)
+            if column is None or column[0] != self.year_column:
+                raise CubeIneligible("EXTRACT from a column other than the cube's year column")
+            return YEAR_DIMENSION, self._expect(tokens, column[1], ")")
+
+        # year_column >= DATE 'YYYY-01-01' / year_column < DATE 'YYYY-01-01'
+        operator = tokens[end] if end < len(tokens) else None
+        if operator is None or operator.kind != OP or operator.value not in (">=", "<"):
+            raise CubeIneligible(f"{self.year_column} used outside a year-aligned range")
+        if end + 2 >= len(tokens) or not tokens[end + 1].is_word("DATE") or tokens[end + 2].kind != STRING:
+            raise CubeIneligible(f"{self.year_column} compared with something other than a DATE literal")
+        value = tokens[end + 2].value.strip("'")
+        try:
+            date = datetime.date.fromisoformat(value)
+        except ValueError:
+            raise CubeIneligible(f"unsupported date literal {value}")
+        if (date.month, date.day) != (1, 1):
+            raise CubeIneligible("date range is not year-aligned")
+        return f"{YEAR_DIMENSION} {operator.value} {date.year}", end + 3
+
+    def _match_channel(self, tokens: list, end: int):
+        """channel_column IS [NOT] NULL -> DOC_CHANNEL = 'DIRECT' / 'BROKER'"""
+        if end < len(tokens) and tokens[end].is_word("IS"):
+            if end + 1 < len(tokens) and tokens[end + 1].is_word("NULL"):
+                return f"{CHANNEL_DIMENSION} = '{DIRECT_CHANNEL}'", end + 2
+            if end + 2 < len(tokens) and tokens[end + 1].is_word("NOT") and tokens[end + 2].is_word("NULL"):
+                return f"{CHANNEL_DIMENSION} = '{BROKER_CHANNEL}'", end + 3
+        raise CubeIneligible(f"{self.channel_column} used other than IS [NOT] NULL")
+
+    @staticmethod
+    def _unaliased_select_item(tokens: list, start: int, end: int) -> bool:
+        """Whether tokens[start:end] is a whole select-list item with no alias"""
+        before = tokens[start - 1] if start > 0 else None
+        after = tokens[end] if end < len(tokens) else None
+        return before is not None and (before.is_word("SELECT", "DISTINCT") or before.value == ",") \
+            and (after is None or after.value == "," or after.is_word("FROM"))
+
+    @staticmethod
+    def _aliased_select_item(tokens: list, start: int, end: int) -> bool:
+        """Whether tokens[start:end] is a whole select-list item followed by an alias"""
+        before = tokens[start - 1] if start > 0 else None
+        after = tokens[end] if end < len(tokens) else None
+        return before is not None and (before.is_word("SELECT", "DISTINCT") or before.value == ",") \
+            and after is not None and (after.is_word("AS") or after.kind in (WORD, QUOTED)) and not after.is_word("FROM")
+
+    @staticmethod
+    def _parse_order_tail(tokens: list, i: int):
+        """Top-level ORDER BY items and FETCH FIRST count from tokens[i] to the end"""
+        order_by, fetch = [], None
+        if i < len(tokens) and tokens[i].is_word("ORDER"):
+            i = KPICube._expect(tokens, i + 1, "BY")
+            while True:
+                token = tokens[i] if i < len(tokens) else None
+                if token is None or token.kind not in (WORD, QUOTED, NUMBER) or token.is_word("FETCH"):
+                    raise CubeIneligible("ORDER BY over sketched counts must name output columns")
+                if token.kind == NUMBER:
+                    key = int(float(token.value))
+                else:
+                    key = token.value.strip('"') if token.kind == QUOTED else token.upper
+                i += 1
+                descending = False
+                if i < len(tokens) and tokens[i].is_word("ASC", "DESC"):
+                    descending, i = tokens[i].is_word("DESC"), i + 1
+                if i < len(tokens) and tokens[i].is_word("NULLS"):
+                    raise CubeIneligible("NULLS FIRST/LAST over sketched counts")
+                order_by.append((key, descending))
+                if i < len(tokens) and tokens[i].value == ",":
+                    i += 1
+                    continue
+                break
+        if i < len(tokens) and tokens[i].is_word("FETCH"):
+            i += 1
+            if i < len(tokens) and tokens[i].is_word("FIRST", "NEXT"):
+                i += 1
+            if i >= len(tokens) or tokens[i].kind != NUMBER:
+                raise CubeIneligible("unsupported FETCH clause")
+            fetch, i = int(float(tokens[i].value)), i + 1
+            for word in (("ROW", "ROWS"), ("ONLY",)):
+                if i >= len(tokens) or not tokens[i].is_word(*word):
+                    raise CubeIneligible("unsupported FETCH clause")
+                i += 1
+        if i < len(tokens):
+            raise CubeIneligible("unsupported clause after ORDER BY")
+        return order_by, fetch
+
+    def translate(self, analysis: SQLAnalysis, distinct_additive: dict) -> CubeQuery:
+        """Rewrite a query on AIMS_ALL_DATA into the same query on the cube; raises CubeIneligible
+
+        distinct_additive maps each distinct count name to whether its cell counts can be summed.
+        """
+        if analysis.tables != {REPLICA_TABLE} or analysis.ctes:
+            raise CubeIneligible("query reads something other than AIMS_ALL_DATA")
+        if analysis.binds:
+            raise CubeIneligible("query uses bind variables")
+
+        tokens = analysis.tokens
+        aliases = collect_aliases(tokens, self._dimension_set | self._measure_set)
+        output, aggregated, sketched, depth, i = [], False, False, 0, 0
+        order_by, fetch = [], None
+        while i < len(tokens):
+            token = tokens[i]
+            if token.is_word("SUM", "COUNT"):
+                start, uses_sketch = i, False
+                if token.is_word("SUM"):
+                    sql, i = self._match_sum(tokens, i)
+                else:
+                    sql, i, uses_sketch = self._match_count(tokens, i, distinct_additive)
+                if uses_sketch and (depth > 0 or not (self._unaliased_select_item(tokens, start, i)
+                                                      or self._aliased_select_item(tokens, start, i))):
+                    raise CubeIneligible("sketched distinct count used outside a top-level select item")
+                output.append(sql)
+                aggregated = True
+                sketched = sketched or uses_sketch
+                if self._unaliased_select_item(tokens, start, i):
+                    # Keep the column name Oracle would have given the original expression
+                    output.append('AS "' + "".join(t.value for t in tokens[start:i]).upper().replace('"', "") + '"')
+                continue
+            if token.is_word("HAVING") and sketched:
+                raise CubeIneligible("HAVING over sketched distinct counts")
+            if sketched and depth == 0 and token.is_word("ORDER", "FETCH"):
+                # Sorting needs the merged counts, so it runs after the sketches are merged
+                order_by, fetch = self._parse_order_tail(tokens, i)
+                break
+            if token.value == "(":
+                depth += 1
+            elif token.value == ")":
+                depth -= 1
+            if token.kind == PUNCT and token.value == "*" or token.kind == OP and token.value == "*":
+                if i > 0 and (tokens[i - 1].is_word("SELECT", "DISTINCT") or tokens[i - 1].value in (".", ",")):
+                    raise CubeIneligible("SELECT * cannot be answered from the cube")
+            if token.kind != WORD:
+                output.append(token.value)
+                i += 1
+                continue
+
+            if token.is_word("INSMV"):
+                # insmv.AIMS_ALL_DATA stays as is; the cube file is exposed under that name
+                output.append("".join(t.value for t in tokens[i:i + 3]))
+                i += 3
+                continue
+            if token.is_word("EXTRACT"):
+                sql, i = self._match_year_column(tokens, i, i)
+                output.append(sql)
+                continue
+
+            column, end = self._column_at(tokens, i)
+            if column == self.year_column:
+                sql, i = self._match_year_column(tokens, i, end)
+                output.append(sql)
+            elif column == self.channel_column:
+                sql, i = self._match_channel(tokens, end)
+                output.append(sql)
+            elif column in self._dimension_set:
+                output.append(column)
+                i = end
+            elif column in self._measure_set:
+                raise CubeIneligible(f"{column} used outside SUM")
+            elif token.upper in CUBE_SQL_WORDS or token.upper in aliases:
+                output.append(token.value)
+                i += 1
+            else:
+                raise CubeIneligible(f"{column} is not in the cube")
+
+        if not aggregated and not any(token.is_word("GROUP") for token in tokens):
+            raise CubeIneligible("not an aggregate query")
+        return CubeQuery(" ".join(output), sketched, order_by, fetch)
+
+    def try_query(self, analysis: SQLAnalysis, allow_estimates: bool = True):
+        """Answer a query from the cube; None when it needs the replica or Oracle
+
+        With allow_estimates False, queries whose distinct counts would come from sketches are declined.
+        """
+        if not self.enabled or not self.is_fresh():
+            return None
+        metadata = self.metadata()
+        distinct_additive = {name: info["additive"] for name, info in metadata.get("distinct", {}).items()}
+        try:
+            cube_query = self.translate(analysis, distinct_additive)
+        except CubeIneligible as e:
+            with self._stats_lock:
+                self._stats["ineligible"] += 1
+            logger.debug(f"KPI cube skipped: {e}")
+            return None
+        if cube_query.sketched and not allow_estimates:
+            return None
+
+        start_time = time.time()
+        try:
+            quoted = {token.value.strip('"') for token in analysis.tokens if token.kind == QUOTED}
+            df = query_parquet(cube_query.sql, [self.cube_path], quoted)
+            if cube_query.sketched:
+                df = self._merge_sketches(df, cube_query, metadata.get("sketch_precision", self.sketch_precision))
+        except Exception as e:
+            with self._stats_lock:
+                self._stats["errors"] += 1
+            logger.warning(f"KPI cube query failed, falling back: {type(e).__name__}: {e}")
+            return None
+
+        elapsed = time.time() - start_time
+        with self._stats_lock:
+            self._stats["served"] += 1
+            self._stats["sketched"] += int(cube_query.sketched)
+            self._stats["total_seconds"] += elapsed
+        logger.info(f"Served from KPI cube in {elapsed * 1000:.0f}ms ({len(df)} rows)")
+        df.attrs["source"] = "kpi_cube"
+        return df
+
+    # Sketch merging
+
+    def _cell_sketch(self, name: str, cell: int, precision: int) -> DistinctSketch:
+        """Decoded sketch of one cell, cached until the cube file changes"""
+        import pyarrow.parquet as pq
+
+        with self._sketch_lock:
+            mtime = os.path.getmtime(self.cube_path)
+            if self._sketch_table is None or mtime != self._sketch_mtime:
+                columns = [f"{sketch_name}_SKETCH" for sketch_name in self.distinct_counts]
+                self._sketch_table = pq.read_table(self.cube_path, columns=columns)
+                self._sketch_mtime = mtime
+                self._sketch_cache = {}
+            key = (name, cell)
+            if key not in self._sketch_cache:
+                data = self._sketch_table.column(f"{name}_SKETCH")[cell].as_py()
+                self._sketch_cache[key] = DistinctSketch.from_bytes(data, precision, self.exact_sketch_limit)
+            return self._sketch_cache[key]
+
+    def _merge_sketches(self, df, cube_query: CubeQuery, precision: int):
+        """Replace sketch/cell-id structs with merged distinct counts, then apply ORDER BY / FETCH"""
+        notes = []
+        for column in df.columns:
+            values = [value for value in df[column] if isinstance(value, dict) and "sketch" in value]
+            if not values:
+                continue
+            counts, error = [], 0.0
+            for value in df[column]:
+                cells = value.get("cells") if isinstance(value, dict) else None
+                if cells is None or not len(cells):
+                    counts.append(0)
+                    continue
+                merged = DistinctSketch.merge_all(
+                    [self._cell_sketch(value["sketch"], int(cell), precision) for cell in cells],
+                    precision, self.exact_sketch_limit
+                )
+                counts.append(merged.count())
+                error = max(error, merged.relative_error)
+            df[column] = counts
+            if error:
+                notes.append(f"{column} is a HyperLogLog estimate within ±{CONFIDENCE_SIGMAS * error:.1%} "
+                             f"(95% confidence)")
+
+        if cube_query.order_by:
+            by = [df.columns[key - 1] if isinstance(key, int) else key for key, _ in cube_query.order_by]
+            missing = [column for column in by if column not in df.columns]
+            if missing:
+                raise KeyError(f"ORDER BY column(s) not in the result: {missing}")
+            ascending = [not descending for _, descending in cube_query.order_by]
+            # Oracle sorts NULLs as the largest value
+            df = df.sort_values(by, ascending=ascending, na_position="last" if ascending[0] else "first", kind="stable")
+        if cube_query.fetch is not None:
+            df = df.head(cube_query.fetch)
+        df = df.reset_index(drop=True)
+        if notes:
+            df.attrs["approximation"] = "; ".join(notes)
+        return df
+
+    # Nightly refresh
+
+    def start_auto_refresh(self):
+        """Rebuild now if the cube is missing or stale, then every night at refresh_at"""
+        if not self.enabled or self.source is None or self._refresher is not None:
+            return
+        self._stop.clear()
+        self._refresher = threading.Thread(target=self._refresh_loop, name="kpi-cube-refresh", daemon=True)
+        self._refresher.start()
+
+    def stop_auto_refresh(self):
+        self._stop.set()
+        self._refresher = None
+
+    def _refresh_loop(self):
+        build_now = not self.is_fresh()
+        while not self._stop.is_set():
+            if build_now:
+                try:
+                    self.build()
+                except Exception as e:
+                    logger.error(f"KPI cube build failed: {type(e).__name__}: {e}")
+            build_now = True
+            self._stop.wait(_seconds_until(self.refresh_at))
+
+    def get_stats(self) -> dict:
+        metadata = (self.metadata() if self.enabled else None) or {}
+        with self._stats_lock:
+            stats = dict(self._stats)
+        total_seconds = stats.pop("total_seconds")
+        stats["avg_seconds"] = total_seconds / stats["served"] if stats["served"] else 0.0
+        stats.update(
+            enabled=self.enabled,
+            fresh=self.enabled and self.is_fresh(),
+            cells=metadata.get("cells", 0),
+            distinct_additive={name: info["additive"] for name, info in metadata.get("distinct", {}).items()},
+            built_at=metadata.get("built_at")
+        )
+        return stats
@@ -0,0 +1,453 @@
+"""
+Local columnar replica of insmv.AIMS_ALL_DATA
+A Parquet snapshot of the view's most-used columns, partitioned by registration year and line of business,
+refreshed incrementally from a watermark and queried with DuckDB so read-only aggregates skip Oracle
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+from src.K2.aims_view.database.sql_analyzer import BIND, QUOTED, WORD, SQLAnalysis
+
+logger = logging.getLogger(__name__)
+
+REPLICA_TABLE = "INSMV.AIMS_ALL_DATA"
+
+DEFAULT_REPLICA_COLUMNS = [
+    "DOC_PRIMARY_KEY", "DOC_SERIAL", "DOC_REG_DT", "DOC_ST_DT", "DOC_PROD_YEAR",
+    "DOC_MAJ_INS_TYPE", "DOC_MAJ_NAME", "DOC_MIN_INS_TYPE", "DOC_MIN_NAME", "DOC_BUS_TYPE", "DOC_BUS_NAME",
+    "DOC_BRANCH", "DOC_BRANCH_NAME", "DOC_OFFICE", "DOC_OFFICE_NAME", "DOC_AGENT_NAME", "DOC_USER_NAME",
+    "DOC_SOURCE_NAME", "DOC_PREMIUM", "DOC_SUM_INSURED",
+    "CLAIM_NO", "CLAIM_REG_DT", "CLAIM_ACC_DT", "CLAIM_ACC_YEAR", "CLAIM_STATUS", "CLAIM_BRANCH",
+    "CLAIM_OS_VAL", "CLAIM_ACC_TYPE_NAME", "PAY_SLIP_DT", "PAY_AMT"
+]
+
+# Keywords and functions that mean the same thing in Oracle and DuckDB; any other word sends the query to Oracle
+REPLICA_SQL_WORDS = frozenset({
+    "SELECT", "FROM", "WHERE", "AND", "OR", "NOT", "IN", "BETWEEN", "LIKE", "IS", "NULL", "AS",
+    "GROUP", "BY", "ORDER", "HAVING", "ASC", "DESC", "NULLS", "FIRST", "LAST", "DISTINCT", "ALL",
+    "CASE", "WHEN", "THEN", "ELSE", "END", "DATE", "EXTRACT", "YEAR", "MONTH", "DAY", "WITH", "UNION",
+    "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "OUTER", "ON", "FETCH", "NEXT", "ROWS", "ROW", "ONLY",
+    "COUNT", "SUM", "AVG", "MIN", "MAX", "ROUND", "ABS", "COALESCE", "NULLIF", "UPPER", "LOWER", "TRIM",
+    "SUBSTR", "LENGTH", "MOD"
+})
+
+AGGREGATE_FUNCTIONS = frozenset({"COUNT", "SUM", "AVG", "MIN", "MAX"})
+
+# Oracle sorts NULLs as the largest value; DuckDB puts them last either way unless told otherwise
+ORACLE_NULL_ORDER = "nulls_last_on_asc_first_on_desc"
+
+MANIFEST_FILE = "manifest.json"
+
+
+def _sql_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def query_parquet(sql: str, files: List[str], quoted: set = frozenset()):
+    """Run Oracle-dialect SQL with DuckDB, exposing the Parquet files as insmv.AIMS_ALL_DATA"""
+    import duckdb
+
+    connection = duckdb.connect()
+    try:
+        connection.execute(f"SET default_null_order = '{ORACLE_NULL_ORDER}'")
+        connection.execute("CREATE SCHEMA insmv")
+        file_list = ", ".join(_sql_string(path) for path in files)
+        connection.execute(
+            f"CREATE VIEW insmv.aims_all_data AS SELECT * FROM read_parquet([{file_list}], union_by_name = true)"
+        )
+        df = connection.execute(sql).fetch_df()
+    finally:
+        connection.close()
+    # Oracle reports unquoted identifiers in upper case
+    df.columns = [column if column in quoted else column.upper() for column in df.columns]
+    # Text NULLs come back as NaN from DuckDB but as None from cx_Oracle
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].where(df[column].notna(), None)
+    return df
+
+
+def collect_aliases(tokens: list, columns: frozenset, ctes: set = frozenset()) -> set:
+    """Upper-cased table, CTE and select-list aliases defined in a tokenized query"""
+    aliases = set(ctes)
+    for i, token in enumerate(tokens):
+        if token.kind not in (WORD, QUOTED) or token.upper in REPLICA_SQL_WORDS:
+            continue
+        previous = tokens[i - 1] if i > 0 else None
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if previous is not None and (previous.is_word("AS", "AIMS_ALL_DATA") or previous.upper in ctes):
+            aliases.add(token.upper)
+        elif previous is not None and (previous.value == ")" or previous.is_word("END") or previous.upper in columns) \
+                and (following is None or following.value == "," or following.is_word("FROM")):
+            # Select-list alias without AS, e.g. SUM(DOC_PREMIUM) total
+            aliases.add(token.upper)
+    return aliases
+
+
+def rows_to_table(columns: list, rows: list):
+    """Arrow table from fetched rows, stringifying columns Arrow cannot type"""
+    import pyarrow as pa
+
+    arrays = []
+    for values in zip(*rows):
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([None if value is None else str(value) for value in values], pa.string()))
+    return pa.Table.from_arrays(arrays, names=[str(column).upper() for column in columns])
+
+
+def _partition_dir(year, lob) -> str:
+    """Directory name for one (year, line of business) partition"""
+    lob_label = "null" if lob is None else re.sub(r"[^A-Za-z0-9_-]+", "_", str(lob))[:40]
+    digest = hashlib.sha1(repr(lob).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(f"year={'null' if year is None else int(year)}", f"lob={lob_label}-{digest}")
+
+
+def _partition_key(year, lob) -> str:
+    return json.dumps([None if year is None else int(year), lob])
+
+
+class LocalReplica:
+    """Parquet replica of AIMS_ALL_DATA that serves eligible aggregate queries through DuckDB
+
+    The manifest lists the current files of every partition; refreshes write
+    new files and then swap the manifest, so queries never see a half-written
+    partition. Any replica problem falls back to Oracle.
+    """
+
+    def __init__(self, enabled: bool = False, replica_dir: str = "data/aims_replica", columns: List[str] = None,
+                 year_column: str = "DOC_REG_DT", lob_column: str = "DOC_MAJ_NAME",
+                 watermark_columns: List[str] = None, lookback_days: int = 3,
+                 refresh_interval_seconds: float = 3600, max_staleness_seconds: float = 86400,
+                 aggregates_only: bool = True, batch_rows: int = 50000, retention_seconds: float = 300,
+                 refresh_timeout_seconds: float = 1800, source=None):
+        self.replica_dir = replica_dir
+        self.columns = [column.upper() for column in (columns or DEFAULT_REPLICA_COLUMNS)]
+        self.year_column = year_column.upper()
+        self.lob_column = lob_column.upper()
+        self.watermark_columns = [column.upper() for column in (watermark_columns or ["DOC_REG_DT", "CLAIM_REG_DT"])]
+        for column in [self.year_column, self.lob_column] + self.watermark_columns:
+            if column not in self.columns:
+                self.columns.append(column)
+        self.lookback_days = lookback_days
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.max_staleness_seconds = max_staleness_seconds
+        self.aggregates_only = aggregates_only
+        self.batch_rows = batch_rows
+        # Superseded partition files are kept this long for queries still reading them
+        self.retention_seconds = retention_seconds
+        # Call timeout for the Oracle reads of a refresh (whole partitions take longer than chat queries)
+        self.refresh_timeout_seconds = refresh_timeout_seconds
+        # Object with iter_query(sql, params, batch_size, timeout) used to read from Oracle
+        self.source = source
+        self.enabled = enabled and self._has_dependencies()
+
+        self._column_set = frozenset(self.columns)
+        self._manifest = None
+        self._manifest_mtime = None
+        self._refresh_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"served": 0, "ineligible": 0, "errors": 0, "total_seconds": 0.0, "refreshes": 0}
+        self._stop = threading.Event()
+        self._refresher = None
+
+    @classmethod
+    def from_config(cls, config: dict = None, source=None) -> "LocalReplica":
+        """Build the replica from the database.local_replica config block"""
+        replica_config = (config or {}).get("local_replica", {})
+        return cls(
+            enabled=replica_config.get("enabled", False),
+            replica_dir=replica_config.get("replica_dir", "data/aims_replica"),
+            columns=replica_config.get("columns"),
+            year_column=replica_config.get("year_column", "DOC_REG_DT"),
+            lob_column=replica_config.get("lob_column", "DOC_MAJ_NAME"),
+            watermark_columns=replica_config.get("watermark_columns"),
+            lookback_days=replica_config.get("lookback_days", 3),
+            refresh_interval_seconds=replica_config.get("refresh_interval_seconds", 3600),
+            max_staleness_seconds=replica_config.get("max_staleness_seconds", 86400),
+            aggregates_only=replica_config.get("aggregates_only", True),
+            batch_rows=replica_config.get("batch_rows", 50000),
+            retention_seconds=replica_config.get("retention_seconds", 300),
+            refresh_timeout_seconds=replica_config.get("refresh_timeout_seconds", 1800),
+            source=source
+        )
+
+    @staticmethod
+    def _has_dependencies() -> bool:
+        try:
+            import duckdb  # noqa: F401
+            import pyarrow  # noqa: F401
+        except ImportError:
+            logger.warning("duckdb/pyarrow are not installed - local replica disabled, all queries go to Oracle")
+            return False
+        return True
+
+    # Manifest
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.replica_dir, MANIFEST_FILE)
+
+    def manifest(self) -> dict:
+        """Current manifest, reloaded when another process refreshed the replica"""
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except OSError:
+            return {"watermark": None, "refreshed_at": None, "partitions": {}}
+        if self._manifest is None or mtime != self._manifest_mtime:
+            with open(self.manifest_path, "r") as f:
+                self._manifest = json.load(f)
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def _write_manifest(self, manifest: dict):
+        os.makedirs(self.replica_dir, exist_ok=True)
+        temp_path = f"{self.manifest_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f, indent=2, default=str)
+        os.replace(temp_path, self.manifest_path)
+        self._manifest, self._manifest_mtime = manifest, os.path.getmtime(self.manifest_path)
+
+    def files(self) -> List[str]:
+        """Absolute paths of every Parquet file in the current snapshot"""
+        return [
+            os.path.join(self.replica_dir, path)
+            for partition in self.manifest()["partitions"].values()
+            for path in partition["files"]
+        ]
+
+    def is_fresh(self) -> bool:
+        refreshed_at = self.manifest().get("refreshed_at")
+        return bool(refreshed_at) and time.time() - refreshed_at <= self.max_staleness_seconds
+
+    # Routing
+
+    def check_eligible(self, analysis: SQLAnalysis) -> Optional[str]:
+        """Reason a query cannot be answered from the replica, or None if it can"""
+        if not self.enabled:
+            return "replica disabled"
+        if analysis.tables - analysis.ctes != {REPLICA_TABLE}:
+            return "query reads tables outside the replica"
+        if analysis.binds:
+            return "query uses bind variables"
+
+        tokens = analysis.tokens
+        aliases = collect_aliases(tokens, self._column_set, analysis.ctes)
+
+        aggregate = False
+        for i, token in enumerate(tokens):
+            if token.kind == BIND:
+                return "query uses bind variables"
+            if token.kind != WORD:
+                continue
+            word = token.upper
+            if word in AGGREGATE_FUNCTIONS or word == "GROUP":
+                aggregate = True
+            if word in REPLICA_SQL_WORDS or word in self._column_set or word in aliases or word == "INSMV" \
+                    or word == "AIMS_ALL_DATA":
+                continue
+            return f"{word} is not available on the replica"
+
+        if self.aggregates_only and not aggregate:
+            return "not an aggregate query"
+        if not self.is_fresh():
+            return "replica is empty or stale"
+        return None
+
+    def try_query(self, analysis: SQLAnalysis):
+        """Answer a query from the replica; None when it must go to Oracle instead"""
+        reason = self.check_eligible(analysis)
+        if reason is not None:
+            with self._stats_lock:
+                self._stats["ineligible"] += 1
+            logger.debug(f"Replica skipped: {reason}")
+            return None
+
+        start_time = time.time()
+        try:
+            df = self.query(analysis.sql, quoted={token.value.strip('"') for token in analysis.tokens if token.kind == QUOTED})
+        except Exception as e:
+            with self._stats_lock:
+                self._stats["errors"] += 1
+            logger.warning(f"Replica query failed, falling back to Oracle: {type(e).__name__}: {e}")
+            return None
+
+        elapsed = time.time() - start_time
+        with self._stats_lock:
+            self._stats["served"] += 1
+            self._stats["total_seconds"] += elapsed
+        logger.info(f"Served from local replica in {elapsed * 1000:.0f}ms ({len(df)} rows)")
+        df.attrs["source"] = "replica"
+        return df
+
+    def query(self, sql: str, quoted: set = frozenset()):
+        """Run a query against the snapshot with DuckDB and return a DataFrame"""
+        files = self.files()
+        if not files:
+            raise ValueError("replica has no data files")
+        return query_parquet(sql, files, quoted)
+
+    # Refresh
+
+    def refresh(self, full: bool = False) -> dict:
+        """Reload the partitions that changed since the watermark (every partition when full)"""
+        if self.source is None:
+            raise ValueError("Local replica has no Oracle source to refresh from")
+        with self._refresh_lock:
+            start_time = time.time()
+            manifest = dict(self.manifest())
+            partitions = dict(manifest.get("partitions", {}))
+            previous_watermark = None if full else manifest.get("watermark")
+
+            # Read the new watermark first so rows committed during the refresh are picked up next time
+            watermark = self._read_watermark()
+            since = None
+            if previous_watermark:
+                since = datetime.datetime.fromisoformat(previous_watermark) - datetime.timedelta(days=self.lookback_days)
+            changed = self._changed_partitions(since)
+            logger.info(f"Refreshing {len(changed)} replica partitions" + (f" changed since {since}" if since else ""))
+
+            generation = uuid.uuid4().hex[:12]
+            for year, lob in changed:
+                files, rows = self._load_partition(year, lob, generation)
+                key = _partition_key(year, lob)
+                if rows:
+                    partitions[key] = {"year": year, "lob": lob, "files": files, "rows": rows}
+                else:
+                    partitions.pop(key, None)
+
+            if full:
+                # A full reload drops partitions that no longer exist in Oracle
+                current = {_partition_key(year, lob) for year, lob in changed}
+                partitions = {key: value for key, value in partitions.items() if key in current}
+
+            manifest = {
+                "columns": self.columns,
+                "watermark": watermark.isoformat() if watermark else previous_watermark,
+                "refreshed_at": time.time(),
+                "partitions": partitions
+            }
+            self._write_manifest(manifest)
+            self._remove_superseded_files()
+            with self._stats_lock:
+                self._stats["refreshes"] += 1
+
+            summary = {
+                "partitions_refreshed": len(changed),
+                "partitions": len(partitions),
+                "rows": sum(partition["rows"] for partition in partitions.values()),
+                "watermark": manifest["watermark"],
+                "seconds": round(time.time() - start_time, 3)
+            }
+            logger.info(f"Replica refresh finished: {summary}")
+            return summary
+
+    def _read_watermark(self) -> Optional[datetime.datetime]:
+        maxima = ", ".join(f"MAX({column}) AS W{i}" for i, column in enumerate(self.watermark_columns))
+        values = []
+        for _, rows in self.source.iter_query(f"SELECT {maxima} FROM insmv.AIMS_ALL_DATA",
+                                               timeout=self.refresh_timeout_seconds):
+            values.extend(value for row in rows for value in row if value is not None)
+        return max(values) if values else None
+
+    def _changed_partitions(self, since: Optional[datetime.datetime]) -> list:
+        sql = (f"SELECT DISTINCT EXTRACT(YEAR FROM {self.year_column}) AS REPLICA_YEAR, {self.lob_column} AS REPLICA_LOB "
+               f"FROM insmv.AIMS_ALL_DATA")
+        params = None
+        if since is not None:
+            sql += " WHERE " + " OR ".join(f"{column} >= :since" for column in self.watermark_columns)
+            params = {"since": since}
+        changed = []
+        for _, rows in self.source.iter_query(sql, params, timeout=self.refresh_timeout_seconds):
+            changed.extend((None if year is None else int(year), lob) for year, lob in rows)
+        return changed
+
+    def _load_partition(self, year, lob, generation: str) -> (list, int):
+        """Copy one partition from Oracle into new Parquet files; returns (relative paths, row count)"""
+        import pyarrow.parquet as pq
+
+        conditions, params = [], {}
+        if year is None:
+            conditions.append(f"{self.year_column} IS NULL")
+        else:
+            conditions.append(f"{self.year_column} >= :period_start AND {self.year_column} < :period_end")
+            params.update(period_start=datetime.datetime(year, 1, 1), period_end=datetime.datetime(year + 1, 1, 1))
+        if lob is None:
+            conditions.append(f"{self.lob_column} IS NULL")
+        else:
+            conditions.append(f"{self.lob_column} = :lob")
+            params["lob"] = lob
+        sql = f"SELECT {', '.join(self.columns)} FROM insmv.AIMS_ALL_DATA WHERE {' AND '.join(conditions)}"
+
+        relative_dir = os.path.join("data", _partition_dir(year, lob), generation)
+        os.makedirs(os.path.join(self.replica_dir, relative_dir), exist_ok=True)
+        files, row_count = [], 0
+        for columns, rows in self.source.iter_query(sql, params or None, batch_size=self.batch_rows,
+                                                       timeout=self.refresh_timeout_seconds):
+            if not rows:
+                continue
+            # One file per batch; DuckDB unions them by column name, so batches may infer different types
+            relative_path = os.path.join(relative_dir, f"part-{len(files):05d}.parquet")
+            pq.write_table(rows_to_table(columns, rows), os.path.join(self.replica_dir, relative_path))
+            files.append(relative_path)
+            row_count += len(rows)
+        return files, row_count
+
+    def _remove_superseded_files(self):
+        """Delete partition generations no longer in the manifest once their retention has passed"""
+        data_dir = os.path.join(self.replica_dir, "data")
+        live = {os.path.dirname(os.path.join(self.replica_dir, path)) for path in self.files()}
+        cutoff = time.time() - self.retention_seconds
+        for root, dirs, _ in os.walk(data_dir):
+            for name in list(dirs):
+                path = os.path.join(root, name)
+                if os.path.basename(root).startswith("lob=") and path not in live and os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+                    dirs.remove(name)
+
+    def start_auto_refresh(self):
+        """Refresh in a background thread every refresh_interval_seconds"""
+        if not self.enabled or self.source is None or self._refresher is not None:
+            return
+        self._stop.clear()
+        self._refresher = threading.Thread(target=self._refresh_loop, name="aims-replica-refresh", daemon=True)
+        self._refresher.start()
+
+    def stop_auto_refresh(self):
+        self._stop.set()
+        self._refresher = None
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Replica refresh failed: {type(e).__name__}: {e}")
+            self._stop.wait(self.refresh_interval_seconds)
+
+    def get_stats(self) -> dict:
+        """Routing counters and snapshot size"""
+        manifest = self.manifest() if self.enabled else {"partitions": {}}
+        with self._stats_lock:
+            stats = dict(self._stats)
+        served = stats.pop("total_seconds")
+        stats["avg_seconds"] = served / stats["served"] if stats["served"] else 0.0
+        stats.update(
+            enabled=self.enabled,
+            fresh=self.enabled and self.is_fresh(),
+            partitions=len(manifest["partitions"]),
+            rows=sum(partition["rows"] for partition in manifest["partitions"].values()),
+            watermark=manifest.get("watermark"),
+            refreshed_at=manifest.get("refreshed_at")
+        )
+        return stats
@@ -0,0 +1,251 @@
+"""
+Shared cache of completed query results
+Keyed by the normalized SQL fingerprint plus literal values and binds, so the same sub-query
+generated for different questions (with different spacing, case or aliases quoting) runs once.
+A query that only adds "group column = literal" filters to a cached GROUP BY query is answered
+by filtering the cached groups.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from src.K2.aims_view.database.sql_analyzer import (
+    NUMBER, QUOTED, STRING, WORD, SQLAnalysis, SQLAnalysisError, analyze_sql
+)
+
+# Constructs that change which groups or rows come back, so filtering the broader result would differ
+UNDERIVABLE_WORDS = frozenset({
+    "ROLLUP", "CUBE", "GROUPING", "OVER", "FETCH", "OFFSET", "ROWNUM", "LIMIT", "UNION", "INTERSECT",
+    "MINUS", "CONNECT", "PIVOT", "UNPIVOT", "MODEL"
+})
+
+
+def _split_depth0(tokens: list, is_separator) -> list:
+    """Split tokens on top-level separators"""
+    parts, current, depth = [], [], 0
+    for token in tokens:
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        if depth == 0 and is_separator(token):
+            parts.append(current)
+            current = []
+        else:
+            current.append(token)
+    parts.append(current)
+    return parts
+
+
+def _conjuncts(where: list):
+    """Top-level AND terms of a WHERE clause, or None when it has a top-level OR"""
+    conjuncts, current, depth, in_between = [], [], 0, False
+    for token in where:
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        if depth == 0 and token.is_word("OR"):
+            return None
+        if depth == 0 and token.is_word("BETWEEN"):
+            in_between = True
+        elif depth == 0 and token.is_word("AND"):
+            if in_between:
+                # The AND of "BETWEEN x AND y" stays inside its term
+                in_between = False
+            else:
+                conjuncts.append(current)
+                current = []
+                continue
+        current.append(token)
+    conjuncts.append(current)
+    return conjuncts
+
+
+def _literal_value(token):
+    """Python value of a string or number literal token, else None"""
+    if token.kind == NUMBER:
+        return float(token.value)
+    if token.kind == STRING and token.value.startswith("'"):
+        return token.value[1:-1].replace("''", "'")
+    return None
+
+
+def _group_filter(conjunct: list, group_outputs: dict):
+    """(output column, allowed values) for "COL = literal" or "COL IN (literals)" on a grouped column"""
+    if len(conjunct) < 3 or conjunct[0].kind != WORD or conjunct[0].upper not in group_outputs:
+        return None
+    column = group_outputs[conjunct[0].upper]
+    if len(conjunct) == 3 and conjunct[1].value == "=":
+        value = _literal_value(conjunct[2])
+        return None if value is None else (column, [value])
+    if conjunct[1].is_word("IN") and conjunct[2].value == "(" and conjunct[-1].value == ")":
+        items = _split_depth0(conjunct[3:-1], lambda token: token.value == ",")
+        values = [_literal_value(item[0]) if len(item) == 1 else None for item in items]
+        return None if None in values else (column, values)
+    return None
+
+
+def broader_query(analysis: SQLAnalysis):
+    """(broader SQL, filters) when the query is a GROUP BY whose WHERE pins grouped columns to literals
+
+    The broader SQL drops those predicates; filtering its groups by the
+    returned (output column, values) pairs gives this query's result.
+    """
+    tokens = analysis.tokens
+    if analysis.ctes or not tokens[0].is_word("SELECT") or sum(1 for token in tokens if token.is_word("SELECT")) != 1:
+        return None
+    if any(token.kind == WORD and token.upper in UNDERIVABLE_WORDS for token in tokens):
+        return None
+
+    clauses, depth = {}, 0
+    for i, token in enumerate(tokens):
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        elif depth == 0 and token.is_word("FROM", "WHERE", "HAVING", "ORDER") and token.upper not in clauses:
+            clauses[token.upper] = i
+        elif depth == 0 and token.is_word("GROUP") and i + 1 < len(tokens) and tokens[i + 1].is_word("BY"):
+            clauses["GROUP"] = i
+    if not ("FROM" in clauses and "WHERE" in clauses and "GROUP" in clauses and clauses["WHERE"] < clauses["GROUP"]):
+        return None
+    where_end = clauses["GROUP"]
+
+    group_end = min([clauses[name] for name in ("HAVING", "ORDER") if clauses.get(name, -1) > where_end] + [len(tokens)])
+    grouped = {item[0].upper for item in _split_depth0(tokens[clauses["GROUP"] + 2:group_end], lambda t: t.value == ",")
+               if len(item) == 1 and item[0].kind == WORD}
+
+    # Grouped columns selected as plain (optionally aliased) items, by the output column they appear under
+    group_outputs = {}
+    for item in _split_depth0(tokens[1:clauses["FROM"]], lambda token: token.value == ","):
+        if item and item[0].is_word("DISTINCT"):
+            item = item[1:]
+        if not item or item[0].kind != WORD or item[0].upper not in grouped:
+            continue
+        alias = item[-1] if len(item) == 2 or (len(item) == 3 and item[1].is_word("AS")) else None
+        if len(item) == 1:
+            group_outputs[item[0].upper] = item[0].upper
+        elif alias is not None and alias.kind in (WORD, QUOTED):
+            group_outputs[item[0].upper] = alias.value.strip('"') if alias.kind == QUOTED else alias.upper
+
+    conjuncts = _conjuncts(tokens[clauses["WHERE"] + 1:where_end])
+    if conjuncts is None:
+        return None
+    filters, kept = [], []
+    for conjunct in conjuncts:
+        group_filter = _group_filter(conjunct, group_outputs)
+        if group_filter is None:
+            kept.append(conjunct)
+        else:
+            filters.append(group_filter)
+    if not filters:
+        return None
+
+    parts = [token.value for token in tokens[:clauses["WHERE"]]]
+    if kept:
+        parts.append("WHERE")
+        parts.append(" AND ".join(" ".join(token.value for token in conjunct) for conjunct in kept))
+    parts.extend(token.value for token in tokens[where_end:])
+    return " ".join(parts), filters
+
+
+class QueryResultCache:
+    """LRU cache of query DataFrames, off unless enabled (e.g. for the length of a batch run)"""
+
+    def __init__(self, enabled: bool = False, max_entries: int = 512, ttl_seconds: float = 3600.0,
+                 answer_from_broader: bool = True):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.answer_from_broader = answer_from_broader
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "derived": 0}
+
+    @classmethod
+    def from_config(cls, config: dict = None) -> "QueryResultCache":
+        """Build the cache from the database.result_cache config block"""
+        cache_config = (config or {}).get("result_cache", {})
+        return cls(
+            enabled=cache_config.get("enabled", False),
+            max_entries=cache_config.get("max_entries", 512),
+            ttl_seconds=cache_config.get("ttl_seconds", 3600.0),
+            answer_from_broader=cache_config.get("answer_from_broader", True)
+        )
+
+    @staticmethod
+    def key(analysis: SQLAnalysis, params: dict = None, accuracy: str = None) -> tuple:
+        """Cache key: statement shape, its literal values, bind values and requested accuracy"""
+        bound = tuple(sorted((str(name), repr(value)) for name, value in (params or {}).items()))
+        return analysis.fingerprint, tuple(analysis.literals), bound, accuracy
+
+    def _lookup(self, key: tuple):
+        """Cached frame for key (not copied), or None; caller holds the lock"""
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry[0] > self.ttl_seconds:
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def get(self, key: tuple):
+        """Copy of a cached result, or None"""
+        with self._lock:
+            df = self._lookup(key)
+            self._stats["hits" if df is not None else "misses"] += 1
+        # Callers may add columns or attrs; the cached frame stays untouched
+        return None if df is None else df.copy()
+
+    def get_filtered(self, analysis: SQLAnalysis, params: dict = None, accuracy: str = None):
+        """Result of a query that narrows a cached GROUP BY query to some groups, or None"""
+        if not self.answer_from_broader:
+            return None
+        broader = broader_query(analysis)
+        if broader is None:
+            return None
+        broader_sql, filters = broader
+        try:
+            key = self.key(analyze_sql(broader_sql), params, accuracy)
+        except SQLAnalysisError:
+            return None
+        with self._lock:
+            df = self._lookup(key)
+        # A broader result cut off by the cost gate may be missing the wanted groups
+        if df is None or df.attrs.get("row_limit"):
+            return None
+
+        mask = pd.Series(True, index=df.index)
+        for column, values in filters:
+            if column not in df.columns:
+                return None
+            if all(isinstance(value, float) for value in values):
+                mask &= pd.to_numeric(df[column], errors="coerce").isin(values)
+            else:
+                mask &= df[column].isin(values)
+        with self._lock:
+            self._stats["derived"] += 1
+        return df[mask].reset_index(drop=True)
+
+    def put(self, key: tuple, df):
+        with self._lock:
+            self._entries[key] = (time.time(), df.copy())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        lookups = stats["hits"] + stats["misses"]
+        stats.update(enabled=self.enabled, hit_rate=round(stats["hits"] / lookups, 3) if lookups else 0.0)
+        return stats
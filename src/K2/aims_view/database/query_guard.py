@@ -0,0 +1,103 @@
+"""
+Pre-execution cost gate for LLM-generated SQL
+Reads the optimizer's EXPLAIN PLAN estimates and rejects (or row-limits) queries that would run unbounded
+"""
+
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Columns read back from PLAN_TABLE, in order
+PLAN_COLUMNS = ["ID", "PARENT_ID", "OPERATION", "OPTIONS", "OBJECT_NAME", "COST", "CARDINALITY", "BYTES"]
+
+
+class QueryPlanRejected(Exception):
+    """Raised when a query's estimated plan exceeds the configured limits
+
+    The message describes the plan problem and how to fix it, so it can be
+    passed straight back to the query architect as retry feedback.
+    """
+
+    def __init__(self, message: str, plan: "PlanEstimate" = None):
+        super().__init__(message)
+        self.plan = plan
+
+
+class PlanEstimate:
+    """Optimizer estimates for one query"""
+
+    def __init__(self, rows: List[dict]):
+        self.steps = rows
+        root = rows[0] if rows else {}
+        self.cost = root.get("COST") or 0
+        self.cardinality = root.get("CARDINALITY") or 0
+        self.bytes = root.get("BYTES") or 0
+        self.cartesian = any("CARTESIAN" in (step.get("OPTIONS") or "") for step in rows)
+        self.full_scans = [
+            step.get("OBJECT_NAME") for step in rows
+            if step.get("OPERATION") == "TABLE ACCESS" and step.get("OPTIONS") == "FULL"
+        ]
+
+    def summary(self) -> str:
+        """One-line plan description for logs and retry prompts"""
+        parts = [f"estimated cost {self.cost:,}", f"estimated rows {self.cardinality:,}"]
+        if self.cartesian:
+            parts.append("contains a MERGE JOIN CARTESIAN")
+        if self.full_scans:
+            parts.append(f"full scans on {', '.join(sorted(set(filter(None, self.full_scans))))}")
+        return "; ".join(parts)
+
+
+class QueryGuard:
+    """Decides from a plan estimate whether a query may run"""
+
+    def __init__(self, enabled: bool = False, max_cost: int = 5000000, max_rows: int = 200000,
+                 reject_cartesian: bool = True, on_row_limit: str = "reject"):
+        self.enabled = enabled
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.reject_cartesian = reject_cartesian
+        # "reject" sends the query back to the architect; "limit" runs it with FETCH FIRST max_rows
+        self.on_row_limit = on_row_limit
+
+    @classmethod
+    def from_config(cls, config: dict = None) -> "QueryGuard":
+        """Build a guard from the database.query_guard config block"""
+        guard_config = (config or {}).get("query_guard", {})
+        return cls(
+            enabled=guard_config.get("enabled", False),
+            max_cost=guard_config.get("max_cost", 5000000),
+            max_rows=guard_config.get("max_rows", 200000),
+            reject_cartesian=guard_config.get("reject_cartesian", True),
+            on_row_limit=guard_config.get("on_row_limit", "reject")
+        )
+
+    def check(self, plan: PlanEstimate) -> Optional[int]:
+        """Raise QueryPlanRejected for plans over the limits; return a row limit to apply, if any"""
+        if self.reject_cartesian and plan.cartesian:
+            raise QueryPlanRejected(
+                f"Query plan rejected ({plan.summary()}). The query joins without a join condition - "
+                f"add the missing join predicate or remove the self-join.",
+                plan
+            )
+        if self.max_cost and plan.cost > self.max_cost:
+            raise QueryPlanRejected(
+                f"Query plan rejected ({plan.summary()}; limit {self.max_cost:,}). Add selective WHERE filters "
+                f"(e.g. a date range on DOC_REG_DT) or aggregate with GROUP BY/COUNT/SUM instead of returning raw rows.",
+                plan
+            )
+        if self.max_rows and plan.cardinality > self.max_rows:
+            if self.on_row_limit == "limit":
+                return self.max_rows
+            raise QueryPlanRejected(
+                f"Query plan rejected ({plan.summary()}; limit {self.max_rows:,} rows). Aggregate in SQL "
+                f"(GROUP BY/COUNT/SUM) or add filters so the result answers the question without returning every row.",
+                plan
+            )
+        return None
+
+    @staticmethod
+    def limit_sql(sql: str, max_rows: int) -> str:
+        """Wrap a query so it returns at most max_rows rows"""
+        return f"SELECT * FROM ({sql}) FETCH FIRST {int(max_rows)} ROWS ONLY"
@@ -0,0 +1,112 @@
+"""
+Single-flight query execution
+Concurrent requests for the same query (same normalized fingerprint, literals, binds and accuracy)
+wait for one in-flight execution and share its result instead of each running it against Oracle
+"""
+
+import logging
+import threading
+import time
+from typing import Callable
+
+from src.K2.aims_view.database.errors import QueryTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# How often a waiting request re-checks whether it was cancelled
+WAIT_POLL_SECONDS = 0.2
+
+
+class _Flight:
+    """One in-flight execution and the requests waiting on it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicates concurrent executions of identical queries
+
+    The first caller for a key runs the query; callers arriving while it runs
+    block until it finishes and get a copy of its DataFrame, or its exception.
+    Errors listed in retry_errors (e.g. the first caller's request being
+    cancelled, or its shorter timeout expiring) are not shared: a waiter then
+    runs the query itself.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {"executions": 0, "shared": 0}
+
+    @classmethod
+    def from_config(cls, config: dict = None) -> "SingleFlight":
+        """Build from the database.single_flight config block"""
+        single_flight_config = (config or {}).get("single_flight", {})
+        return cls(enabled=single_flight_config.get("enabled", True))
+
+    def run(self, key: tuple, execute: Callable, check_cancelled: Callable = None, retry_errors: tuple = (),
+            deadline: float = None):
+        """Return execute()'s DataFrame, sharing one execution among concurrent callers with the same key
+
+        check_cancelled() is called while waiting and should raise if the caller's
+        request was cancelled. A waiter still waiting at deadline (time.time())
+        raises QueryTimeoutError instead of outliving its own time limit.
+        """
+        if not self.enabled:
+            return execute()
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                    self._stats["executions"] += 1
+                else:
+                    flight.waiters += 1
+            if leader:
+                return self._lead(key, flight, execute)
+
+            while not flight.done.wait(self._poll_seconds(deadline)):
+                if check_cancelled is not None:
+                    check_cancelled()
+                if deadline is not None and time.time() >= deadline:
+                    raise QueryTimeoutError("Timed out waiting for an identical query that is still running.")
+            if flight.error is None:
+                with self._lock:
+                    self._stats["shared"] += 1
+                logger.info(f"Shared the result of an identical in-flight query with {flight.waiters} waiting request(s)")
+                return flight.result.copy()
+            if not isinstance(flight.error, retry_errors):
+                raise flight.error
+            # The first caller gave up for its own reasons - run it again for this request
+
+    @staticmethod
+    def _poll_seconds(deadline: float = None) -> float:
+        if deadline is None:
+            return WAIT_POLL_SECONDS
+        return max(0.0, min(WAIT_POLL_SECONDS, deadline - time.time()))
+
+    def _lead(self, key: tuple, flight: _Flight, execute: Callable):
+        try:
+            df = execute()
+            # Waiters copy from a private frame, so the leader's caller can modify its own freely
+            flight.result = df.copy()
+            return df
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, in_flight=len(self._flights))
+        stats["enabled"] = self.enabled
+        return stats
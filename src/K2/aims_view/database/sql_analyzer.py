@@ -0,0 +1,367 @@
+"""
+Single-pass SQL tokenizer and structural analyzer for LLM-generated Oracle queries
+Checks SELECT-only, single-statement and allowed-table rules on tokens instead of regexes over raw text,
+and produces a normalized fingerprint that caching, cost estimation and rewriting can reuse
+"""
+
+import hashlib
+from functools import lru_cache
+from typing import List, Optional
+
+# Tables generated queries may read (schema-qualified, upper case)
+ALLOWED_TABLES = frozenset({"INSMV.AIMS_ALL_DATA"})
+
+# Bare words that can never appear in a read-only query
+FORBIDDEN_KEYWORDS = frozenset({
+    "INSERT", "UPDATE", "DELETE", "MERGE", "UPSERT", "DROP", "CREATE", "ALTER", "TRUNCATE", "RENAME",
+    "GRANT", "REVOKE", "EXEC", "EXECUTE", "BEGIN", "DECLARE", "CALL", "COMMIT", "ROLLBACK", "SAVEPOINT",
+    "LOCK", "PURGE", "FLASHBACK", "ANALYZE", "AUDIT", "NOAUDIT", "COMMENT"
+})
+
+# Built-in packages and object types whose calls can run SQL or reach outside the database
+FORBIDDEN_FUNCTION_PREFIXES = ("DBMS_", "UTL_", "OWA_")
+FORBIDDEN_FUNCTIONS = frozenset({"HTTPURITYPE", "DBURITYPE", "XDBURITYPE"})
+
+# Keywords that end a FROM list at the same nesting depth
+FROM_TERMINATORS = frozenset({
+    "WHERE", "GROUP", "ORDER", "HAVING", "CONNECT", "START", "UNION", "INTERSECT", "MINUS", "EXCEPT",
+    "FETCH", "OFFSET", "MODEL", "WINDOW", "FOR", "PIVOT", "UNPIVOT"
+})
+
+# Functions whose argument syntax uses FROM without naming a table
+FROM_IN_FUNCTIONS = frozenset({"EXTRACT", "TRIM", "SUBSTRING"})
+
+# Token kinds
+WORD = "WORD"          # Keyword or unquoted identifier
+QUOTED = "QUOTED"      # "Quoted identifier"
+STRING = "STRING"      # 'string literal'
+NUMBER = "NUMBER"
+BIND = "BIND"          # :bind_variable
+PUNCT = "PUNCT"        # ( ) , . ; @
+OP = "OP"
+
+_TWO_CHAR_OPS = {"<=", ">=", "<>", "!=", "^=", "||", "=>", ":="}
+_Q_QUOTE_CLOSERS = {"[": "]", "{": "}", "(": ")", "<": ">"}
+
+
+class SQLAnalysisError(ValueError):
+    """Raised when a query is malformed or breaks a read-only rule"""
+    pass
+
+
+class Token:
+    """One lexical token with its position in the original text"""
+
+    __slots__ = ("kind", "value", "upper", "start", "end")
+
+    def __init__(self, kind: str, value: str, start: int, end: int):
+        self.kind = kind
+        self.value = value
+        self.upper = value.upper() if kind == WORD else value
+        self.start = start
+        self.end = end
+
+    def is_word(self, *words) -> bool:
+        return self.kind == WORD and self.upper in words
+
+    def __repr__(self) -> str:
+        return f"Token({self.kind}, {self.value!r})"
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char in "_$#"
+
+
+def tokenize(sql: str) -> List[Token]:
+    """Split SQL into tokens in one left-to-right pass, dropping comments"""
+    tokens = []
+    i = 0
+    length = len(sql)
+
+    while i < length:
+        char = sql[i]
+
+        if char.isspace():
+            i += 1
+            continue
+
+        # Comments (including /*+ hints) carry no meaning for the checks
+        if sql.startswith("--", i):
+            newline = sql.find("\n", i)
+            i = length if newline < 0 else newline + 1
+            continue
+        if sql.startswith("/*", i):
+            close = sql.find("*/", i + 2)
+            if close < 0:
+                raise SQLAnalysisError("Unterminated comment in SQL query")
+            i = close + 2
+            continue
+
+        start = i
+
+        # Alternative quoting: q'[...]', nq'{...}'
+        if char in "qQ" and sql.startswith("'", i + 1) or (char in "nN" and sql[i + 1:i + 3].upper() == "Q'"):
+            quote_at = sql.index("'", i)
+            if quote_at + 1 >= length:
+                raise SQLAnalysisError("Unterminated string literal in SQL query")
+            delimiter = sql[quote_at + 1]
+            closer = _Q_QUOTE_CLOSERS.get(delimiter, delimiter) + "'"
+            close = sql.find(closer, quote_at + 2)
+            if close < 0:
+                raise SQLAnalysisError("Unterminated string literal in SQL query")
+            i = close + 2
+            tokens.append(Token(STRING, sql[start:i], start, i))
+            continue
+
+        # National character literal N'...'
+        if char in "nN" and sql.startswith("'", i + 1):
+            i += 1
+            char = "'"
+
+        if char == "'":
+            i += 1
+            while True:
+                close = sql.find("'", i)
+                if close < 0:
+                    raise SQLAnalysisError("Unterminated string literal in SQL query")
+                if sql.startswith("''", close):
+                    i = close + 2
+                    continue
+                i = close + 1
+                break
+            tokens.append(Token(STRING, sql[start:i], start, i))
+            continue
+
+        if char == '"':
+            close = sql.find('"', i + 1)
+            if close < 0:
+                raise SQLAnalysisError("Unterminated quoted identifier in SQL query")
+            i = close + 1
+            tokens.append(Token(QUOTED, sql[start:i], start, i))
+            continue
+
+        if char.isdigit() or (char == "." and i + 1 < length and sql[i + 1].isdigit()):
+            i += 1
+            while i < length and (sql[i].isdigit() or sql[i] == "."):
+                i += 1
+            if i < length and sql[i] in "eE" and (i + 1 < length) and (sql[i + 1].isdigit() or sql[i + 1] in "+-"):
+                i += 2
+                while i < length and sql[i].isdigit():
+                    i += 1
+            if i < length and sql[i] in "fFdD" and not (i + 1 < length and _is_word_char(sql[i + 1])):
+                i += 1
+            tokens.append(Token(NUMBER, sql[start:i], start, i))
+            continue
+
+        if _is_word_char(char):
+            while i < length and _is_word_char(sql[i]):
+                i += 1
+            tokens.append(Token(WORD, sql[start:i], start, i))
+            continue
+
+        if char == ":" and i + 1 < length and (_is_word_char(sql[i + 1])):
+            i += 1
+            while i < length and _is_word_char(sql[i]):
+                i += 1
+            tokens.append(Token(BIND, sql[start:i], start, i))
+            continue
+
+        if char in "(),.;@":
+            tokens.append(Token(PUNCT, char, start, i + 1))
+            i += 1
+            continue
+
+        if sql[i:i + 2] in _TWO_CHAR_OPS:
+            tokens.append(Token(OP, sql[i:i + 2], start, i + 2))
+            i += 2
+            continue
+
+        tokens.append(Token(OP, char, start, i + 1))
+        i += 1
+
+    return tokens
+
+
+class SQLAnalysis:
+    """Result of analyzing one query: tokens, referenced tables and a normalized fingerprint
+
+    sql is the query without surrounding whitespace, trailing semicolons or
+    trailing comments; token start/end offsets point into it.
+    """
+
+    def __init__(self, sql: str, tokens: List[Token], statement_type: str, tables: set, ctes: set,
+                 binds: list, literals: list, normalized: str):
+        self.sql = sql
+        self.tokens = tokens
+        self.statement_type = statement_type
+        self.tables = tables
+        self.ctes = ctes
+        self.binds = binds
+        self.literals = literals
+        self.normalized = normalized
+        self.fingerprint = hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+    def __repr__(self) -> str:
+        return f"SQLAnalysis({self.statement_type}, tables={sorted(self.tables)}, fingerprint={self.fingerprint})"
+
+
+def _table_allowed(name: str, ctes: set, allowed_tables: frozenset) -> bool:
+    if name in allowed_tables:
+        return True
+    if "." in name:
+        return False
+    # Unqualified names may be CTEs, DUAL, or a synonym for an allowed table
+    return name in ctes or name == "DUAL" or any(table.split(".")[-1] == name for table in allowed_tables)
+
+
+def _identifier(token: Token) -> str:
+    return token.value.strip('"').upper() if token.kind == QUOTED else token.upper
+
+
+def _read_table_ref(tokens: List[Token], i: int) -> (Optional[str], int):
+    """Read a table name starting at tokens[i]; returns (name, next index) or (None, i) for subqueries"""
+    if i < len(tokens) and tokens[i].is_word("LATERAL", "ONLY"):
+        i += 1
+    if i >= len(tokens) or tokens[i].kind not in (WORD, QUOTED):
+        return None, i
+
+    parts = [_identifier(tokens[i])]
+    i += 1
+    while i + 1 < len(tokens) and tokens[i].value == "." and tokens[i + 1].kind in (WORD, QUOTED):
+        parts.append(_identifier(tokens[i + 1]))
+        i += 2
+
+    if i < len(tokens) and tokens[i].value == "@":
+        raise SQLAnalysisError("Database links are not allowed in SQL queries")
+    if i < len(tokens) and tokens[i].value == "(":
+        raise SQLAnalysisError(f"Table function {'.'.join(parts)}() is not allowed in SQL queries")
+    return ".".join(parts), i
+
+
+def _opens_subquery(tokens: List[Token], i: int) -> bool:
+    """Whether the parenthesis at tokens[i] (possibly nested) starts a subquery rather than a table list"""
+    while i < len(tokens) and tokens[i].value == "(":
+        i += 1
+    return i < len(tokens) and tokens[i].is_word("SELECT", "WITH")
+
+
+def _analyze(sql: str, allowed_tables: frozenset) -> SQLAnalysis:
+    sql = sql.strip()
+    tokens = tokenize(sql)
+
+    # A single trailing semicolon is tolerated; anything after it is a second statement
+    while tokens and tokens[-1].value == ";":
+        tokens.pop()
+    if not tokens:
+        raise SQLAnalysisError("SQL query is empty")
+    if any(token.value == ";" for token in tokens):
+        raise SQLAnalysisError("SQL query must be a single statement")
+
+    first = next((token for token in tokens if token.value != "("), tokens[0])
+    if not first.is_word("SELECT", "WITH"):
+        raise SQLAnalysisError(f"SQL query must be a SELECT statement, not {first.value.upper()}")
+    statement_type = "SELECT"
+
+    tables, ctes, binds, literals, normalized = set(), set(), [], [], []
+    function_stack = []        # Name of the function (or None) owning each open parenthesis
+    from_depths = set()        # Depths currently inside a FROM list
+    expect_table = False
+    i = 0
+
+    while i < len(tokens):
+        token = tokens[i]
+        depth = len(function_stack)
+
+        if expect_table:
+            expect_table = False
+            if token.value == "(" and not _opens_subquery(tokens, i):
+                # Parenthesized join or table list, e.g. FROM (a JOIN b ON ...): its entries are table references too
+                function_stack.append(None)
+                from_depths.add(len(function_stack))
+                normalized.append("(")
+                expect_table = True
+                i += 1
+                continue
+            name, after = _read_table_ref(tokens, i)
+            if name is not None:
+                if not _table_allowed(name, ctes, allowed_tables):
+                    raise SQLAnalysisError(f"SQL query references table {name}, which is not allowed")
+                tables.add(name)
+                normalized.extend(tokens[j].upper if tokens[j].kind == WORD else tokens[j].value for j in range(i, after))
+                i = after
+                continue
+
+        if token.kind == WORD:
+            word = token.upper
+            if word in FORBIDDEN_KEYWORDS:
+                raise SQLAnalysisError(f"SQL query contains prohibited keyword {word}")
+            if word == "FROM" and not (function_stack and function_stack[-1] in FROM_IN_FUNCTIONS):
+                from_depths.add(depth)
+                expect_table = True
+            elif word in ("JOIN", "APPLY"):
+                # JOIN ..., CROSS APPLY ..., OUTER APPLY ...
+                expect_table = True
+            elif word in FROM_TERMINATORS:
+                from_depths.discard(depth)
+            # Common table expression: name AS (
+            if i + 2 < len(tokens) and tokens[i + 1].is_word("AS") and tokens[i + 2].value == "(":
+                ctes.add(word)
+            normalized.append(word)
+
+        elif token.kind == STRING or token.kind == NUMBER:
+            literals.append(token.value)
+            normalized.append("?")
+
+        elif token.kind == BIND:
+            binds.append(token.value[1:])
+            normalized.append(token.value.upper())
+
+        elif token.value == "(":
+            previous = tokens[i - 1] if i > 0 else None
+            if previous is not None and previous.kind in (WORD, QUOTED):
+                called = _identifier(previous)
+                if i > 1 and tokens[i - 2].value == ".":
+                    # schema.function( or package.function( - only unqualified built-in functions may be called
+                    raise SQLAnalysisError(f"Qualified function call {called}() is not allowed in SQL queries")
+                if called.startswith(FORBIDDEN_FUNCTION_PREFIXES) or called in FORBIDDEN_FUNCTIONS:
+                    raise SQLAnalysisError(f"Function {called}() is not allowed in SQL queries")
+            function_stack.append(previous.upper if previous is not None and previous.kind == WORD else None)
+            normalized.append("(")
+
+        elif token.value == ")":
+            if not function_stack:
+                raise SQLAnalysisError("Unbalanced parentheses in SQL query")
+            from_depths.discard(depth)
+            function_stack.pop()
+            normalized.append(")")
+
+        elif token.value == ",":
+            if depth in from_depths:
+                expect_table = True
+            normalized.append(",")
+
+        elif token.value == "@":
+            raise SQLAnalysisError("Database links are not allowed in SQL queries")
+
+        else:
+            normalized.append(token.value)
+
+        i += 1
+
+    if function_stack:
+        raise SQLAnalysisError("Unbalanced parentheses in SQL query")
+
+    # Token positions index into this text, so rewriters can splice it directly
+    clean_sql = sql[:tokens[-1].end]
+    return SQLAnalysis(clean_sql, tokens, statement_type, tables, ctes, binds, literals, " ".join(normalized))
+
+
+@lru_cache(maxsize=1024)
+def analyze_sql(sql: str, allowed_tables: frozenset = ALLOWED_TABLES) -> SQLAnalysis:
+    """Tokenize and check a query, raising SQLAnalysisError if it is not a safe single SELECT
+
+    Results are cached by query text, so retries and repeated validation are free.
+    """
+    if not sql or not isinstance(sql, str):
+        raise SQLAnalysisError("SQL query must be a non-empty string")
+    return _analyze(sql, allowed_tables)
@@ -0,0 +1,376 @@
+"""
+Predicate rewriter for sargable filters on insmv.AIMS_ALL_DATA
+Turns function-wrapped date filters (EXTRACT(YEAR FROM col) = N, TO_CHAR(col, 'YYYY') = 'N', TRUNC(col) = d)
+into half-open range predicates so Oracle can use indexes and partition pruning on the date columns
+"""
+
+import datetime
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+from src.K2.aims_view.database.sql_analyzer import NUMBER, QUOTED, STRING, WORD, SQLAnalysis, Token
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATE_COLUMNS = ["DOC_REG_DT", "DOC_ST_DT", "CLAIM_ACC_DT", "PAY_SLIP_DT"]
+
+# Tokens that may directly precede / follow a whole predicate
+_PREDICATE_STARTS = {"WHERE", "AND", "OR", "ON", "WHEN", "NOT"}
+_PREDICATE_ENDS = {"AND", "OR", "THEN", "ORDER", "GROUP", "HAVING", "UNION", "INTERSECT", "MINUS", "EXCEPT",
+                   "FETCH", "OFFSET", "CONNECT", "START", "ELSE", "END"}
+
+# Keywords that start a clause; only WHERE and ON conditions are rewritten, since the same expression
+# in a SELECT list, HAVING or ORDER BY must still match the GROUP BY expression (ORA-00979)
+_CLAUSE_KEYWORDS = {"SELECT", "FROM", "JOIN", "WHERE", "ON", "GROUP", "HAVING", "ORDER", "CONNECT", "START",
+                    "UNION", "INTERSECT", "MINUS", "EXCEPT", "FETCH", "OFFSET", "MODEL", "PIVOT", "UNPIVOT"}
+_FILTER_CLAUSES = {"WHERE", "ON"}
+
+# TO_CHAR / TO_DATE format masks understood by the rewriter
+_FORMAT_GRANULARITY = {"YYYY": "year", "RRRR": "year", "YYYY-MM": "month", "YYYYMM": "month", "YYYY/MM": "month"}
+_DATE_FORMATS = {
+    "YYYY-MM-DD": "%Y-%m-%d", "YYYY/MM/DD": "%Y/%m/%d", "YYYYMMDD": "%Y%m%d",
+    "DD-MM-YYYY": "%d-%m-%Y", "DD/MM/YYYY": "%d/%m/%Y", "MM/DD/YYYY": "%m/%d/%Y"
+}
+
+
+def _literal(token: Token) -> Optional[str]:
+    """Value of a plain '...' string literal"""
+    if token.kind != STRING or not token.value.startswith("'"):
+        return None
+    return token.value[1:-1].replace("''", "'")
+
+
+def _period_start(granularity: str, value: datetime.date) -> datetime.date:
+    if granularity == "year":
+        return value.replace(month=1, day=1)
+    if granularity == "month":
+        return value.replace(day=1)
+    return value
+
+
+def _next_period(granularity: str, value: datetime.date) -> datetime.date:
+    start = _period_start(granularity, value)
+    if granularity == "year":
+        return start.replace(year=start.year + 1)
+    if granularity == "month":
+        return start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start + datetime.timedelta(days=1)
+
+
+def _date_sql(value: datetime.date) -> str:
+    return f"DATE '{value.isoformat()}'"
+
+
+class RewriteResult:
+    """Rewritten query text and the rules that changed it"""
+
+    def __init__(self, original: str, sql: str, rules: List[str]):
+        self.original = original
+        self.sql = sql
+        self.rules = rules
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.rules)
+
+
+class SQLRewriter:
+    """Applies sargable predicate rewrites to analyzed queries and keeps timing statistics"""
+
+    def __init__(self, enabled: bool = True, date_columns: list = None, upper_indexed_columns: list = None,
+                 compare_original: bool = False):
+        self.enabled = enabled
+        self.date_columns = {column.upper() for column in (date_columns or DEFAULT_DATE_COLUMNS)}
+        self.upper_indexed_columns = {column.upper() for column in (upper_indexed_columns or [])}
+        self.compare_original = compare_original
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @classmethod
+    def from_config(cls, config: dict = None) -> "SQLRewriter":
+        """Build a rewriter from the database.sql_rewriter config block"""
+        rewriter_config = (config or {}).get("sql_rewriter", {})
+        return cls(
+            enabled=rewriter_config.get("enabled", True),
+            date_columns=rewriter_config.get("date_columns"),
+            upper_indexed_columns=rewriter_config.get("upper_indexed_columns"),
+            compare_original=rewriter_config.get("compare_original", False)
+        )
+
+    def rewrite(self, analysis: SQLAnalysis) -> RewriteResult:
+        """Rewrite non-sargable predicates in an analyzed query"""
+        if not self.enabled:
+            return RewriteResult(analysis.sql, analysis.sql, [])
+
+        tokens = analysis.tokens
+        filters = self._filter_positions(tokens)
+        edits = []
+        i = 0
+        while i < len(tokens):
+            match = None
+            if i in filters:
+                match = self._match_date_predicate(tokens, i) or self._match_upper_predicate(tokens, i)
+            if match is None:
+                i += 1
+                continue
+            end, replacement, rule = match
+            edits.append((tokens[i].start, tokens[end - 1].end, replacement, rule))
+            i = end
+
+        sql = analysis.sql
+        for start, end, replacement, _rule in reversed(edits):
+            sql = sql[:start] + replacement + sql[end:]
+        return RewriteResult(analysis.sql, sql, [rule for _start, _end, _replacement, rule in edits])
+
+    # Predicate matching on analyzer tokens
+
+    @staticmethod
+    def _filter_positions(tokens: List[Token]) -> set:
+        """Indexes of tokens inside a WHERE or ON condition, including expressions nested in it"""
+        clauses = [False]
+        positions = set()
+        for index, token in enumerate(tokens):
+            if token.value == "(":
+                # Parenthesized expressions belong to the enclosing clause until a subquery starts its own
+                clauses.append(clauses[-1])
+            elif token.value == ")":
+                if len(clauses) > 1:
+                    clauses.pop()
+            elif token.kind == WORD and token.upper in _CLAUSE_KEYWORDS:
+                clauses[-1] = token.upper in _FILTER_CLAUSES
+            elif clauses[-1]:
+                positions.add(index)
+        return positions
+
+    @staticmethod
+    def _starts_predicate(tokens: List[Token], i: int) -> bool:
+        if i == 0:
+            return True
+        previous = tokens[i - 1]
+        return previous.value == "(" or (previous.kind == WORD and previous.upper in _PREDICATE_STARTS)
+
+    @staticmethod
+    def _ends_predicate(tokens: List[Token], i: int) -> bool:
+        if i >= len(tokens):
+            return True
+        following = tokens[i]
+        return following.value == ")" or (following.kind == WORD and following.upper in _PREDICATE_ENDS)
+
+    @staticmethod
+    def _column(tokens: List[Token], i: int) -> Optional[Tuple[str, str, int]]:
+        """Read [alias.]column at i; returns (text, column name, next index)"""
+        if i >= len(tokens) or tokens[i].kind not in (WORD, QUOTED):
+            return None
+        parts = [tokens[i]]
+        j = i + 1
+        while j + 1 < len(tokens) and tokens[j].value == "." and tokens[j + 1].kind in (WORD, QUOTED):
+            parts.append(tokens[j + 1])
+            j += 2
+        name = parts[-1].value.strip('"').upper()
+        return ".".join(part.value for part in parts), name, j
+
+    @staticmethod
+    def _expect(tokens: List[Token], i: int, *values) -> bool:
+        if i >= len(tokens):
+            return False
+        token = tokens[i]
+        return (token.upper if token.kind == WORD else token.value) in values
+
+    def _match_date_expression(self, tokens: List[Token], i: int):
+        """Match EXTRACT(YEAR FROM col), TO_CHAR(col, 'YYYY[-MM]') or TRUNC(col) on a date column
+
+        Returns (granularity, column text, value kind, next index), where value kind is how the
+        compared literal is written: 'year', 'mask:<format>' or 'date'.
+        """
+        token = tokens[i]
+        if token.kind != WORD or not self._expect(tokens, i + 1, "("):
+            return None
+
+        if token.upper == "EXTRACT" and self._expect(tokens, i + 2, "YEAR") and self._expect(tokens, i + 3, "FROM"):
+            column = self._column(tokens, i + 4)
+            if column and column[1] in self.date_columns and self._expect(tokens, column[2], ")"):
+                return "year", column[0], "year", column[2] + 1
+
+        if token.upper == "TO_CHAR":
+            column = self._column(tokens, i + 2)
+            if column and column[1] in self.date_columns and self._expect(tokens, column[2], ","):
+                mask = _literal(tokens[column[2] + 1]) if column[2] + 1 < len(tokens) else None
+                granularity = _FORMAT_GRANULARITY.get((mask or "").upper())
+                if granularity and self._expect(tokens, column[2] + 2, ")"):
+                    return granularity, column[0], f"mask:{mask.upper()}", column[2] + 3
+
+        if token.upper == "TRUNC":
+            column = self._column(tokens, i + 2)
+            if column and column[1] in self.date_columns and self._expect(tokens, column[2], ")"):
+                return "day", column[0], "date", column[2] + 1
+
+        return None
+
+    def _read_value(self, tokens: List[Token], i: int, value_kind: str) -> Optional[Tuple[datetime.date, int]]:
+        """Read the compared literal at i; returns (date, next index)"""
+        if i >= len(tokens):
+            return None
+        token = tokens[i]
+
+        if value_kind == "year":
+            text = token.value if token.kind == NUMBER else _literal(token)
+            if text and text.isdigit() and 1900 <= int(text) <= 2200:
+                return datetime.date(int(text), 1, 1), i + 1
+            return None
+
+        if value_kind.startswith("mask:"):
+            text = _literal(token)
+            python_format = {"YYYY": "%Y", "RRRR": "%Y", "YYYY-MM": "%Y-%m", "YYYYMM": "%Y%m", "YYYY/MM": "%Y/%m"}
+            if text is None and token.kind == NUMBER and value_kind in ("mask:YYYY", "mask:RRRR"):
+                text = token.value
+            try:
+                return datetime.datetime.strptime(text, python_format[value_kind[5:]]).date(), i + 1
+            except (TypeError, ValueError):
+                return None
+
+        # DATE 'YYYY-MM-DD' or TO_DATE('...', 'mask')
+        if token.is_word("DATE") and i + 1 < len(tokens):
+            try:
+                return datetime.date.fromisoformat(_literal(tokens[i + 1]) or ""), i + 2
+            except ValueError:
+                return None
+        if token.is_word("TO_DATE") and self._expect(tokens, i + 1, "(") and i + 5 < len(tokens):
+            text, mask = _literal(tokens[i + 2]), _literal(tokens[i + 4])
+            python_format = _DATE_FORMATS.get((mask or "").upper())
+            if text and python_format and self._expect(tokens, i + 3, ",") and self._expect(tokens, i + 5, ")"):
+                try:
+                    return datetime.datetime.strptime(text, python_format).date(), i + 6
+                except ValueError:
+                    return None
+        return None
+
+    def _range_sql(self, column: str, granularity: str, operator: str, low: datetime.date,
+                   high: datetime.date = None) -> str:
+        """Half-open range predicate equivalent to <period(column)> <operator> <period(low)>"""
+        if operator == "=":
+            return f"({column} >= {_date_sql(_period_start(granularity, low))} AND {column} < {_date_sql(_next_period(granularity, low))})"
+        if operator == ">=":
+            return f"{column} >= {_date_sql(_period_start(granularity, low))}"
+        if operator == ">":
+            return f"{column} >= {_date_sql(_next_period(granularity, low))}"
+        if operator == "<":
+            return f"{column} < {_date_sql(_period_start(granularity, low))}"
+        if operator == "<=":
+            return f"{column} < {_date_sql(_next_period(granularity, low))}"
+        # BETWEEN low AND high
+        return f"({column} >= {_date_sql(_period_start(granularity, low))} AND {column} < {_date_sql(_next_period(granularity, high))})"
+
+    def _match_date_predicate(self, tokens: List[Token], i: int):
+        if not self._starts_predicate(tokens, i):
+            return None
+        expression = self._match_date_expression(tokens, i)
+        if expression is None:
+            return None
+        granularity, column, value_kind, j = expression
+        if j >= len(tokens):
+            return None
+        operator = tokens[j].upper if tokens[j].kind == WORD else tokens[j].value
+        rule = f"sargable_{granularity}"
+
+        if operator in ("=", ">=", ">", "<", "<="):
+            value = self._read_value(tokens, j + 1, value_kind)
+            if value and self._ends_predicate(tokens, value[1]):
+                return value[1], self._range_sql(column, granularity, operator, value[0]), rule
+
+        elif operator == "BETWEEN":
+            low = self._read_value(tokens, j + 1, value_kind)
+            if low and self._expect(tokens, low[1], "AND"):
+                high = self._read_value(tokens, low[1] + 1, value_kind)
+                if high and self._ends_predicate(tokens, high[1]) and low[0] <= high[0]:
+                    return high[1], self._range_sql(column, granularity, "BETWEEN", low[0], high[0]), rule
+
+        elif operator == "IN" and self._expect(tokens, j + 1, "("):
+            values, k = [], j + 2
+            while True:
+                value = self._read_value(tokens, k, value_kind)
+                if value is None:
+                    return None
+                values.append(value[0])
+                if self._expect(tokens, value[1], ","):
+                    k = value[1] + 1
+                    continue
+                if self._expect(tokens, value[1], ")") and self._ends_predicate(tokens, value[1] + 1):
+                    k = value[1] + 1
+                    break
+                return None
+            ranges = " OR ".join(self._range_sql(column, granularity, "=", value) for value in sorted(set(values)))
+            return k, f"({ranges})", rule
+
+        return None
+
+    def _match_upper_predicate(self, tokens: List[Token], i: int):
+        """UPPER(col) LIKE UPPER('x') / LOWER(col) LIKE 'x' -> UPPER(col) LIKE 'X' for UPPER-indexed columns"""
+        if not self.upper_indexed_columns or not self._starts_predicate(tokens, i):
+            return None
+        token = tokens[i]
+        if not token.is_word("UPPER", "LOWER") or not self._expect(tokens, i + 1, "("):
+            return None
+        column = self._column(tokens, i + 2)
+        if not column or column[1] not in self.upper_indexed_columns or not self._expect(tokens, column[2], ")"):
+            return None
+
+        j = column[2] + 1
+        if not self._expect(tokens, j, "LIKE", "="):
+            return None
+        operator = tokens[j].upper if tokens[j].kind == WORD else tokens[j].value
+
+        k = j + 1
+        if k < len(tokens) and tokens[k].is_word("UPPER", "LOWER") and self._expect(tokens, k + 1, "("):
+            text = _literal(tokens[k + 2]) if k + 2 < len(tokens) else None
+            if text is None or not self._expect(tokens, k + 3, ")"):
+                return None
+            text = text.upper() if tokens[k].upper == "UPPER" else text.lower()
+            end = k + 4
+        else:
+            text = _literal(tokens[k]) if k < len(tokens) else None
+            # UPPER(col) LIKE 'X' is already index-friendly
+            if text is None or token.upper == "UPPER":
+                return None
+            end = k + 1
+
+        # LOWER(col) = 'Ali' matches nothing; only rewrite literals already in the function's case
+        if text != (text.upper() if token.upper == "UPPER" else text.lower()):
+            return None
+        if not (self._ends_predicate(tokens, end) or self._expect(tokens, end, "ESCAPE")):
+            return None
+        escaped = text.upper().replace("'", "''")
+        return end, f"UPPER({column[0]}) {operator} '{escaped}'", "upper_index"
+
+    # Timing statistics
+
+    def record_timing(self, result: RewriteResult, rewritten_seconds: float, original_seconds: float = None):
+        """Log and accumulate execution time of a rewritten query (and its original, when compared)"""
+        rules = ", ".join(sorted(set(result.rules)))
+        if original_seconds is None:
+            logger.info(f"Rewritten query ({rules}) executed in {rewritten_seconds:.3f}s")
+        else:
+            logger.info(f"Rewritten query ({rules}) executed in {rewritten_seconds:.3f}s "
+                        f"vs original {original_seconds:.3f}s")
+        with self._lock:
+            for rule in set(result.rules):
+                stats = self._stats.setdefault(rule, {"count": 0, "rewritten_seconds": 0.0,
+                                                      "compared": 0, "original_seconds": 0.0})
+                stats["count"] += 1
+                stats["rewritten_seconds"] += rewritten_seconds
+                if original_seconds is not None:
+                    stats["compared"] += 1
+                    stats["original_seconds"] += original_seconds
+
+    def get_stats(self) -> dict:
+        """Per-rule rewrite counts and average timings"""
+        with self._lock:
+            return {
+                rule: {
+                    "count": stats["count"],
+                    "avg_rewritten_seconds": round(stats["rewritten_seconds"] / stats["count"], 4),
+                    "compared": stats["compared"],
+                    "avg_original_seconds": round(stats["original_seconds"] / stats["compared"], 4) if stats["compared"] else None
+                }
+                for rule, stats in self._stats.items()
+            }
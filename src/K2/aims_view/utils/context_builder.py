@@ -2,6 +2,8 @@
 Context builder utilities for AI agents
 """
 
+from src.K2.aims_view.core.step_result import StepResult
+
 
 def get_comprehensive_aims_knowledge_summary() -> str:
     """Get a comprehensive summary of AIMS database knowledge for agent tasks"""
@@ -105,7 +107,10 @@ def build_previous_results_context(intermediate_data: dict) -> str:
     
     previous_results_context = f"\nPREVIOUS STEP RESULTS:\n"
     for step_key, step_data in intermediate_data.items():
-        if isinstance(step_data, dict) and 'results' in step_data:
+        if isinstance(step_data, StepResult):
+            if step_data.succeeded:
+                previous_results_context += step_data.context_line() + "\n"
+        elif isinstance(step_data, dict) and 'results' in step_data:
             result_summary = f"- {step_key}: {len(step_data['results'])} rows"
             if len(step_data['results']) > 0:
                 # Show ALL column names (no truncation)
@@ -0,0 +1,141 @@
+"""
+Entity extraction and per-session inverted index for conversation memory
+Entities are extracted once when a turn is saved; lookups are set intersections
+"""
+
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Set
+
+
+ENTITY_LABELS = OrderedDict([
+    ("national_id", "Customer ID(s)"),
+    ("company_id", "Company ID(s)"),
+    ("name", "Name(s)"),
+    ("broker", "Broker(s)"),
+    ("lob", "Line(s) of business"),
+    ("year", "Year(s)"),
+    ("result", "Previous results")
+])
+
+# Result counts describe an answer; they are shown as context but never matched on
+UNINDEXED_TYPES = {"result"}
+
+LINES_OF_BUSINESS = [
+    "motor", "medical", "fire", "marine", "engineering", "travel", "life", "property",
+    "liability", "health", "general accident", "home", "energy", "aviation"
+]
+
+NAME_STOPWORDS = {
+    "how", "what", "which", "who", "when", "where", "why", "list", "show", "give", "get", "find",
+    "display", "count", "total", "compare", "please", "the", "for", "and", "in", "of", "to", "a",
+    "an", "is", "are", "can", "does", "do", "i", "me", "my", "customer", "customers", "company",
+    "policy", "policies", "claim", "claims", "broker", "agent", "premium", "year", "month",
+    "main", "branch", "qar", "aims", "sql", "direct", "business", "previous", "context",
+    "january", "february", "march", "april", "may", "june", "july", "august", "september",
+    "october", "november", "december"
+} | set(LINES_OF_BUSINESS)
+
+CONTINUATION_KEYWORDS = {"same", "this", "that", "also", "additionally", "more", "further", "his", "her", "their", "them"}
+
+NATIONAL_ID_PATTERN = re.compile(r'\b\d{11}\b')
+COMPANY_ID_PATTERN = re.compile(r'\b(?:company|comp(?:any)?[\s_]*id|eid|customer\s+code|code)\D{0,20}?(\d{6,10})\b', re.IGNORECASE)
+YEAR_PATTERN = re.compile(r'\b(?:19|20)\d{2}\b')
+BROKER_PATTERN = re.compile(r'\b(?:broker|agent)s?\s+(?:named\s+|called\s+)?([A-Z][\w&.\-]*(?:\s+[A-Z][\w&.\-]*)*)')
+NAME_PATTERN = re.compile(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b')
+RESULT_PATTERN = re.compile(r'(\d[\d,]*)\s+(policies|claims|transactions|customers)', re.IGNORECASE)
+LOB_PATTERN = re.compile(r'\b(' + '|'.join(re.escape(lob) for lob in LINES_OF_BUSINESS) + r')\b', re.IGNORECASE)
+WORD_PATTERN = re.compile(r'[a-z]+')
+
+
+def _clean_name(name: str) -> str:
+    """Drop leading/trailing stopwords from a capitalized word run"""
+    words = name.split()
+    while words and words[0].lower() in NAME_STOPWORDS:
+        words.pop(0)
+    while words and words[-1].lower() in NAME_STOPWORDS:
+        words.pop()
+    return " ".join(words).lower()
+
+
+def extract_entities(question: str, answer: str = "") -> List[str]:
+    """Extract typed entities ("type:value") from a question and its answer"""
+    text = f"{question} {answer}"
+    entities = set()
+
+    entities.update(f"national_id:{value}" for value in NATIONAL_ID_PATTERN.findall(text))
+    entities.update(f"company_id:{value}" for value in COMPANY_ID_PATTERN.findall(text))
+    entities.update(f"year:{value}" for value in YEAR_PATTERN.findall(text))
+    entities.update(f"lob:{value.lower()}" for value in LOB_PATTERN.findall(text))
+
+    brokers = {_clean_name(value) for value in BROKER_PATTERN.findall(text)}
+    entities.update(f"broker:{value}" for value in brokers if value)
+
+    # Names come from the question only; answers are full of capitalized prose
+    for value in NAME_PATTERN.findall(question):
+        name = _clean_name(value)
+        if name and name not in brokers:
+            entities.add(f"name:{name}")
+
+    entities.update(f"result:{count} {noun.lower()}" for count, noun in RESULT_PATTERN.findall(answer))
+    return sorted(entities)
+
+
+def is_continuation(question: str) -> bool:
+    """Check whether a question refers back to the previous answer"""
+    return bool(CONTINUATION_KEYWORDS & set(WORD_PATTERN.findall(question.lower())))
+
+
+def format_entities(entities: Iterable[str]) -> str:
+    """Summarize stored entities as memory context text"""
+    grouped = {}
+    for entity in entities:
+        entity_type, _, value = entity.partition(":")
+        grouped.setdefault(entity_type, []).append(value)
+
+    parts = []
+    for entity_type, label in ENTITY_LABELS.items():
+        if entity_type in grouped:
+            parts.append(f"{label}: {', '.join(sorted(grouped[entity_type]))}")
+    return " | ".join(parts)
+
+
+class SessionEntityIndex:
+    """Inverted index from entity to the turns of one session that mention it"""
+
+    def __init__(self, max_turns: int = 50):
+        self.max_turns = max_turns
+        self._turns = OrderedDict()
+        self._postings: Dict[str, Set[int]] = {}
+
+    def add(self, turn_id: int, entities: Iterable[str]):
+        """Index one turn, evicting the oldest turn past max_turns"""
+        indexed = {entity for entity in entities if entity.partition(":")[0] not in UNINDEXED_TYPES}
+        self._turns[turn_id] = indexed
+        for entity in indexed:
+            self._postings.setdefault(entity, set()).add(turn_id)
+
+        while len(self._turns) > self.max_turns:
+            old_id, old_entities = self._turns.popitem(last=False)
+            for entity in old_entities:
+                postings = self._postings.get(entity)
+                if postings is not None:
+                    postings.discard(old_id)
+                    if not postings:
+                        del self._postings[entity]
+
+    def lookup(self, entities: Iterable[str], limit: int = 3) -> List[int]:
+        """Turn ids sharing entities with the query, best overlap then most recent first"""
+        overlap = {}
+        for entity in entities:
+            for turn_id in self._postings.get(entity, ()):
+                overlap[turn_id] = overlap.get(turn_id, 0) + 1
+        ranked = sorted(overlap, key=lambda turn_id: (overlap[turn_id], turn_id), reverse=True)
+        return ranked[:limit]
+
+    def latest(self) -> int:
+        """Most recent indexed turn id, or None for an empty session"""
+        return next(reversed(self._turns), None)
+
+    def __len__(self) -> int:
+        return len(self._turns)
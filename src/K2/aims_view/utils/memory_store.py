@@ -0,0 +1,312 @@
+"""
+Append-only, per-session conversation memory store backed by SQLite
+Each turn is one INSERT; recent turns per session are served from bounded ring buffers
+"""
+
+import json
+import logging
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+from src.K2.aims_view.utils.memory_entities import SessionEntityIndex, extract_entities, is_continuation
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_SESSION_ID = "default"
+
+
+def new_session_id() -> str:
+    """Create an unguessable session id (the session id is the only credential for a session's memory and results)"""
+    return f"session_{secrets.token_urlsafe(24)}"
+
+
+class _SessionMemory:
+    """In-process state of one session: recent turns and the entity index"""
+
+    def __init__(self, memory_size: int, max_indexed_turns: int):
+        self.recent = deque(maxlen=memory_size)
+        self.index = SessionEntityIndex(max_indexed_turns)
+
+
+class ConversationMemoryStore:
+    """SQLite-backed conversation log keyed by session
+
+    Writes are single-row appends in WAL mode, so concurrent sessions never
+    rewrite each other's history. The last ``memory_size`` turns of each
+    session are kept in an in-process ring buffer, and the entities of the
+    last ``retain_per_session`` turns in an inverted index used for context
+    lookup. Older rows are deleted by a background compaction thread.
+    """
+
+    def __init__(self, db_path: str, memory_size: int = 5, retain_per_session: int = 50,
+                 compaction_interval: float = 300.0, max_cached_sessions: int = 1000):
+        self.db_path = Path(db_path)
+        self.memory_size = memory_size
+        self.retain_per_session = max(retain_per_session, memory_size)
+        self.compaction_interval = compaction_interval
+        self.max_cached_sessions = max_cached_sessions
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._stop = threading.Event()
+        self._compactor = None
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._create_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection to the store"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(str(self.db_path), timeout=30.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _create_schema(self):
+        connection = self._connection()
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                entities TEXT
+            )
+        """)
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(conversations)").fetchall()}
+        if "entities" not in columns:
+            connection.execute("ALTER TABLE conversations ADD COLUMN entities TEXT")
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_conversations_session ON conversations (session_id, id)"
+        )
+
+    def append(self, session_id: str, question: str, answer: str, metadata: dict = None) -> dict:
+        """Append one Q&A turn to a session and return the stored entry"""
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "session_id": session_id,
+            "question": question,
+            "answer": answer,
+            "metadata": metadata or {},
+            "entities": extract_entities(question, answer)
+        }
+        # Load a cold session before the INSERT, so the new row is not read back from disk and added twice
+        session = self._session(session_id)
+        cursor = self._connection().execute(
+            "INSERT INTO conversations (session_id, timestamp, question, answer, metadata, entities) VALUES (?, ?, ?, ?, ?, ?)",
+            (session_id, entry["timestamp"], question, answer,
+             json.dumps(entry["metadata"], ensure_ascii=False, default=str), json.dumps(entry["entities"]))
+        )
+        entry["id"] = cursor.lastrowid
+
+        with self._lock:
+            # The session may still have been (re)loaded after the INSERT by another thread or an eviction
+            if not any(cached["id"] == entry["id"] for cached in session.recent):
+                session.recent.append(entry)
+                session.index.add(entry["id"], entry["entities"])
+        return entry
+
+    def recent(self, session_id: str, limit: int = None) -> List[dict]:
+        """Get the most recent turns of a session, oldest first"""
+        session = self._session(session_id)
+        with self._lock:
+            entries = list(session.recent)
+        if limit is not None:
+            entries = entries[-limit:]
+        return entries
+
+    def find_related(self, session_id: str, question: str, limit: int = 3) -> List[dict]:
+        """Get earlier turns sharing entities with the question, best match first
+
+        Follow-up questions without shared entities ("what about his claims?")
+        fall back to the latest turn.
+        """
+        # Questions carry no answer text, so they only yield indexed entity types
+        entities = extract_entities(question)
+        session = self._session(session_id)
+        with self._lock:
+            turn_ids = session.index.lookup(entities, limit)
+            if not turn_ids and is_continuation(question) and session.index.latest() is not None:
+                turn_ids = [session.index.latest()]
+        if not turn_ids:
+            return []
+
+        placeholders = ", ".join("?" for _ in turn_ids)
+        rows = self._connection().execute(
+            f"SELECT id, timestamp, question, answer, metadata, entities FROM conversations WHERE id IN ({placeholders})",
+            turn_ids
+        ).fetchall()
+        entries = {row[0]: self._row_to_entry(session_id, row) for row in rows}
+        return [entries[turn_id] for turn_id in turn_ids if turn_id in entries]
+
+    def history(self, session_id: str, limit: int = None) -> List[dict]:
+        """Read a session's retained turns from disk, oldest first"""
+        return self._read_session(session_id, limit or self.retain_per_session)
+
+    def clear_session(self, session_id: str):
+        """Delete every turn of a session"""
+        self._connection().execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _session(self, session_id: str) -> _SessionMemory:
+        """Get a session's in-process state, loading it from disk on first use"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                return session
+
+        entries = self._read_session(session_id, self.retain_per_session)
+
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = _SessionMemory(self.memory_size, self.retain_per_session)
+                for entry in entries:
+                    session.recent.append(entry)
+                    session.index.add(entry["id"], entry["entities"])
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_cached_sessions:
+                    self._sessions.popitem(last=False)
+            return session
+
+    def _read_session(self, session_id: str, limit: int) -> List[dict]:
+        rows = self._connection().execute(
+            "SELECT id, timestamp, question, answer, metadata, entities FROM conversations "
+            "WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, limit)
+        ).fetchall()
+        return [self._row_to_entry(session_id, row) for row in reversed(rows)]
+
+    @staticmethod
+    def _row_to_entry(session_id: str, row: tuple) -> dict:
+        turn_id, timestamp, question, answer, metadata, entities = row
+        return {
+            "id": turn_id,
+            "timestamp": timestamp,
+            "session_id": session_id,
+            "question": question,
+            "answer": answer,
+            "metadata": json.loads(metadata) if metadata else {},
+            # Rows written before entity extraction are indexed on load
+            "entities": json.loads(entities) if entities else extract_entities(question, answer)
+        }
+
+    def compact(self) -> int:
+        """Delete turns beyond the per-session retention limit; returns rows removed"""
+        connection = self._connection()
+        sessions = [row[0] for row in connection.execute(
+            "SELECT session_id FROM conversations GROUP BY session_id HAVING COUNT(*) > ?",
+            (self.retain_per_session,)
+        ).fetchall()]
+
+        removed = 0
+        for session_id in sessions:
+            cursor = connection.execute(
+                "DELETE FROM conversations WHERE session_id = ? AND id <= ("
+                "SELECT id FROM conversations WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (session_id, session_id, self.retain_per_session)
+            )
+            removed += cursor.rowcount
+        if removed:
+            logger.info(f"Memory compaction removed {removed} turns from {len(sessions)} sessions")
+        return removed
+
+    def start_compaction(self):
+        """Start the background compaction thread (idempotent)"""
+        with self._lock:
+            if self._compactor is not None or self.compaction_interval <= 0:
+                return
+            self._compactor = threading.Thread(target=self._compaction_loop, name="memory-compaction", daemon=True)
+            self._compactor.start()
+
+    def _compaction_loop(self):
+        while not self._stop.wait(self.compaction_interval):
+            try:
+                self.compact()
+            except Exception as e:
+                logger.warning(f"Memory compaction failed: {e}")
+
+    def migrate_legacy_json(self, json_path: str, session_id: str = DEFAULT_SESSION_ID) -> int:
+        """Import a legacy conversation_memory.json once, renaming it afterwards"""
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return 0
+
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not read legacy memory file {json_path}: {e}")
+            return 0
+
+        conversations = legacy.get("conversations", [])
+        connection = self._connection()
+        connection.execute("BEGIN")
+        try:
+            for conv in conversations:
+                metadata = dict(conv.get("metadata") or {})
+                metadata.setdefault("legacy_session_id", conv.get("session_id"))
+                connection.execute(
+                    "INSERT INTO conversations (session_id, timestamp, question, answer, metadata, entities) VALUES (?, ?, ?, ?, ?, ?)",
+                    (session_id, conv.get("timestamp", datetime.now().isoformat()), conv.get("question", ""),
+                     conv.get("answer", ""), json.dumps(metadata, ensure_ascii=False, default=str),
+                     json.dumps(extract_entities(conv.get("question", ""), conv.get("answer", ""))))
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        json_path.rename(json_path.with_name(json_path.name + ".migrated"))
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        logger.info(f"Migrated {len(conversations)} conversations from {json_path}")
+        return len(conversations)
+
+    def close(self):
+        """Stop background compaction and close this thread's connection"""
+        self._stop.set()
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_memory_store(config: dict = None, base_dir: str = None) -> ConversationMemoryStore:
+    """Get the process-wide memory store for the configured database path"""
+    memory_config = (config or {}).get("memory", {})
+    base_dir = Path(base_dir) if base_dir else Path(__file__).parent.parent
+    db_path = base_dir / memory_config.get("store_path", "memory/conversation_memory.db")
+
+    with _stores_lock:
+        store = _stores.get(str(db_path))
+        if store is None:
+            store = ConversationMemoryStore(
+                db_path,
+                memory_size=memory_config.get("memory_size", 5),
+                retain_per_session=memory_config.get("retain_per_session", 50),
+                compaction_interval=memory_config.get("compaction_interval", 300.0)
+            )
+            legacy_path = memory_config.get("legacy_json_path", "memory/conversation_memory.json")
+            if legacy_path:
+                store.migrate_legacy_json(base_dir / legacy_path)
+            store.start_compaction()
+            _stores[str(db_path)] = store
+        return store
@@ -3,67 +3,55 @@ Simple Memory Management Utilities for K2 AI Assistant
 Handles conversation memory for context continuity
 """
 
-import json
-import re
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional
 
+from src.K2.aims_view.utils.memory_store import ConversationMemoryStore, DEFAULT_SESSION_ID
+from src.K2.aims_view.utils.memory_entities import extract_entities, format_entities, is_continuation
+
 
 class SimpleMemoryManager:
     """Simple memory management for conversation context"""
     
     def __init__(self, memory_file_path: str, memory_size: int = 5):
+        # Conversations live in an append-only SQLite store next to the legacy JSON file
         self.memory_file = Path(memory_file_path)
         self.memory_size = memory_size
+        self.store = ConversationMemoryStore(self.memory_file.with_suffix(".db"), memory_size=memory_size)
+        self.store.migrate_legacy_json(self.memory_file)
         
-    def load_memory(self) -> dict:
-        """Load conversation memory from JSON file"""
+    def load_memory(self, session_id: str = DEFAULT_SESSION_ID) -> dict:
+        """Load a session's recent conversation memory"""
         try:
-            if self.memory_file.exists():
-                with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            else:
-                return self._create_empty_memory()
+            memory = self._create_empty_memory(session_id)
+            memory["conversations"] = self.store.recent(session_id)
+            return memory
         except Exception as e:
             print(f"⚠️ Error loading memory: {str(e)}")
-            return self._create_empty_memory()
+            return self._create_empty_memory(session_id)
     
-    def _create_empty_memory(self) -> dict:
+    def _create_empty_memory(self, session_id: str = DEFAULT_SESSION_ID) -> dict:
         """Create initial memory structure"""
         return {
             "memory_size": self.memory_size,
-            "current_session_id": f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+            "current_session_id": session_id,
             "conversations": [],
             "last_updated": datetime.now().isoformat()
         }
     
     def save_conversation(self, memory: dict, question: str, answer: str, metadata: dict = None):
-        """Save Q&A pair to memory"""
+        """Append Q&A pair to the session's memory"""
         try:
-            # Create memory directory if it doesn't exist
-            self.memory_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            conversation_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "session_id": memory.get("current_session_id", f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"),
-                "question": question,
-                "answer": answer,
-                "metadata": metadata or {}
-            }
+            session_id = memory.get("current_session_id", DEFAULT_SESSION_ID)
+            conversation_entry = self.store.append(session_id, question, answer, metadata)
             
-            # Add to conversations list
+            # Keep the in-memory view bounded like the store's ring buffer
             memory["conversations"].append(conversation_entry)
-            
-            # Keep only last N conversations
             if len(memory["conversations"]) > self.memory_size:
                 memory["conversations"] = memory["conversations"][-self.memory_size:]
             
-            memory["last_updated"] = datetime.now().isoformat()
-            
-            # Save to file
-            with open(self.memory_file, 'w', encoding='utf-8') as f:
-                json.dump(memory, f, indent=2, ensure_ascii=False)
+            memory["last_updated"] = conversation_entry["timestamp"]
                 
         except Exception as e:
             print(f"⚠️ Error saving memory: {str(e)}")
@@ -71,22 +59,30 @@ class SimpleMemoryManager:
     @staticmethod
     def get_memory_context(memory: dict, current_question: str) -> str:
         """Extract relevant context from memory for current question"""
-        if not memory.get("conversations"):
+        conversations = memory.get("conversations", [])
+        if not conversations:
             return ""
         
-        context_parts = []
+        question_entities = set(extract_entities(current_question))
         
-        # Check if current question relates to previous conversations
-        for conv in reversed(memory["conversations"][-3:]):  # Check last 3 conversations
-            prev_question = conv.get("question", "")
-            prev_answer = conv.get("answer", "")
-            
-            # Simple context detection
-            if SimpleMemoryManager.is_related_question(current_question, prev_question):
-                # Extract key information from previous conversation
-                extracted_info = SimpleMemoryManager.extract_key_info(prev_question, prev_answer)
-                if extracted_info:
-                    context_parts.append(f"Previous context: {extracted_info}")
+        # Rank turns by shared entities; follow-up questions fall back to the latest turn
+        scored = []
+        for position, conv in enumerate(conversations):
+            entities = conv.get("entities") or extract_entities(conv.get("question", ""), conv.get("answer", ""))
+            shared = question_entities & set(entities)
+            if shared:
+                scored.append((len(shared), position, entities))
+        scored.sort(reverse=True)
+        related = [entities for _, _, entities in scored[:3]]
+        if not related and is_continuation(current_question):
+            last = conversations[-1]
+            related = [last.get("entities") or extract_entities(last.get("question", ""), last.get("answer", ""))]
+        
+        context_parts = []
+        for entities in related:
+            extracted_info = format_entities(entities)
+            if extracted_info:
+                context_parts.append(f"Previous context: {extracted_info}")
         
         if context_parts:
             return "MEMORY CONTEXT FROM RECENT CONVERSATIONS:\n" + "\n".join(context_parts) + "\n\n"
@@ -95,60 +91,26 @@ class SimpleMemoryManager:
     
     @staticmethod
     def is_related_question(current: str, previous: str) -> bool:
-        """Check if current question relates to previous one using simple keyword matching"""
-        # Extract potential customer IDs (11 digit numbers)
-        current_ids = re.findall(r'\b\d{11}\b', current)
-        previous_ids = re.findall(r'\b\d{11}\b', previous)
-        
-        # Check for common customer IDs
-        if current_ids and previous_ids and any(id in previous_ids for id in current_ids):
+        """Check if current question shares entities with a previous one or continues it"""
+        if set(extract_entities(current)) & set(extract_entities(previous)):
             return True
-        
-        # Extract potential customer names
-        current_names = re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b', current)
-        previous_names = re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b', previous)
-        
-        # Check for common names
-        if current_names and previous_names and any(name in previous_names for name in current_names):
-            return True
-        
-        # Check for continuation keywords
-        continuation_keywords = ['same', 'this', 'that', 'also', 'additionally', 'more', 'further', 'his', 'her']
-        if any(keyword in current.lower() for keyword in continuation_keywords):
-            return True
-        
-        return False
+        return is_continuation(current)
     
     @staticmethod
     def extract_key_info(question: str, answer: str) -> str:
         """Extract key information from previous Q&A"""
-        key_info = []
-        
-        # Extract customer IDs
-        customer_ids = re.findall(r'\b\d{11}\b', question + " " + answer)
-        if customer_ids:
-            key_info.append(f"Customer ID(s): {', '.join(set(customer_ids))}")
-        
-        # Extract customer names from context
-        names = re.findall(r'customer[^,\.]*?([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)', question + " " + answer, re.IGNORECASE)
-        if names:
-            key_info.append(f"Customer name(s): {', '.join(set(names))}")
-        
-        # Extract key numbers/counts from answer
-        numbers = re.findall(r'(\d+)\s+(?:policies|claims|transactions|customers)', answer, re.IGNORECASE)
-        if numbers:
-            key_info.append(f"Previous results: {', '.join(numbers)} items found")
-        
-        return " | ".join(key_info) if key_info else ""
+        return format_entities(extract_entities(question, answer))
 
     @staticmethod
     def clear_memory(memory_file_path: str):
         """Clear all memory (useful for testing or reset)"""
         try:
             memory_file = Path(memory_file_path)
-            if memory_file.exists():
-                memory_file.unlink()
-                print("✅ Memory cleared successfully")
+            for path in [memory_file, memory_file.with_suffix(".db"),
+                         Path(f"{memory_file.with_suffix('.db')}-wal"), Path(f"{memory_file.with_suffix('.db')}-shm")]:
+                if path.exists():
+                    path.unlink()
+            print("✅ Memory cleared successfully")
         except Exception as e:
             print(f"⚠️ Error clearing memory: {str(e)}")
     
@@ -2,6 +2,12 @@
 Query utilities for SQL cleaning and validation
 """
 
+from src.K2.aims_view.core.step_result import StepResult
+from src.K2.aims_view.utils.result_spill import SpilledResult
+
+# Rows of a spilled result shown to the response generator (the rest stay on disk)
+SPILLED_SUMMARY_ROWS = 200
+
 
 def clean_query(sql_query: str) -> str:
     """Clean and validate SQL query"""
@@ -37,6 +43,17 @@ def format_results_summary(execution_result: dict) -> str:
     """Format execution results for response generation"""
     results_summary = "QUERY RESULTS SUMMARY:\n"
     for key, result in execution_result.get('results', {}).items():
+        if isinstance(result, StepResult):
+            if result.succeeded:
+                max_rows = SPILLED_SUMMARY_ROWS if isinstance(result.rows, SpilledResult) else None
+                results_summary += f"\n{key.upper()} ({result.row_count} rows):\n"
+                if result.row_limit:
+                    results_summary += f"  NOTE: only the first {result.row_limit} rows were fetched - totals over these rows are partial\n"
+                if result.approximation:
+                    results_summary += f"  NOTE: approximate values - {result.approximation}. Say that the answer is approximate and state this error bound\n"
+                results_summary += result.rows_summary(max_rows)
+            continue
+        
         if 'results' in result:
             row_count = result.get('row_count', 0)
             results_summary += f"\n{key.upper()} ({row_count} rows):\n"
@@ -59,6 +76,11 @@ def format_data_sources_summary(intermediate_data: dict) -> str:
     """Format data sources for computational analysis"""
     data_summary = "AVAILABLE DATA SOURCES:\n"
     for step_key, step_data in intermediate_data.items():
+        if isinstance(step_data, StepResult):
+            if step_data.succeeded and step_data.row_count > 0:
+                data_summary += step_data.data_source_summary()
+            continue
+        
         if 'results' in step_data and step_data['results']:
             data_summary += f"\n{step_key.upper()} ({step_data['row_count']} rows):\n"
             data_summary += f"  Description: {step_data.get('step_description', 'Query results')}\n"
@@ -0,0 +1,338 @@
+"""
+Server-side handles for executed step results with paginated and streaming exports
+Oracle results are re-read batch by batch from the database cursor, so memory stays constant;
+answers from the KPI cube, the replica or a sample are served from the rows the answer used
+"""
+
+import csv
+import io
+import secrets
+import threading
+import time
+from typing import Iterator, Optional, Tuple
+
+from src.K2.aims_view.database.sql_analyzer import PUNCT, tokenize
+
+# Where a step's rows came from; only "oracle" results are re-read by re-running the query
+ORACLE = "oracle"
+SAMPLE = "sample"
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream"
+}
+
+
+class ExportUnavailable(Exception):
+    """Raised when an export format needs an optional dependency that is not installed"""
+    pass
+
+
+class ResultHandle:
+    """Reference to one executed step result that can be re-read on demand"""
+
+    def __init__(self, query: str, columns: list, row_count: int, session_id: str = None, step_key: str = None,
+                 spill=None, source: str = ORACLE, snapshot=None, row_limit: int = None):
+        self.handle_id = secrets.token_urlsafe(16)
+        self.query = query
+        self.columns = list(columns)
+        self.row_count = row_count
+        self.session_id = session_id
+        self.step_key = step_key
+        # Spilled copy of the rows, owned by the handle and deleted when it expires
+        self.spill = spill
+        # oracle, kpi_cube, replica or sample - anything but oracle is served from a copy of the answer's rows
+        self.source = source
+        self.snapshot = snapshot
+        # Cost-gate row limit the step ran with; re-reads stay within it
+        self.row_limit = row_limit
+        self.created_at = time.time()
+
+    def to_dict(self) -> dict:
+        """Describe the handle for API clients"""
+        return {
+            "handle": self.handle_id,
+            "step": self.step_key,
+            "columns": self.columns,
+            "row_count": self.row_count,
+            "source": self.source,
+            "row_limit": self.row_limit,
+            "formats": list(EXPORT_FORMATS)
+        }
+
+
+    def release(self):
+        """Delete the handle's spill file"""
+        if self.spill is not None:
+            self.spill.close()
+
+
+class ResultHandleRegistry:
+    """Thread-safe, expiring registry of result handles
+
+    The registry owns each handle's spill file and deletes it when the handle
+    expires or is evicted, so downloads can read the spilled rows for the
+    handle's whole lifetime.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600.0, max_handles: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_handles = max_handles
+        self._lock = threading.Lock()
+        self._handles = {}
+
+    def register(self, query: str, columns: list, row_count: int, session_id: str = None,
+                 step_key: str = None, spill=None, source: str = ORACLE, snapshot=None,
+                 row_limit: int = None) -> ResultHandle:
+        """Create a handle for an executed query"""
+        handle = ResultHandle(query, columns, row_count, session_id, step_key, spill, source, snapshot, row_limit)
+        with self._lock:
+            self._expire_locked()
+            while len(self._handles) >= self.max_handles:
+                self._handles.pop(next(iter(self._handles))).release()
+            self._handles[handle.handle_id] = handle
+        return handle
+
+    def get(self, handle_id: str, session_id: str = None) -> Optional[ResultHandle]:
+        """Look up a live handle, optionally requiring it to belong to the session"""
+        with self._lock:
+            self._expire_locked()
+            handle = self._handles.get(handle_id)
+        if handle is None or (session_id and handle.session_id and handle.session_id != session_id):
+            return None
+        return handle
+
+    def _expire_locked(self):
+        cutoff = time.time() - self.ttl_seconds
+        # Handles are stored in creation order
+        while self._handles:
+            handle_id = next(iter(self._handles))
+            if self._handles[handle_id].created_at >= cutoff:
+                break
+            self._handles.pop(handle_id).release()
+
+
+def result_source(df) -> str:
+    """Where an executed step's DataFrame came from (see ResultHandle.source)"""
+    attrs = getattr(df, "attrs", {})
+    if attrs.get("sampled"):
+        return SAMPLE
+    return attrs.get("source", ORACLE)
+
+
+def _frame_batches(df, batch_size: int) -> Iterator[Tuple[list, list]]:
+    """Yield (columns, rows) batches of an in-memory DataFrame"""
+    columns = list(df.columns)
+    for start in range(0, len(df), batch_size):
+        yield columns, list(df.iloc[start:start + batch_size].itertuples(index=False, name=None))
+
+
+def _order_by_end(query: str) -> Optional[int]:
+    """Offset just past the query's own top-level ORDER BY list, or None if it has none"""
+    depth = 0
+    end = None
+    in_order_by = False
+    for token in tokenize(query):
+        if token.kind == PUNCT and token.value == "(":
+            depth += 1
+        elif token.kind == PUNCT and token.value == ")":
+            depth -= 1
+        elif depth == 0 and token.is_word("ORDER"):
+            in_order_by, end = True, None
+            continue
+        elif depth == 0 and token.is_word("FETCH", "OFFSET", "FOR", "UNION", "INTERSECT", "MINUS", "EXCEPT"):
+            in_order_by = False
+            if not token.is_word("FETCH", "OFFSET", "FOR"):
+                end = None
+        if in_order_by and not token.is_word("BY", "SIBLINGS"):
+            end = token.end
+    return end
+
+
+def _ordered_sql(query: str, column_count: int) -> str:
+    """The query with a total row order, so repeated page reads line up
+
+    The query's own ORDER BY is kept and every output column is appended as a
+    tie-breaker; a query without one is ordered by all output columns.
+    """
+    positions = ", ".join(str(position) for position in range(1, max(1, column_count) + 1))
+    end = _order_by_end(query)
+    if end is None:
+        return f"SELECT * FROM ({query}) ORDER BY {positions}"
+    return f"{query[:end]}, {positions}{query[end:]}"
+
+
+def iter_result_batches(db_utils, handle: ResultHandle, batch_size: int = 5000) -> Iterator[Tuple[list, list]]:
+    """Yield (columns, rows) batches of a handle's result
+
+    Rows come from the spill file or the snapshot when there is one; only
+    answers read from Oracle are re-read straight from the cursor.
+    """
+    if handle.spill is not None and not handle.spill.closed:
+        source = handle.spill.iter_batches(batch_size)
+    elif handle.snapshot is not None:
+        source = _frame_batches(handle.snapshot, batch_size)
+    elif handle.row_limit:
+        # The same rows the step was limited to, not the whole (gated) result
+        limited_sql = f"SELECT * FROM ({_ordered_sql(handle.query, len(handle.columns))}) WHERE ROWNUM <= :row_limit"
+        source = db_utils.iter_query(limited_sql, {"row_limit": handle.row_limit}, batch_size=batch_size)
+    else:
+        source = db_utils.iter_query(handle.query, batch_size=batch_size)
+    empty = True
+    for columns, rows in source:
+        empty = False
+        yield columns, rows
+    if empty:
+        # Still emit the header / schema for empty results
+        yield handle.columns, []
+
+
+def page_result(db_utils, handle: ResultHandle, offset: int = 0, limit: int = 100) -> dict:
+    """Read one page of a handle's rows as JSON-ready records"""
+    columns = handle.columns
+    if handle.spill is not None and not handle.spill.closed:
+        records = handle.spill[offset:offset + limit]
+    elif handle.snapshot is not None:
+        records = handle.snapshot.iloc[offset:offset + limit].to_dict("records")
+    else:
+        # ROWNUM follows the ordered inline view, so each page is a stable slice of the same row order
+        paged_sql = (
+            f"SELECT * FROM (SELECT ordered_rows.*, ROWNUM AS K2_ROW_NUMBER "
+            f"FROM ({_ordered_sql(handle.query, len(handle.columns))}) ordered_rows WHERE ROWNUM <= :row_end) "
+            f"WHERE K2_ROW_NUMBER > :row_offset ORDER BY K2_ROW_NUMBER"
+        )
+        records = []
+        row_end = offset + limit
+        if handle.row_limit:
+            row_end = min(row_end, handle.row_limit)
+        params = {"row_offset": offset, "row_end": row_end}
+        for columns, rows in db_utils.iter_query(paged_sql, params, batch_size=limit):
+            # Drop the trailing K2_ROW_NUMBER column
+            columns = columns[:-1]
+            records.extend(dict(zip(columns, row[:-1])) for row in rows)
+    return {
+        "handle": handle.handle_id,
+        "columns": columns,
+        "offset": offset,
+        "limit": limit,
+        "row_count": handle.row_count,
+        "source": handle.source,
+        "rows": records
+    }
+
+
+def iter_csv(batches: Iterator[Tuple[list, list]]) -> Iterator[str]:
+    """Encode row batches as CSV text chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+    for columns, rows in batches:
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+def _record_batch(pa, columns: list, rows: list, schema=None):
+    """Build an Arrow record batch from row tuples, inferring the schema from the first batch"""
+    column_values = list(zip(*rows)) if rows else [[] for _ in columns]
+    if schema is None:
+        arrays = [pa.array(list(values)) for values in column_values]
+        # All-null first batches give no type information - fall back to strings
+        arrays = [array.cast(pa.string()) if pa.types.is_null(array.type) else array for array in arrays]
+        return pa.RecordBatch.from_arrays(arrays, names=columns)
+
+    arrays = []
+    for field, values in zip(schema, column_values):
+        try:
+            arrays.append(pa.array(list(values), type=field.type))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            if not pa.types.is_string(field.type):
+                raise
+            arrays.append(pa.array([None if value is None else str(value) for value in values], type=pa.string()))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ExportUnavailable("Parquet and Arrow exports require pyarrow to be installed")
+    return pa
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate(0)
+    return data
+
+
+def iter_arrow_ipc(batches: Iterator[Tuple[list, list]]) -> Iterator[bytes]:
+    """Encode row batches as an Arrow IPC stream"""
+    pa = _import_pyarrow()
+    sink = io.BytesIO()
+    writer = None
+    schema = None
+    for columns, rows in batches:
+        batch = _record_batch(pa, columns, rows, schema)
+        if writer is None:
+            schema = batch.schema
+            writer = pa.ipc.new_stream(sink, schema)
+        writer.write_batch(batch)
+        yield _drain(sink)
+    if writer is not None:
+        writer.close()
+        yield _drain(sink)
+
+
+def iter_parquet(batches: Iterator[Tuple[list, list]]) -> Iterator[bytes]:
+    """Encode row batches as a Parquet file, one row group per batch"""
+    pa = _import_pyarrow()
+    import pyarrow.parquet as pq
+
+    sink = io.BytesIO()
+    writer = None
+    schema = None
+    for columns, rows in batches:
+        batch = _record_batch(pa, columns, rows, schema)
+        if writer is None:
+            schema = batch.schema
+            writer = pq.ParquetWriter(sink, schema)
+        writer.write_batch(batch)
+        yield _drain(sink)
+    if writer is not None:
+        writer.close()
+        yield _drain(sink)
+
+
+def iter_export(fmt: str, batches: Iterator[Tuple[list, list]]) -> Iterator:
+    """Encode row batches in the requested export format"""
+    if fmt in ("parquet", "arrow"):
+        # Fail before streaming starts when pyarrow is missing
+        _import_pyarrow()
+    if fmt == "csv":
+        return iter_csv(batches)
+    if fmt == "parquet":
+        return iter_parquet(batches)
+    if fmt == "arrow":
+        return iter_arrow_ipc(batches)
+    raise ValueError(f"Unsupported export format: {fmt}")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_result_registry(config: dict = None) -> ResultHandleRegistry:
+    """Get the process-wide result handle registry (configured by the first caller)"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            export_config = (config or {}).get("result_exports", {})
+            _registry = ResultHandleRegistry(export_config.get("ttl_seconds", 3600))
+        return _registry
@@ -0,0 +1,177 @@
+"""
+Disk spill for oversized step results
+Large query results are written to a temporary Arrow IPC file and reopened memory-mapped,
+so the request holds one zero-copy table instead of per-row Python dicts
+"""
+
+import importlib.util
+import logging
+import os
+import tempfile
+import uuid
+import weakref
+from collections.abc import Sequence
+from typing import Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Could not remove spill file {path}: {e}")
+
+
+class SpilledResult(Sequence):
+    """Read-only, list-like view of a spilled step result
+
+    Rows are materialized as dicts only when indexed or iterated; the data
+    itself stays in the memory-mapped file until close().
+    """
+
+    def __init__(self, path: str, table, source):
+        self.path = path
+        self._table = table
+        self._source = source
+        self.columns = list(table.column_names)
+        self.row_count = table.num_rows
+        self.nbytes = table.nbytes
+        # Removes the file even if the owning request never closes it
+        self._finalizer = weakref.finalize(self, _remove_file, path)
+
+    @property
+    def closed(self) -> bool:
+        return self._table is None
+
+    @property
+    def table(self):
+        """The memory-mapped Arrow table"""
+        if self._table is None:
+            raise ValueError(f"Spilled result {self.path} was already cleaned up")
+        return self._table
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.row_count)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self.table.slice(start, max(0, stop - start)).to_pylist()
+        if index < 0:
+            index += self.row_count
+        if not 0 <= index < self.row_count:
+            raise IndexError("spilled result index out of range")
+        return self.table.slice(index, 1).to_pylist()[0]
+
+    def __iter__(self):
+        for batch in self.table.to_batches():
+            yield from batch.to_pylist()
+
+    def head(self, n: int = 5) -> list:
+        """First n rows as dicts"""
+        return self[:n]
+
+    def iter_batches(self, batch_size: int = 5000) -> Iterator[Tuple[list, list]]:
+        """Yield (columns, rows) batches in the same shape as SecureOracleDBUtils.iter_query"""
+        for batch in self.table.to_batches(max_chunksize=batch_size):
+            columns = [batch.column(i).to_pylist() for i in range(batch.num_columns)]
+            yield self.columns, list(zip(*columns))
+
+    def to_pandas(self):
+        """DataFrame over the mapped buffers (zero-copy where the column types allow it)"""
+        return self.table.to_pandas(split_blocks=True)
+
+    def close(self):
+        """Release the mapping and delete the spill file"""
+        self._table = None
+        if self._source is not None:
+            self._source.close()
+            self._source = None
+        self._finalizer()
+
+    def __repr__(self) -> str:
+        # Keeps prompts that embed execution results from inlining every spilled row
+        if self.closed:
+            return f"<spilled result: {self.row_count} rows, cleaned up>"
+        return f"<spilled result: {self.row_count} rows, columns {self.columns}, first rows {self.head(3)}>"
+
+
+class ResultSpillManager:
+    """Spills step results above a size threshold to memory-mapped Arrow files"""
+
+    def __init__(self, enabled: bool = True, threshold_bytes: int = 16 * 1024 * 1024,
+                 spill_dir: str = None, batch_rows: int = 65536):
+        self.threshold_bytes = threshold_bytes
+        self.spill_dir = spill_dir or os.path.join(tempfile.gettempdir(), "k2_spill")
+        self.batch_rows = batch_rows
+        self.enabled = enabled and self._has_pyarrow()
+
+    @staticmethod
+    def _has_pyarrow() -> bool:
+        # Only check it is installed; pyarrow (and numpy) are imported by the first spill
+        if importlib.util.find_spec("pyarrow") is None:
+            logger.warning("pyarrow is not installed - large step results will stay in memory")
+            return False
+        return True
+
+    def should_spill(self, df) -> bool:
+        """Whether a result DataFrame is large enough to spill"""
+        if not self.enabled or len(df) == 0:
+            return False
+        return int(df.memory_usage(index=False, deep=True).sum()) >= self.threshold_bytes
+
+    def spill(self, df, label: str = "result", context=None) -> Optional[SpilledResult]:
+        """Write df to disk and return a mapped view, or None if it is small enough to keep"""
+        if not self.should_spill(df):
+            return None
+
+        import pyarrow as pa
+
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"{label}_{uuid.uuid4().hex}.arrow")
+        try:
+            table = self._to_table(pa, df)
+            with pa.OSFile(path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    for batch in table.to_batches(max_chunksize=self.batch_rows):
+                        writer.write_batch(batch)
+            del table
+
+            source = pa.memory_map(path, "r")
+            spilled = SpilledResult(path, pa.ipc.open_file(source).read_all(), source)
+        except Exception as e:
+            logger.warning(f"Spilling {label} failed, keeping it in memory: {e}")
+            _remove_file(path)
+            return None
+
+        if context is not None:
+            context.on_close(spilled.close)
+        logger.info(f"Spilled {label}: {spilled.row_count} rows, {spilled.nbytes} bytes -> {path}")
+        return spilled
+
+    @staticmethod
+    def _to_table(pa, df):
+        """Convert a DataFrame to Arrow, stringifying object columns Arrow cannot type"""
+        try:
+            return pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df = df.copy()
+            for column in df.columns[df.dtypes == object]:
+                df[column] = df[column].map(lambda value: None if value is None else str(value))
+            return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def create_spill_manager(config: dict = None) -> ResultSpillManager:
+    """Build a spill manager from the "result_spill" config block"""
+    spill_config = (config or {}).get("result_spill", {})
+    return ResultSpillManager(
+        enabled=spill_config.get("enabled", True),
+        threshold_bytes=spill_config.get("threshold_bytes", 16 * 1024 * 1024),
+        spill_dir=spill_config.get("spill_dir"),
+        batch_rows=spill_config.get("batch_rows", 65536)
+    )
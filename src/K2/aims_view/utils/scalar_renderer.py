@@ -0,0 +1,116 @@
+"""
+Deterministic renderer for single-row, one- or two-column query results
+Formats counts, amounts and ratios with AIMS business labels without an LLM call
+"""
+
+import re
+from decimal import Decimal
+from typing import Optional
+
+
+# Column name words that decide how a value is formatted
+PERCENT_WORDS = {'RATIO', 'PERCENT', 'PERCENTAGE', 'PCT', 'RATE', 'SHARE'}
+COUNT_WORDS = {'COUNT', 'CNT', 'NUM', 'NUMBER', 'POLICIES', 'CLAIMS', 'CUSTOMERS', 'TRANSACTIONS'}
+CURRENCY_WORDS = {'PREMIUM', 'AMOUNT', 'AMT', 'VAL', 'VALUE', 'SUM', 'PAID', 'PAYMENT', 'PAYMENTS',
+                  'OUTSTANDING', 'OS', 'RECOVERY', 'FEES', 'COMMISSION', 'COMM', 'INSURED', 'GWP'}
+
+
+def get_scalar_row(execution_result: dict) -> Optional[dict]:
+    """Return the single result row when the execution produced one small scalar answer"""
+    results = execution_result.get('results', {})
+    if len(results) != 1:
+        return None
+
+    step_result = next(iter(results.values()))
+    if 'error' in step_result or 'query' not in step_result:
+        return None
+
+    rows = step_result.get('results')
+    if not isinstance(rows, list) or len(rows) != 1 or not isinstance(rows[0], dict):
+        return None
+    if not 1 <= len(rows[0]) <= 2:
+        return None
+
+    return rows[0]
+
+
+def classify_column(column: str) -> str:
+    """Classify a result column as percent, currency, count or plain"""
+    words = set(re.split(r'[^A-Z0-9]+', column.upper()))
+    if words & PERCENT_WORDS:
+        return 'percent'
+    if words & COUNT_WORDS:
+        return 'count'
+    if words & CURRENCY_WORDS:
+        return 'currency'
+    return 'plain'
+
+
+def format_value(value, kind: str, currency: str = "QAR") -> str:
+    """Format a numeric value according to its column kind"""
+    if value is None or (isinstance(value, float) and value != value):
+        return "N/A"
+    if isinstance(value, Decimal):
+        value = float(value)
+    if not isinstance(value, (int, float)):
+        return str(value)
+
+    if kind == 'percent':
+        return f"{value:,.2f}%"
+    if kind == 'count':
+        return f"{int(round(value)):,}"
+    if kind == 'currency':
+        return f"{currency} {value:,.2f}"
+    if float(value).is_integer():
+        return f"{int(value):,}"
+    return f"{value:,.2f}"
+
+
+def label_column(column: str) -> str:
+    """Turn a result column name into a business label"""
+    name = column.upper()
+    if name.startswith('COUNT('):
+        return "Count"
+    if name.startswith('SUM('):
+        return "Total"
+    if name.startswith('AVG('):
+        return "Average"
+    return column.replace('_', ' ').title()
+
+
+def render_scalar_answer(execution_result: dict, domain_knowledge: dict, currency: str = "QAR") -> Optional[str]:
+    """Render a scalar result as a short business answer, or None if not a scalar result"""
+    row = get_scalar_row(execution_result)
+    if row is None:
+        return None
+
+    columns = {column.upper(): column for column in row}
+    policy_counting = domain_knowledge.get('business_rules', {}).get('policy_counting', {})
+
+    # Dual policy/transaction count gets the standard business explanation
+    if 'POLICY_COUNT' in columns and 'TRANSACTION_COUNT' in columns:
+        policy_count = format_value(row[columns['POLICY_COUNT']], 'count')
+        transaction_count = format_value(row[columns['TRANSACTION_COUNT']], 'count')
+        policy_description = policy_counting.get('policy_count', {}).get('description', 'New policies and renewals')
+        transaction_description = policy_counting.get('transaction_count', {}).get('description', 'All document transactions')
+        return (
+            f"**POLICY COUNT / TRANSACTION COUNT: {policy_count} / {transaction_count}**\n\n"
+            f"- **Policy Count:** {policy_count} ({policy_description})\n"
+            f"- **Transaction Count:** {transaction_count} ({transaction_description})"
+            + approximation_note(execution_result)
+        )
+
+    lines = []
+    for column, value in row.items():
+        kind = classify_column(column)
+        lines.append(f"- **{label_column(column)}:** {format_value(value, kind, currency)}")
+
+    answer = lines[0][2:] if len(lines) == 1 else "\n".join(lines)
+    return answer + approximation_note(execution_result)
+
+
+def approximation_note(execution_result: dict) -> str:
+    """Error-bound footnote for results containing estimated values ('' when exact)"""
+    step_result = next(iter(execution_result.get('results', {}).values()), None)
+    approximation = step_result.get('approximation') if step_result is not None else None
+    return f"\n\n_Approximate: {approximation}_" if approximation else ""
@@ -0,0 +1,27 @@
+"""
+ASGI entry point for the K2 Insurance AI Assistant web service
+
+Run with: uvicorn src.K2.app:app --host 0.0.0.0 --port 8000
+"""
+
+import json
+from pathlib import Path
+
+# Configure SSL before any AI imports
+from src.K2.aims_view.security.ssl_config import configure_ssl_bypass
+configure_ssl_bypass()
+
+from src.K2.aims_view.api.server import create_app
+
+config_path = Path(__file__).parent / "aims_view" / "config.json"
+with open(config_path, "r") as f:
+    config = json.load(f)
+
+app = create_app(config)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    api_config = config.get("api", {})
+    uvicorn.run(app, host=api_config.get("host", "0.0.0.0"), port=api_config.get("port", 8000))
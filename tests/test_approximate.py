@@ -0,0 +1,111 @@
+"""Approximate mode: sample rewrites and margin-of-error math"""
+
+import math
+
+import pandas as pd
+import pytest
+
+from src.K2.aims_view.database.approximate import ApproximateMode, SampleIneligible
+from src.K2.aims_view.database.errors import QueryCancelledError, QueryTimeoutError, SecurityException
+from src.K2.aims_view.database.sql_analyzer import analyze_sql
+
+
+def rewrite(sql: str, **options) -> str:
+    return ApproximateMode(**options).rewrite(analyze_sql(sql)).sql
+
+
+def test_sample_clause_follows_the_table_reference_only():
+    sql = rewrite(
+        "SELECT AIMS_ALL_DATA.DOC_BRANCH, COUNT(*) FROM insmv.AIMS_ALL_DATA "
+        "WHERE AIMS_ALL_DATA.DOC_PREMIUM > 0 GROUP BY AIMS_ALL_DATA.DOC_BRANCH"
+    )
+    assert sql.count("SAMPLE BLOCK") == 1
+    assert "insmv . AIMS_ALL_DATA SAMPLE BLOCK (5) WHERE" in sql
+    assert "AIMS_ALL_DATA . DOC_PREMIUM > 0" in sql
+
+
+def test_sample_clause_goes_before_the_alias():
+    sql = rewrite("SELECT SUM(d.DOC_PREMIUM) total FROM insmv.AIMS_ALL_DATA d", sample_method="row", seed=7)
+    assert "FROM insmv . AIMS_ALL_DATA SAMPLE (5) SEED (7) d" in sql
+
+
+def test_sums_and_counts_are_scaled_with_hidden_variance_columns():
+    sample_query = ApproximateMode(sample_percent=10).rewrite(analyze_sql(
+        "SELECT DOC_BRANCH, SUM(DOC_PREMIUM) total, COUNT(*) FROM insmv.AIMS_ALL_DATA GROUP BY DOC_BRANCH"
+    ))
+    assert "(SUM ( DOC_PREMIUM ) * 10) total" in sample_query.sql
+    assert 'ROUND(COUNT ( * ) * 10) AS "COUNT(*)"' in sample_query.sql
+    assert 'SUM(POWER(DOC_PREMIUM, 2)) AS "__SAMPLE_1", COUNT ( * ) AS "__SAMPLE_2" FROM' in sample_query.sql
+    assert sample_query.margins == {"TOTAL": ("__SAMPLE_1", "sum"), "COUNT(*)": ("__SAMPLE_2", "count")}
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT DOC_BRANCH FROM insmv.AIMS_ALL_DATA",
+    "SELECT MAX(DOC_PREMIUM) FROM insmv.AIMS_ALL_DATA",
+    "SELECT COUNT(DISTINCT DOC_CUST_NAME) FROM insmv.AIMS_ALL_DATA",
+    "SELECT SUM(DOC_PREMIUM) FROM insmv.AIMS_ALL_DATA WHERE DOC_SERIAL IN (SELECT DOC_SERIAL FROM insmv.AIMS_ALL_DATA)",
+])
+def test_ineligible_queries_are_not_sampled(sql):
+    with pytest.raises(SampleIneligible):
+        ApproximateMode().rewrite(analyze_sql(sql))
+
+
+def test_margins_use_the_horvitz_thompson_variance():
+    mode = ApproximateMode(sample_percent=5, confidence=0.95)
+    sample_query = mode.rewrite(analyze_sql(
+        "SELECT DOC_BRANCH, SUM(DOC_PREMIUM) total, COUNT(*) policies FROM insmv.AIMS_ALL_DATA GROUP BY DOC_BRANCH"
+    ))
+    df = pd.DataFrame({
+        "DOC_BRANCH": ["A", "B"], "TOTAL": [2000.0, 400.0], "POLICIES": [40, 20],
+        "__SAMPLE_1": [100.0, None], "__SAMPLE_2": [2, 1]
+    })
+    df = mode.finish(df, sample_query)
+
+    q, z = 0.05, 1.959963984540054
+    assert list(df.columns) == ["DOC_BRANCH", "TOTAL", "TOTAL_MARGIN", "POLICIES", "POLICIES_MARGIN"]
+    assert df["TOTAL_MARGIN"][0] == pytest.approx(z * math.sqrt((1 - q) / q ** 2 * 100.0))
+    assert pd.isna(df["TOTAL_MARGIN"][1])
+    assert list(df["POLICIES_MARGIN"]) == [math.ceil(z * math.sqrt((1 - q) / q ** 2 * n)) for n in (2, 1)]
+    assert "5% block sample" in df.attrs["approximation"]
+    assert df.attrs["sampled"]["exact_sql"] == sample_query.original
+
+
+class SampledRun:
+    """run_query stand-in that fails the sampled SQL with a given error and records every call"""
+
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.calls = []
+
+    def __call__(self, sql):
+        self.calls.append(sql)
+        if self.error is not None and "SAMPLE" in sql:
+            raise self.error
+        return pd.DataFrame({"TOTAL": [1.0], "__SAMPLE_1": [1.0]})
+
+
+SAMPLED_SQL = "SELECT SUM(DOC_PREMIUM) total FROM insmv.AIMS_ALL_DATA"
+
+
+@pytest.mark.parametrize("error", [QueryTimeoutError("timed out"), QueryCancelledError("cancelled")])
+def test_timed_out_or_cancelled_sample_is_not_rerun_exactly(error):
+    mode = ApproximateMode()
+    run = SampledRun(error)
+    with pytest.raises(type(error)):
+        mode.execute(mode.rewrite(analyze_sql(SAMPLED_SQL)), run)
+    assert len(run.calls) == 1
+
+
+def test_rejected_sample_falls_back_to_the_exact_query():
+    mode = ApproximateMode()
+    run = SampledRun(SecurityException("Query execution failed"))
+    df = mode.execute(mode.rewrite(analyze_sql(SAMPLED_SQL)), run)
+    assert run.calls[1] == SAMPLED_SQL
+    assert "approximation" not in df.attrs
+
+
+def test_successful_sample_is_finished():
+    mode = ApproximateMode()
+    df = mode.execute(mode.rewrite(analyze_sql(SAMPLED_SQL)), SampledRun())
+    assert list(df.columns) == ["TOTAL", "TOTAL_MARGIN"]
+    assert "approximation" in df.attrs
@@ -0,0 +1,87 @@
+"""Batch runner: resuming after a crash and answering duplicate questions once"""
+
+import json
+import threading
+from types import SimpleNamespace
+
+from src.K2.aims_view.core.batch import RESULTS_FILE, BatchQuestion, BatchRunner, read_results
+from src.K2.aims_view.database.query_cache import QueryResultCache
+
+
+class StubManager:
+    """Answers every question, recording what was asked and whether a result cache was on"""
+
+    def __init__(self):
+        self.db_utils = SimpleNamespace(result_cache=QueryResultCache())
+        self.asked = []
+        self.cache_enabled = []
+        self._lock = threading.Lock()
+
+    def solve_intelligently(self, question, max_cycles=3, session_id=None, approximate=False):
+        with self._lock:
+            self.asked.append(question)
+            self.cache_enabled.append(self.db_utils.result_cache.enabled)
+        return {"status": "success", "response": f"answer to {question}", "approximate": approximate}
+
+
+def run(tmp_path, questions, manager=None):
+    manager = manager or StubManager()
+    summary = BatchRunner(manager, str(tmp_path), formats=["jsonl"]).run(questions)
+    return manager, summary
+
+
+def test_resume_after_a_truncated_results_file(tmp_path):
+    results_path = tmp_path / RESULTS_FILE
+    results_path.write_text(
+        json.dumps({"id": "q001", "question": "Premium by branch?", "status": "success", "response": "done"}) + "\n"
+        + json.dumps({"id": "q002", "question": "Claims by branch?", "status": "error", "error": "timeout"}) + "\n"
+        + '{"id": "q003", "question": "Policies by br',
+        encoding="utf-8"
+    )
+    questions = [BatchQuestion("q001", "Premium by branch?"), BatchQuestion("q002", "Claims by branch?"),
+                 BatchQuestion("q003", "Policies by branch?")]
+
+    manager, summary = run(tmp_path, questions)
+
+    # The answered question is skipped; the failed one and the one cut off by the crash are asked again
+    assert sorted(manager.asked) == ["Claims by branch?", "Policies by branch?"]
+    assert (summary["answered"], summary["skipped"]) == (2, 1)
+    lines = results_path.read_text(encoding="utf-8").splitlines()
+    assert all(json.loads(line) for line in lines)
+    records = read_results(str(tmp_path))
+    assert {question_id: record["status"] for question_id, record in records.items()} == {
+        "q001": "success", "q002": "success", "q003": "success"
+    }
+    assert records["q001"]["response"] == "done"
+
+
+def test_duplicate_questions_are_answered_once_and_fanned_out(tmp_path):
+    questions = [
+        BatchQuestion("q001", "Total premium in 2023?", section="Premium"),
+        BatchQuestion("q002", "  total PREMIUM in 2023? ", section="Summary"),
+        BatchQuestion("q003", "Total premium in 2023?", approximate=True)
+    ]
+
+    manager, summary = run(tmp_path, questions)
+
+    # Same text and mode runs once; the approximate variant is a different question
+    assert len(manager.asked) == 2
+    assert summary["distinct"] == 2
+    assert summary["statuses"] == {"success": 3}
+    records = read_results(str(tmp_path))
+    assert records["q002"]["duplicate_of"] == "q001"
+    assert records["q002"]["section"] == "Summary"
+    assert records["q002"]["response"] == records["q001"]["response"]
+    assert "duplicate_of" not in records["q003"]
+
+
+def test_run_scoped_result_cache_is_restored_afterwards(tmp_path):
+    manager = StubManager()
+    shared_cache = manager.db_utils.result_cache
+
+    _, summary = run(tmp_path, [BatchQuestion("q001", "Premium by branch?")], manager)
+
+    assert manager.cache_enabled == [True]
+    assert manager.db_utils.result_cache is shared_cache
+    assert not shared_cache.enabled
+    assert summary["query_cache"]["enabled"]
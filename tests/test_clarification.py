@@ -0,0 +1,30 @@
+"""Clarification store: continuation tokens are single-use and bound to their session"""
+
+from src.K2.aims_view.core.clarification import CUSTOMER_CHOICE, ClarificationStore, PendingClarification
+
+
+def pending(session_id: str = "session_a") -> PendingClarification:
+    return PendingClarification(CUSTOMER_CHOICE, "Policies of Ali?", session_id, 3, "Ali", "Which Ali?")
+
+
+def test_token_resumes_once():
+    store = ClarificationStore()
+    token = store.save(pending())
+    assert store.pop(token, "session_a").user_question == "Policies of Ali?"
+    assert store.pop(token, "session_a") is None
+
+
+def test_another_session_cannot_take_the_token():
+    store = ClarificationStore()
+    token = store.save(pending("session_a"))
+    assert store.pop(token, "session_b") is None
+    # The owner can still answer it
+    assert store.pop(token, "session_a") is not None
+
+
+def test_expired_clarification_is_gone():
+    store = ClarificationStore(ttl_seconds=0.0)
+    token = store.save(pending())
+    store._pending[token].created_at -= 1
+    assert store.pop(token, "session_a") is None
+    assert len(store) == 0
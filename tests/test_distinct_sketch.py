@@ -0,0 +1,36 @@
+"""Mergeable distinct-count sketches: exact hash sets and HyperLogLog registers"""
+
+from src.K2.aims_view.database.distinct_sketch import DistinctSketch, hash_keys
+
+
+def sketch(keys, **options) -> DistinctSketch:
+    return DistinctSketch(hashes=hash_keys(keys), **options)
+
+
+def test_small_sets_merge_exactly():
+    merged = DistinctSketch.merge_all([sketch(["C1", "C2"]), sketch(["C2", "C3", None]), sketch([])])
+    assert merged.exact
+    assert merged.count() == 3
+    assert merged.relative_error == 0.0
+
+
+def test_large_sets_become_estimates_within_their_error():
+    keys = [f"C{n}" for n in range(20000)]
+    merged = DistinctSketch.merge_all([sketch(keys[:12000]), sketch(keys[8000:])])
+    assert not merged.exact
+    assert abs(merged.count() - 20000) <= 20000 * 4 * merged.relative_error
+
+
+def test_exact_and_hyperloglog_sketches_merge():
+    large = sketch([f"C{n}" for n in range(5000)], exact_limit=100)
+    small = sketch(["C1", "NEW"], exact_limit=100)
+    merged = large.merge(small)
+    assert not merged.exact
+    assert abs(merged.count() - 5001) <= 5001 * 4 * merged.relative_error
+
+
+def test_sketches_round_trip_through_bytes():
+    for original in (sketch(["C1", "C2"]), sketch([f"C{n}" for n in range(500)], exact_limit=10)):
+        restored = DistinctSketch.from_bytes(original.to_bytes(), exact_limit=10)
+        assert restored.exact == original.exact
+        assert restored.count() == original.count()
@@ -0,0 +1,183 @@
+"""Hedged completions and circuit breakers against stub providers"""
+
+import asyncio
+import time
+
+from src.K2.aims_view.ai.hedging import CircuitBreaker, HedgedCompletion, ProviderHealth
+
+
+class StubProvider:
+    """Answers after a fixed delay, or raises"""
+
+    def __init__(self, name: str, delay: float = 0.0, text: str = None, error: Exception = None):
+        self.name = name
+        self.model = f"stub/{name}"
+        self.temperature = 0.0
+        self.delay = delay
+        self.text = text if text is not None else f"answer from {name}"
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def acomplete(self, messages):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.text
+
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+FAST_HEDGE = {"default_hedge_delay": 0.1, "min_hedge_delay": 0.05, "max_hedge_delay": 1.0, "request_timeout": 5.0}
+
+
+def run(completion):
+    return asyncio.run(completion.acall_hedged(MESSAGES))
+
+
+def test_fast_primary_is_not_hedged():
+    primary, backup = StubProvider("primary", delay=0.01), StubProvider("backup")
+    assert run(HedgedCompletion([primary, backup], hedge_config=FAST_HEDGE)) == "answer from primary"
+    assert backup.calls == 0
+
+
+def test_slow_primary_is_hedged_after_delay_and_cancelled():
+    primary, backup = StubProvider("primary", delay=2.0), StubProvider("backup", delay=0.01)
+    start = time.monotonic()
+    assert run(HedgedCompletion([primary, backup], hedge_config=FAST_HEDGE)) == "answer from backup"
+    elapsed = time.monotonic() - start
+    assert 0.1 <= elapsed < 1.0
+    assert primary.cancelled == 1
+
+
+def test_hedge_delay_follows_p95_within_bounds():
+    health = ProviderHealth()
+    completion = HedgedCompletion([StubProvider("primary")], health=health,
+                                  hedge_config=dict(FAST_HEDGE, min_latency_samples=5))
+    assert completion.hedge_delay("primary") == 0.1
+    for _ in range(20):
+        health.latency("primary").record(0.3)
+    assert completion.hedge_delay("primary") == 0.3
+    for _ in range(100):
+        health.latency("primary").record(5.0)
+    assert completion.hedge_delay("primary") == 1.0
+
+
+def test_failed_primary_fails_over_immediately():
+    primary = StubProvider("primary", error=RuntimeError("boom"))
+    backup = StubProvider("backup", delay=0.01)
+    health = ProviderHealth()
+    start = time.monotonic()
+    assert run(HedgedCompletion([primary, backup], health=health, hedge_config=dict(FAST_HEDGE, default_hedge_delay=1.0))) == "answer from backup"
+    assert time.monotonic() - start < 0.5
+    assert health.breaker("primary")._consecutive_failures == 1
+    assert health.get_stats()["backup"]["samples"] == 1
+
+
+def test_empty_response_counts_as_failure():
+    primary, backup = StubProvider("primary", text="  "), StubProvider("backup")
+    assert run(HedgedCompletion([primary, backup], hedge_config=FAST_HEDGE)) == "answer from backup"
+
+
+def test_all_providers_failing_raises():
+    providers = [StubProvider("a", error=RuntimeError("down")), StubProvider("b", error=RuntimeError("down"))]
+    try:
+        run(HedgedCompletion(providers, hedge_config=FAST_HEDGE))
+    except RuntimeError as e:
+        assert "a: down" in str(e) and "b: down" in str(e)
+    else:
+        raise AssertionError("expected RuntimeError")
+
+
+def test_open_breaker_skips_provider():
+    health = ProviderHealth(failure_threshold=2, reset_timeout=60.0)
+    primary = StubProvider("primary", error=RuntimeError("boom"))
+    backup = StubProvider("backup")
+    completion = HedgedCompletion([primary, backup], health=health, hedge_config=FAST_HEDGE)
+    run(completion)
+    run(completion)
+    assert health.breaker("primary").state == "open"
+    assert run(completion) == "answer from backup"
+    assert primary.calls == 2
+
+
+def test_breaker_opens_at_threshold_and_closes_after_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow_request()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_half_open_breaker_admits_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow_request()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.release_probe()
+    assert breaker.allow_request()
+
+
+def test_concurrent_calls_send_one_probe_to_half_open_provider():
+    health = ProviderHealth(failure_threshold=1, reset_timeout=0.05)
+    health.breaker("primary").record_failure()
+    time.sleep(0.06)
+    primary = StubProvider("primary", delay=0.2)
+    backup = StubProvider("backup", delay=0.01)
+    completion = HedgedCompletion([primary, backup], health=health, hedge_config=dict(FAST_HEDGE, default_hedge_delay=1.0))
+
+    async def burst():
+        return await asyncio.gather(*(completion.acall_hedged(MESSAGES) for _ in range(5)))
+
+    results = asyncio.run(burst())
+    assert primary.calls == 1
+    assert results.count("answer from primary") == 1
+    assert health.breaker("primary").state == "closed"
+
+
+def test_cancelled_probe_releases_half_open_breaker():
+    health = ProviderHealth(failure_threshold=1, reset_timeout=0.05)
+    health.breaker("primary").record_failure()
+    time.sleep(0.06)
+    primary = StubProvider("primary", delay=2.0)
+    backup = StubProvider("backup", delay=0.01)
+    completion = HedgedCompletion([primary, backup], health=health, hedge_config=FAST_HEDGE)
+    assert run(completion) == "answer from backup"
+    assert primary.cancelled == 1
+    assert health.breaker("primary").state == "half_open"
+    assert health.breaker("primary").allow_request()
+
+
+def test_cancelled_attempt_that_is_not_the_probe_keeps_the_probe_held():
+    health = ProviderHealth(failure_threshold=1, reset_timeout=0.05)
+    breaker = health.breaker("primary")
+    completion = HedgedCompletion([StubProvider("primary", delay=2.0)], health=health, hedge_config=FAST_HEDGE)
+
+    async def scenario():
+        # Started while the breaker was closed, then the provider failed for other requests
+        assert breaker.acquire() is False
+        earlier = asyncio.ensure_future(completion._attempt(completion.providers[0], MESSAGES, probe=False))
+        await asyncio.sleep(0)
+        breaker.record_failure()
+        await asyncio.sleep(0.06)
+        assert breaker.acquire() is True
+        earlier.cancel()
+        await asyncio.gather(earlier, return_exceptions=True)
+
+    asyncio.run(scenario())
+    # The real probe is still out, so no second probe is admitted
+    assert not breaker.allow_request()
@@ -0,0 +1,194 @@
+"""KPI cube: rewriting metric SQL onto the cube and answering it from a built cube file"""
+
+import datetime
+
+import pandas as pd
+import pytest
+
+from src.K2.aims_view.database.kpi_cube import CubeIneligible, KPICube
+from src.K2.aims_view.database.local_replica import query_parquet
+from src.K2.aims_view.database.sql_analyzer import analyze_sql
+
+DISTINCT_COUNTS = {"POLICY": {"column": "DOC_KEY_FORM"}, "CUSTOMER": {"column": "CUST_ID_NO"}}
+ADDITIVE = {"POLICY": True, "CUSTOMER": True}
+
+
+def make_cube(**options) -> KPICube:
+    options.setdefault("dimensions", ["DOC_BRANCH"])
+    options.setdefault("measures", ["DOC_PREMIUM", "PAY_AMT"])
+    options.setdefault("distinct_counts", DISTINCT_COUNTS)
+    return KPICube(**options)
+
+
+def translate(sql: str, distinct_additive: dict = None):
+    return make_cube().translate(analyze_sql(sql), ADDITIVE if distinct_additive is None else distinct_additive)
+
+
+def test_year_aligned_range_becomes_a_year_filter():
+    cube_query = translate(
+        "SELECT SUM(DOC_PREMIUM) total FROM insmv.AIMS_ALL_DATA "
+        "WHERE DOC_REG_DT >= DATE '2023-01-01' AND DOC_REG_DT < DATE '2025-01-01'"
+    )
+    assert "WHERE DOC_YEAR >= 2023 AND DOC_YEAR < 2025" in cube_query.sql
+    assert "SUM(SUM_DOC_PREMIUM) total" in cube_query.sql
+
+
+def test_extract_year_becomes_the_year_dimension():
+    cube_query = translate(
+        "SELECT EXTRACT(YEAR FROM DOC_REG_DT) yr, COUNT(*) n FROM insmv.AIMS_ALL_DATA "
+        "GROUP BY EXTRACT(YEAR FROM DOC_REG_DT)"
+    )
+    assert cube_query.sql.startswith("SELECT DOC_YEAR yr , CAST(SUM(ROW_COUNT) AS BIGINT) n")
+    assert cube_query.sql.endswith("GROUP BY DOC_YEAR")
+
+
+@pytest.mark.parametrize("predicate, channel", [("IS NULL", "DIRECT"), ("IS NOT NULL", "BROKER")])
+def test_agent_null_check_becomes_the_channel_dimension(predicate, channel):
+    cube_query = translate(f"SELECT COUNT(*) FROM insmv.AIMS_ALL_DATA WHERE DOC_AGENT_NAME {predicate}")
+    assert f"WHERE DOC_CHANNEL = '{channel}'" in cube_query.sql
+
+
+def test_count_star_sums_row_counts_and_keeps_oracle_column_name():
+    cube_query = translate("SELECT DOC_BRANCH, COUNT(*) FROM insmv.AIMS_ALL_DATA GROUP BY DOC_BRANCH")
+    assert cube_query.sql == (
+        'SELECT DOC_BRANCH , CAST(SUM(ROW_COUNT) AS BIGINT) AS "COUNT(*)" FROM insmv.AIMS_ALL_DATA GROUP BY DOC_BRANCH'
+    )
+    assert not cube_query.sketched
+
+
+def test_sum_of_coalesced_measures_sums_each_measure():
+    cube_query = translate(
+        "SELECT SUM(NVL(DOC_PREMIUM, 0) - COALESCE(PAY_AMT, 0)) net FROM insmv.AIMS_ALL_DATA"
+    )
+    assert "(COALESCE(SUM(SUM_DOC_PREMIUM), 0) - COALESCE(SUM(SUM_PAY_AMT), 0)) net" in cube_query.sql
+
+
+@pytest.mark.parametrize("sql", [
+    # Not year-aligned
+    "SELECT SUM(DOC_PREMIUM) FROM insmv.AIMS_ALL_DATA WHERE DOC_REG_DT >= DATE '2023-06-01'",
+    # NULL in either measure makes the row's sum NULL
+    "SELECT SUM(DOC_PREMIUM + PAY_AMT) FROM insmv.AIMS_ALL_DATA",
+    "SELECT SUM(NVL(DOC_PREMIUM, 1)) FROM insmv.AIMS_ALL_DATA",
+    "SELECT AVG(DOC_PREMIUM) FROM insmv.AIMS_ALL_DATA",
+    "SELECT DOC_BRANCH, COUNT(*) FROM insmv.AIMS_ALL_DATA WHERE DOC_PREMIUM > 0 GROUP BY DOC_BRANCH",
+    "SELECT DOC_CUST_NAME, COUNT(*) FROM insmv.AIMS_ALL_DATA GROUP BY DOC_CUST_NAME",
+    "SELECT COUNT(*) FROM insmv.AIMS_ALL_DATA WHERE DOC_AGENT_NAME = 'ACME'",
+    "SELECT COUNT(DISTINCT DOC_CUST_NAME) FROM insmv.AIMS_ALL_DATA",
+    "SELECT * FROM insmv.AIMS_ALL_DATA",
+    "SELECT DOC_BRANCH FROM insmv.AIMS_ALL_DATA",
+    "SELECT COUNT(*) FROM insmv.AIMS_ALL_DATA WHERE DOC_BRANCH = :branch",
+    "WITH t AS (SELECT DOC_BRANCH FROM insmv.AIMS_ALL_DATA) SELECT COUNT(*) FROM t",
+])
+def test_unsupported_queries_are_declined(sql):
+    with pytest.raises(CubeIneligible):
+        translate(sql)
+
+
+# Answering from a built cube
+
+RAW_ROWS = [
+    # DOC_REG_DT, DOC_BRANCH, DOC_AGENT_NAME, DOC_PREMIUM, PAY_AMT, DOC_KEY_FORM, CUST_ID_NO
+    (datetime.datetime(2023, 3, 1), "DOHA", None, 100.0, 10.0, "P1", "C1"),
+    (datetime.datetime(2023, 5, 1), "DOHA", "ACME", 200.0, None, "P2", "C2"),
+    (datetime.datetime(2024, 2, 1), "DOHA", None, 50.0, 5.0, "P3", "C1"),
+    (datetime.datetime(2023, 7, 1), "WAKRA", None, 300.0, 0.0, "P4", "C1"),
+    (datetime.datetime(2023, 8, 1), "WAKRA", "ACME", 25.0, 1.0, "P5", "C3"),
+    (datetime.datetime(2024, 9, 1), "KHOR", "ACME", 75.0, None, "P6", "C4"),
+    (datetime.datetime(2024, 4, 1), "DOHA", "ACME", 10.0, 0.0, "P7", "C1"),
+    (datetime.datetime(2024, 6, 1), "WAKRA", None, 40.0, 2.0, "P8", "C5"),
+]
+RAW_COLUMNS = ["DOC_REG_DT", "DOC_BRANCH", "DOC_AGENT_NAME", "DOC_PREMIUM", "PAY_AMT", "DOC_KEY_FORM", "CUST_ID_NO"]
+
+
+class ParquetSource:
+    """Stands in for Oracle by running the build queries over a Parquet copy of the raw rows"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def iter_query(self, sql: str, params: dict = None, batch_size: int = 1000, timeout: float = None):
+        df = query_parquet(sql, [self.path])
+        yield list(df.columns), [tuple(None if pd.isna(value) else value for value in row)
+                                 for row in df.itertuples(index=False)]
+
+
+@pytest.fixture
+def built_cube(tmp_path):
+    raw_path = str(tmp_path / "raw.parquet")
+    pd.DataFrame(RAW_ROWS, columns=RAW_COLUMNS).to_parquet(raw_path)
+    cube = make_cube(enabled=True, cube_path=str(tmp_path / "cube.parquet"), source=ParquetSource(raw_path))
+    cube.build()
+    cube.raw_path = raw_path
+    return cube
+
+
+def answer(cube: KPICube, sql: str) -> tuple:
+    """(cube answer, the same query run over the raw rows)"""
+    analysis = analyze_sql(sql)
+    return cube.try_query(analysis), query_parquet(sql, [cube.raw_path])
+
+
+def test_cube_answers_match_the_raw_rows(built_cube):
+    df, expected = answer(
+        built_cube,
+        "SELECT DOC_BRANCH, COUNT(*) n, SUM(DOC_PREMIUM) premium FROM insmv.AIMS_ALL_DATA "
+        "WHERE DOC_REG_DT >= DATE '2023-01-01' AND DOC_REG_DT < DATE '2024-01-01' AND DOC_AGENT_NAME IS NULL "
+        "GROUP BY DOC_BRANCH ORDER BY DOC_BRANCH"
+    )
+    assert df.attrs["source"] == "kpi_cube"
+    assert df.values.tolist() == expected.values.tolist() == [["DOHA", 1, 100.0], ["WAKRA", 1, 300.0]]
+
+
+def test_translation_marks_non_additive_distinct_counts_as_sketched():
+    sql = "SELECT DOC_BRANCH, COUNT(DISTINCT CUST_ID_NO) customers FROM insmv.AIMS_ALL_DATA GROUP BY DOC_BRANCH"
+    additive = translate(sql, {"POLICY": True, "CUSTOMER": True})
+    assert "CAST(SUM(CUSTOMER_COUNT) AS BIGINT) customers" in additive.sql
+    assert not additive.sketched
+
+    sketched = translate(sql + " ORDER BY customers DESC, 1 FETCH FIRST 2 ROWS ONLY", {"POLICY": True, "CUSTOMER": False})
+    assert "{'sketch': 'CUSTOMER', 'cells': LIST(CELL_ID)} customers" in sketched.sql
+    # Ordering and the row limit need the merged counts, so they are not sent to DuckDB
+    assert "ORDER BY" not in sketched.sql and "FETCH" not in sketched.sql
+    assert sketched.sketched
+    assert (sketched.order_by, sketched.fetch) == ([("CUSTOMERS", True), (1, False)], 2)
+
+
+def test_having_over_sketched_counts_is_declined():
+    with pytest.raises(CubeIneligible):
+        translate("SELECT DOC_BRANCH, COUNT(DISTINCT CUST_ID_NO) customers FROM insmv.AIMS_ALL_DATA "
+                  "GROUP BY DOC_BRANCH HAVING COUNT(DISTINCT CUST_ID_NO) > 1", {"POLICY": True, "CUSTOMER": False})
+
+
+def test_build_detects_which_distinct_counts_are_additive(built_cube):
+    distinct = built_cube.metadata()["distinct"]
+    # Each policy falls in one cell; customer C1 is in several
+    assert distinct["POLICY"] == {"count": 8, "additive": True}
+    assert distinct["CUSTOMER"] == {"count": 5, "additive": False}
+
+
+def test_additive_distinct_count_is_summed(built_cube):
+    df, expected = answer(
+        built_cube,
+        "SELECT DOC_BRANCH, COUNT(DISTINCT DOC_KEY_FORM) policies FROM insmv.AIMS_ALL_DATA "
+        "GROUP BY DOC_BRANCH ORDER BY DOC_BRANCH"
+    )
+    assert "approximation" not in df.attrs
+    assert df.values.tolist() == expected.values.tolist() == [["DOHA", 4], ["KHOR", 1], ["WAKRA", 3]]
+    assert built_cube.get_stats()["sketched"] == 0
+
+
+def test_sketched_distinct_count_is_merged_before_order_by_and_fetch(built_cube):
+    # Summing per-cell counts would give DOHA 4 customers and put it first; merged, it has 2 and WAKRA 3
+    df, expected = answer(
+        built_cube,
+        "SELECT DOC_BRANCH, COUNT(DISTINCT CUST_ID_NO) customers FROM insmv.AIMS_ALL_DATA "
+        "GROUP BY DOC_BRANCH ORDER BY customers DESC FETCH FIRST 2 ROWS ONLY"
+    )
+    assert df.values.tolist() == expected.values.tolist() == [["WAKRA", 3], ["DOHA", 2]]
+    assert built_cube.get_stats()["sketched"] == 1
+
+
+def test_sketched_query_is_declined_when_estimates_are_not_allowed(built_cube):
+    analysis = analyze_sql("SELECT COUNT(DISTINCT CUST_ID_NO) customers FROM insmv.AIMS_ALL_DATA")
+    assert built_cube.try_query(analysis, allow_estimates=False) is None
+    assert built_cube.try_query(analysis)["CUSTOMERS"].tolist() == [5]
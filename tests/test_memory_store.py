@@ -0,0 +1,34 @@
+"""Conversation memory store appends and session loading"""
+
+from src.K2.aims_view.utils.memory_store import ConversationMemoryStore
+
+
+def make_store(tmp_path, **options) -> ConversationMemoryStore:
+    return ConversationMemoryStore(str(tmp_path / "memory.db"), **options)
+
+
+def test_first_turn_of_a_cold_session_is_stored_once(tmp_path):
+    store = make_store(tmp_path)
+    entry = store.append("s1", "Total premium for policy 12345?", "QAR 1,000")
+    assert [turn["id"] for turn in store.recent("s1")] == [entry["id"]]
+    assert len(store.history("s1")) == 1
+
+
+def test_turn_after_eviction_is_stored_once(tmp_path):
+    store = make_store(tmp_path, max_cached_sessions=1)
+    first = store.append("s1", "Premium for policy 12345?", "QAR 1,000")
+    store.append("s2", "Claims for policy 777?", "3 claims")
+    second = store.append("s1", "And policy 12345 claims?", "2 claims")
+    assert [turn["id"] for turn in store.recent("s1")] == [first["id"], second["id"]]
+
+
+def test_related_turns_are_indexed_once(tmp_path):
+    store = make_store(tmp_path)
+    entry = store.append("s1", "Motor premium in 2023?", "QAR 1,000")
+    assert [turn["id"] for turn in store.find_related("s1", "Motor claims in 2023", limit=5)] == [entry["id"]]
+
+
+def test_reloaded_session_reads_history_from_disk(tmp_path):
+    make_store(tmp_path).append("s1", "Premium for policy 12345?", "QAR 1,000")
+    store = make_store(tmp_path)
+    assert [turn["question"] for turn in store.recent("s1")] == ["Premium for policy 12345?"]
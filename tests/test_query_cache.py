@@ -0,0 +1,68 @@
+"""Query result cache: exact hits and narrower queries answered from a cached GROUP BY result"""
+
+import pandas as pd
+
+from src.K2.aims_view.database.query_cache import QueryResultCache, broader_query
+from src.K2.aims_view.database.sql_analyzer import analyze_sql
+
+BROADER_SQL = ("SELECT DOC_BRANCH branch, DOC_YEAR, SUM(DOC_PREMIUM) premium FROM insmv.AIMS_ALL_DATA "
+               "WHERE DOC_PREMIUM > 0 GROUP BY DOC_BRANCH, DOC_YEAR ORDER BY 1")
+BROADER_RESULT = pd.DataFrame({
+    "BRANCH": ["DOHA", "DOHA", "KHOR", "WAKRA"],
+    "DOC_YEAR": [2023, 2024, 2023, 2023],
+    "PREMIUM": [300.0, 60.0, 75.0, 325.0]
+})
+
+
+def cached(df: pd.DataFrame = BROADER_RESULT, sql: str = BROADER_SQL) -> QueryResultCache:
+    cache = QueryResultCache(enabled=True)
+    cache.put(QueryResultCache.key(analyze_sql(sql)), df)
+    return cache
+
+
+def narrower(where: str) -> str:
+    return BROADER_SQL.replace("WHERE DOC_PREMIUM > 0", f"WHERE {where}")
+
+
+def test_same_query_with_different_spacing_and_case_hits():
+    cache = cached()
+    df = cache.get(QueryResultCache.key(analyze_sql(BROADER_SQL.lower().replace(", ", " ,  "))))
+    assert df.equals(BROADER_RESULT)
+
+
+def test_narrower_query_is_answered_by_filtering_cached_groups():
+    cache = cached()
+    df = cache.get_filtered(analyze_sql(narrower("DOC_PREMIUM > 0 AND DOC_BRANCH = 'DOHA' AND DOC_YEAR IN (2023, 2025)")))
+    assert df.values.tolist() == [["DOHA", 2023, 300.0]]
+    assert cache.get_stats()["derived"] == 1
+
+
+def test_broader_query_drops_only_group_filters():
+    broader_sql, filters = broader_query(analyze_sql(narrower("DOC_BRANCH = 'DOHA' AND DOC_PREMIUM > 0")))
+    assert analyze_sql(broader_sql).fingerprint == analyze_sql(BROADER_SQL).fingerprint
+    assert filters == [("BRANCH", ["DOHA"])]
+
+
+def test_narrower_query_with_other_remaining_filters_misses():
+    # DOC_PREMIUM > 100 is not a filter on groups, so the cached query is not a superset of this one
+    cache = cached()
+    assert cache.get_filtered(analyze_sql(narrower("DOC_PREMIUM > 100 AND DOC_BRANCH = 'DOHA'"))) is None
+
+
+def test_queries_that_cannot_be_derived_are_not():
+    for sql in (
+        # A filter on an ungrouped column or an OR cannot be applied to the groups
+        narrower("DOC_PREMIUM > 0 AND DOC_AGENT_NAME = 'ACME'"),
+        narrower("DOC_PREMIUM > 0 AND (DOC_BRANCH = 'DOHA' OR DOC_YEAR = 2023)"),
+        narrower("DOC_PREMIUM > 0 OR DOC_BRANCH = 'DOHA'"),
+        # A row limit changes which groups come back
+        narrower("DOC_PREMIUM > 0 AND DOC_BRANCH = 'DOHA'") + " FETCH FIRST 1 ROWS ONLY",
+    ):
+        assert cached().get_filtered(analyze_sql(sql)) is None, sql
+
+
+def test_broader_result_cut_off_by_the_row_limit_is_not_filtered():
+    truncated = BROADER_RESULT.head(2)
+    truncated.attrs["row_limit"] = 2
+    cache = cached(truncated)
+    assert cache.get_filtered(analyze_sql(narrower("DOC_PREMIUM > 0 AND DOC_BRANCH = 'WAKRA'"))) is None
@@ -0,0 +1,73 @@
+"""Result handle paging and export sources"""
+
+import pandas as pd
+
+from src.K2.aims_view.utils.result_export import (
+    ResultHandleRegistry, _ordered_sql, iter_result_batches, page_result, result_source
+)
+
+
+class NoDatabase:
+    """db_utils stand-in that fails if a handle is re-read from Oracle"""
+
+    def iter_query(self, *args, **kwargs):
+        raise AssertionError("the handle should not be re-read from the database")
+
+
+def test_ordered_sql_orders_by_all_columns_without_order_by():
+    assert _ordered_sql("SELECT a, b FROM t", 2) == "SELECT * FROM (SELECT a, b FROM t) ORDER BY 1, 2"
+
+
+def test_ordered_sql_keeps_own_order_by_and_breaks_ties():
+    sql = "SELECT a, SUM(b) s FROM t GROUP BY a ORDER BY NVL(s, 0) DESC FETCH FIRST 10 ROWS ONLY"
+    assert _ordered_sql(sql, 2) == (
+        "SELECT a, SUM(b) s FROM t GROUP BY a ORDER BY NVL(s, 0) DESC, 1, 2 FETCH FIRST 10 ROWS ONLY"
+    )
+
+
+def test_ordered_sql_ignores_nested_order_by():
+    sql = "SELECT a, ROW_NUMBER() OVER (ORDER BY b) r FROM t"
+    assert _ordered_sql(sql, 2) == f"SELECT * FROM ({sql}) ORDER BY 1, 2"
+
+
+def test_result_source_from_frame_attrs():
+    df = pd.DataFrame({"A": [1]})
+    assert result_source(df) == "oracle"
+    df.attrs["source"] = "kpi_cube"
+    assert result_source(df) == "kpi_cube"
+    df.attrs["sampled"] = {"percent": 1.0}
+    assert result_source(df) == "sample"
+
+
+def test_snapshot_handles_are_served_without_the_database():
+    df = pd.DataFrame({"BRANCH": ["A", "B", "C"], "TOTAL": [1, 2, 3]})
+    handle = ResultHandleRegistry().register(
+        "SELECT BRANCH, SUM(X) TOTAL FROM t GROUP BY BRANCH", list(df.columns), len(df),
+        source="kpi_cube", snapshot=df
+    )
+    page = page_result(NoDatabase(), handle, offset=1, limit=1)
+    assert page["rows"] == [{"BRANCH": "B", "TOTAL": 2}]
+    assert page["source"] == "kpi_cube"
+    batches = list(iter_result_batches(NoDatabase(), handle, batch_size=2))
+    assert [rows for _, rows in batches] == [[("A", 1), ("B", 2)], [("C", 3)]]
+
+
+class RecordingDatabase:
+    """db_utils stand-in that records the SQL it is asked to stream"""
+
+    def __init__(self):
+        self.calls = []
+
+    def iter_query(self, sql, params=None, batch_size=5000):
+        self.calls.append((sql, params))
+        return iter(())
+
+
+def test_rereads_stay_within_the_step_row_limit():
+    handle = ResultHandleRegistry().register("SELECT A FROM t", ["A"], 100, row_limit=100)
+    db = RecordingDatabase()
+    page_result(db, handle, offset=90, limit=50)
+    assert db.calls[-1][1] == {"row_offset": 90, "row_end": 100}
+    list(iter_result_batches(db, handle))
+    sql, params = db.calls[-1]
+    assert "ROWNUM <= :row_limit" in sql and params == {"row_limit": 100}
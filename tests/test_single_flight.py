@@ -0,0 +1,121 @@
+"""Single-flight execution: shared results, waiter deadlines and retried errors"""
+
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from src.K2.aims_view.database.errors import QueryCancelledError, QueryTimeoutError
+from src.K2.aims_view.database.single_flight import SingleFlight
+
+KEY = ("fingerprint", (), "exact")
+RETRY_ERRORS = (QueryCancelledError, QueryTimeoutError)
+
+
+def start_leader(flight: SingleFlight, execute) -> tuple:
+    """Run execute() as the leader on a thread; returns (thread, outcome dict)"""
+    outcome = {}
+
+    def lead():
+        try:
+            outcome["result"] = flight.run(KEY, execute, retry_errors=RETRY_ERRORS)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=lead)
+    thread.start()
+    while flight.get_stats()["in_flight"] == 0:
+        time.sleep(0.01)
+    return thread, outcome
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def execute():
+        release.wait(5)
+        return pd.DataFrame({"total": [1]})
+
+    thread, outcome = start_leader(flight, execute)
+    threading.Timer(0.1, release.set).start()
+    df = flight.run(KEY, lambda: pytest.fail("the waiter should not run the query"), retry_errors=RETRY_ERRORS)
+    thread.join()
+
+    assert df["total"].tolist() == [1]
+    assert outcome["result"]["total"].tolist() == [1]
+    assert flight.get_stats()["executions"] == 1
+    assert flight.get_stats()["shared"] == 1
+
+
+def test_waiter_times_out_on_its_own_deadline():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def execute():
+        release.wait(5)
+        return pd.DataFrame({"total": [1]})
+
+    thread, outcome = start_leader(flight, execute)
+    started = time.time()
+    try:
+        with pytest.raises(QueryTimeoutError):
+            flight.run(KEY, execute, retry_errors=RETRY_ERRORS, deadline=time.time() + 0.05)
+        assert time.time() - started < 1
+    finally:
+        release.set()
+        thread.join()
+    assert "result" in outcome
+
+
+def test_cancelled_waiter_stops_waiting():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def check_cancelled():
+        raise QueryCancelledError("cancelled")
+
+    thread, _ = start_leader(flight, lambda: release.wait(5) and pd.DataFrame())
+    try:
+        with pytest.raises(QueryCancelledError):
+            flight.run(KEY, pd.DataFrame, check_cancelled=check_cancelled, retry_errors=RETRY_ERRORS)
+    finally:
+        release.set()
+        thread.join()
+
+
+@pytest.mark.parametrize("error", [QueryTimeoutError("leader timed out"), QueryCancelledError("leader cancelled")])
+def test_leader_timeout_or_cancellation_is_not_shared(error):
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise error
+
+    thread, outcome = start_leader(flight, fail)
+    threading.Timer(0.1, release.set).start()
+    df = flight.run(KEY, lambda: pd.DataFrame({"total": [2]}), retry_errors=RETRY_ERRORS)
+    thread.join()
+
+    assert outcome["error"] is error
+    assert df["total"].tolist() == [2]
+    assert flight.get_stats()["executions"] == 2
+
+
+def test_other_leader_errors_are_shared():
+    flight = SingleFlight()
+    release = threading.Event()
+    error = ValueError("ORA-00942: table or view does not exist")
+
+    def fail():
+        release.wait(5)
+        raise error
+
+    thread, _ = start_leader(flight, fail)
+    threading.Timer(0.1, release.set).start()
+    with pytest.raises(ValueError):
+        flight.run(KEY, lambda: pytest.fail("the waiter should not run the query"), retry_errors=RETRY_ERRORS)
+    thread.join()
+    assert flight.get_stats()["executions"] == 1
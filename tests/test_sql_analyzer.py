@@ -0,0 +1,102 @@
+"""Tokenizer and structural checks of the SQL analyzer"""
+
+import pytest
+
+from src.K2.aims_view.database.sql_analyzer import SQLAnalysisError, analyze_sql, tokenize
+
+
+def test_allowed_table_is_recorded():
+    analysis = analyze_sql("SELECT DOC_BRANCH FROM insmv.AIMS_ALL_DATA d WHERE DOC_PREMIUM > 10")
+    assert analysis.tables == {"INSMV.AIMS_ALL_DATA"}
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM all_users",
+    "SELECT * FROM insmv.AIMS_ALL_DATA d JOIN sys.user$ u ON 1 = 1",
+    "SELECT * FROM insmv.AIMS_ALL_DATA d, all_users u",
+])
+def test_other_tables_are_rejected(sql):
+    with pytest.raises(SQLAnalysisError, match="not allowed"):
+        analyze_sql(sql)
+
+
+def test_parenthesized_join_cannot_hide_a_table():
+    with pytest.raises(SQLAnalysisError, match="ALL_USERS"):
+        analyze_sql("SELECT * FROM (all_users u JOIN insmv.AIMS_ALL_DATA d ON 1=1)")
+
+
+def test_parenthesized_table_cannot_hide_a_table():
+    with pytest.raises(SQLAnalysisError, match="ALL_USERS"):
+        analyze_sql("SELECT * FROM (all_users)")
+    with pytest.raises(SQLAnalysisError, match="ALL_USERS"):
+        analyze_sql("SELECT * FROM ((all_users))")
+
+
+def test_parenthesized_allowed_tables_are_recorded():
+    analysis = analyze_sql(
+        "SELECT * FROM (insmv.AIMS_ALL_DATA a JOIN insmv.AIMS_ALL_DATA b ON a.DOC_SERIAL = b.DOC_SERIAL), insmv.AIMS_ALL_DATA c"
+    )
+    assert analysis.tables == {"INSMV.AIMS_ALL_DATA"}
+
+
+def test_subqueries_are_still_analyzed():
+    analysis = analyze_sql("SELECT * FROM ((SELECT DOC_BRANCH FROM insmv.AIMS_ALL_DATA)) t")
+    assert analysis.tables == {"INSMV.AIMS_ALL_DATA"}
+    with pytest.raises(SQLAnalysisError, match="not allowed"):
+        analyze_sql("SELECT * FROM (SELECT * FROM all_users)")
+
+
+def test_alias_containing_forbidden_keyword_is_allowed():
+    analysis = analyze_sql("SELECT DOC_ISSUE_DATE AS created_on, COUNT(*) create_count FROM insmv.AIMS_ALL_DATA GROUP BY DOC_ISSUE_DATE")
+    assert "CREATED_ON" in analysis.normalized
+
+
+def test_forbidden_keyword_inside_string_is_allowed():
+    analysis = analyze_sql("SELECT * FROM insmv.AIMS_ALL_DATA WHERE DOC_CUST_NAME = 'DROP TABLE; CREATE'")
+    assert analysis.literals == ["'DROP TABLE; CREATE'"]
+
+
+def test_forbidden_keyword_as_word_is_rejected():
+    with pytest.raises(SQLAnalysisError, match="prohibited keyword DROP"):
+        analyze_sql("SELECT * FROM insmv.AIMS_ALL_DATA WHERE 1 = 1 DROP")
+
+
+def test_second_statement_after_semicolon_is_rejected():
+    with pytest.raises(SQLAnalysisError, match="single statement"):
+        analyze_sql("SELECT * FROM insmv.AIMS_ALL_DATA; SELECT * FROM insmv.AIMS_ALL_DATA")
+
+
+def test_trailing_semicolon_is_tolerated():
+    assert analyze_sql("SELECT * FROM insmv.AIMS_ALL_DATA;").sql == "SELECT * FROM insmv.AIMS_ALL_DATA"
+
+
+def test_tokenizer_keeps_quoted_text_whole():
+    kinds = [(token.kind, token.value) for token in tokenize("SELECT 'it''s' \"Create\" -- DROP\nFROM dual")]
+    assert kinds == [("WORD", "SELECT"), ("STRING", "'it''s'"), ("QUOTED", '"Create"'), ("WORD", "FROM"), ("WORD", "dual")]
+
+
+def test_apply_cannot_hide_a_table():
+    with pytest.raises(SQLAnalysisError, match="ALL_USERS"):
+        analyze_sql("SELECT * FROM insmv.AIMS_ALL_DATA a OUTER APPLY all_users")
+    with pytest.raises(SQLAnalysisError, match="ALL_USERS"):
+        analyze_sql("SELECT * FROM insmv.AIMS_ALL_DATA a CROSS APPLY (SELECT * FROM all_users)")
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT dbms_xmlgen.getxml(q'[select * from sys.user$]') x FROM dual",
+    "SELECT sys.dbms_xmlgen.getxml('select 1 from dual') x FROM dual",
+    "SELECT \"SYS\".\"F\"(1) FROM dual",
+    "SELECT dbms_random_value(1) FROM dual",
+    "SELECT httpuritype('http://example.com').getclob() FROM dual",
+])
+def test_qualified_and_package_calls_are_rejected(sql):
+    with pytest.raises(SQLAnalysisError, match="not allowed"):
+        analyze_sql(sql)
+
+
+def test_built_in_functions_and_qualified_columns_are_allowed():
+    analysis = analyze_sql(
+        "SELECT d.DOC_BRANCH, NVL(SUM(d.DOC_PREMIUM), 0), TO_CHAR(d.DOC_REG_DT, 'YYYY') "
+        "FROM insmv.AIMS_ALL_DATA d GROUP BY d.DOC_BRANCH, TO_CHAR(d.DOC_REG_DT, 'YYYY')"
+    )
+    assert analysis.tables == {"INSMV.AIMS_ALL_DATA"}
@@ -0,0 +1,66 @@
+"""Sargable predicate rewrites"""
+
+from src.K2.aims_view.database.sql_analyzer import analyze_sql
+from src.K2.aims_view.database.sql_rewriter import SQLRewriter
+
+
+def rewrite(sql: str) -> str:
+    return SQLRewriter().rewrite(analyze_sql(sql)).sql
+
+
+def test_where_year_filter_becomes_a_range():
+    assert rewrite("SELECT COUNT(*) FROM insmv.AIMS_ALL_DATA WHERE EXTRACT(YEAR FROM DOC_REG_DT) = 2023") == (
+        "SELECT COUNT(*) FROM insmv.AIMS_ALL_DATA "
+        "WHERE (DOC_REG_DT >= DATE '2023-01-01' AND DOC_REG_DT < DATE '2024-01-01')"
+    )
+
+
+def test_nested_where_conditions_are_rewritten():
+    sql = rewrite(
+        "SELECT * FROM insmv.AIMS_ALL_DATA WHERE DOC_PREMIUM > 0 AND (TRUNC(DOC_REG_DT) = DATE '2024-05-01' OR 1 = 0)"
+    )
+    assert "DOC_REG_DT >= DATE '2024-05-01' AND DOC_REG_DT < DATE '2024-05-02'" in sql
+
+
+def test_having_on_grouped_expression_is_left_alone():
+    sql = ("SELECT EXTRACT(YEAR FROM DOC_REG_DT), COUNT(*) FROM insmv.AIMS_ALL_DATA "
+           "GROUP BY EXTRACT(YEAR FROM DOC_REG_DT) HAVING EXTRACT(YEAR FROM DOC_REG_DT) = 2023")
+    assert rewrite(sql) == sql
+    sql = ("SELECT EXTRACT(YEAR FROM DOC_REG_DT), COUNT(*) FROM insmv.AIMS_ALL_DATA "
+           "GROUP BY EXTRACT(YEAR FROM DOC_REG_DT) HAVING COUNT(*) > 1 AND EXTRACT(YEAR FROM DOC_REG_DT) >= 2020")
+    assert rewrite(sql) == sql
+
+
+def test_select_list_case_is_left_alone():
+    sql = ("SELECT CASE WHEN EXTRACT(YEAR FROM DOC_REG_DT) = 2023 THEN 'current' END, COUNT(*) "
+           "FROM insmv.AIMS_ALL_DATA GROUP BY CASE WHEN EXTRACT(YEAR FROM DOC_REG_DT) = 2023 THEN 'current' END")
+    assert rewrite(sql) == sql
+
+
+def test_subquery_where_inside_having_is_rewritten():
+    sql = rewrite(
+        "SELECT DOC_BRANCH FROM insmv.AIMS_ALL_DATA GROUP BY DOC_BRANCH HAVING COUNT(*) > "
+        "(SELECT COUNT(*) FROM insmv.AIMS_ALL_DATA WHERE EXTRACT(YEAR FROM DOC_REG_DT) = 2023)"
+    )
+    assert "HAVING COUNT(*) > (SELECT COUNT(*) FROM insmv.AIMS_ALL_DATA WHERE (DOC_REG_DT >= DATE '2023-01-01'" in sql
+
+
+def rewrite_upper(sql: str) -> str:
+    return SQLRewriter(upper_indexed_columns=["DOC_CUST_NAME"]).rewrite(analyze_sql(sql)).sql
+
+
+def test_lower_predicate_with_lowercase_literal_uses_the_upper_index():
+    assert rewrite_upper("SELECT * FROM insmv.AIMS_ALL_DATA WHERE LOWER(DOC_CUST_NAME) LIKE '%ali%'") == (
+        "SELECT * FROM insmv.AIMS_ALL_DATA WHERE UPPER(DOC_CUST_NAME) LIKE '%ALI%'"
+    )
+    assert rewrite_upper("SELECT * FROM insmv.AIMS_ALL_DATA WHERE UPPER(DOC_CUST_NAME) = UPPER('Ali')") == (
+        "SELECT * FROM insmv.AIMS_ALL_DATA WHERE UPPER(DOC_CUST_NAME) = 'ALI'"
+    )
+
+
+def test_case_predicate_that_cannot_match_is_left_alone():
+    # LOWER(col) never equals a literal with capitals, so UPPER(col) = 'ALI' would change the result
+    for sql in ("SELECT * FROM insmv.AIMS_ALL_DATA WHERE LOWER(DOC_CUST_NAME) = 'Ali'",
+                "SELECT * FROM insmv.AIMS_ALL_DATA WHERE LOWER(DOC_CUST_NAME) LIKE UPPER('ali%')",
+                "SELECT * FROM insmv.AIMS_ALL_DATA WHERE UPPER(DOC_CUST_NAME) = LOWER('ALI')"):
+        assert rewrite_upper(sql) == sql